@@ -1,19 +1,90 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 
+from app.storage import configure_storage, install_pragmas
+
 # Create the SQLAlchemy database instance
 db = SQLAlchemy()
 
 
-def create_app():
-    """Factory function that creates and configures the Flask app."""
+def create_app(test_config=None):
+    """
+    Factory function that creates and configures the Flask app.
+
+    Args:
+        test_config: Optional dict of config values applied before the
+            extensions are initialised (e.g. a different database URI)
+    """
     app = Flask(__name__)
 
     # Database configuration
     app.config.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite:///minimarbles.db')
+    if test_config is not None:
+        app.config.update(test_config)
+
+    # SQLite pragmas and pool settings (see app/storage.py)
+    configure_storage(app)
 
     # Initialize extensions
     db.init_app(app)
+    with app.app_context():
+        install_pragmas(app, db.engine)
+
+    # JSON encoding for every response (orjson when installed)
+    from app.jsonprovider import init_json
+    init_json(app)
+
+    # Optional batched commits for inserts (off unless GROUP_COMMIT is set)
+    from app.group_commit import init_group_commit
+    init_group_commit(app)
+
+    # Cached leaderboard served by GET /users
+    from app.leaderboard import init_leaderboard
+    init_leaderboard(app)
+
+    # Unrealized P&L of open underlying trades at the latest marks
+    from app.marks import init_marks
+    init_marks(app)
+
+    # Price-shock scenario grids over the same open trades
+    from app.risk import init_risk
+    init_risk(app)
+
+    # Monte Carlo of final balances over open binary trades
+    from app.montecarlo import init_montecarlo
+    init_montecarlo(app)
+
+    # Resting bids and offers, matched into trades
+    from app.orderbook import init_orderbook
+    init_orderbook(app)
+
+    # Live feed of committed changes, served at GET /stream
+    from app.stream import init_stream
+    init_stream(app)
+
+    # Idempotency-Key replays for POST endpoints
+    from app.idempotency import init_idempotency
+    init_idempotency(app)
+
+    # Negotiated gzip / brotli for large JSON bodies, exports and streams
+    from app.compression import init_compression
+    init_compression(app)
+
+    # Request timing and SQL counters, served at GET /metrics
+    from app.metrics import init_metrics
+    init_metrics(app)
+
+    # cProfile on demand (X-Profile header) or by sampling
+    from app.profiling import init_profiling
+    init_profiling(app)
+
+    # `flask migrate-trades` for databases from before the single trade table
+    from app.migrations import migrate_trades_command
+    app.cli.add_command(migrate_trades_command)
+
+    # `flask reconcile-reserved` checks reserved stakes against open trades
+    from app.reconcile import reconcile_reserved_command
+    app.cli.add_command(reconcile_reserved_command)
 
     # Import and register routes
     from app import routes
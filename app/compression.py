@@ -0,0 +1,177 @@
+"""Negotiated gzip / brotli compression of JSON, export and stream responses.
+
+An after-request hook compresses 200 responses whose mimetype is in
+COMPRESS_MIMETYPES with the best encoding the client accepts: brotli
+('br') when the brotli package is installed, otherwise gzip.
+
+Bodies built in full are only compressed from COMPRESS_MIN_SIZE bytes
+up; below that the headers would eat most of the saving. If such a
+response has an ETag, its compressed body is kept in a byte-bounded LRU
+cache under (path, ETag, encoding), so an unchanged list is compressed
+once however often it is downloaded. Its ETag is then sent weak, since
+the bytes differ from the identity body; routes compare If-None-Match
+weakly, so revalidation still gets a 304.
+
+Streamed responses (exports and GET /stream) are compressed chunk by
+chunk with a sync flush after each, so every chunk reaches the client
+as soon as it is produced, and the compression context carries over
+from one chunk to the next.
+"""
+
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is offered instead
+    brotli = None
+
+
+class CompressionCache:
+    """Thread-safe LRU of compressed bodies, bounded by their total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._lock = threading.Lock()
+        self._bodies = OrderedDict()
+
+    def __len__(self):
+        return len(self._bodies)
+
+    def get(self, key):
+        """Return the body stored under key, or None."""
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        """Store body, evicting the least recently used ones to make room."""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._bodies.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._bodies[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._bodies.popitem(last=False)
+                self.size -= len(evicted)
+
+
+def compress(data, encoding, level):
+    """
+    Compress a whole body.
+
+    Args:
+        data: The bytes to compress
+        encoding: 'gzip' or 'br'
+        level: gzip level (1-9) or brotli quality (0-11)
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_chunks(chunks, encoding, level):
+    """
+    Compress a stream chunk by chunk, flushing after each one.
+
+    Args:
+        chunks: Iterable of bytes
+        encoding: 'gzip' or 'br'
+        level: gzip level (1-9) or brotli quality (0-11)
+
+    Yields:
+        The compressed bytes of each chunk, then the end of the stream
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+def init_compression(app):
+    """
+    Install the response compression hook on app.
+
+    Config keys:
+        COMPRESS_ENABLED: Compress responses at all (default True)
+        COMPRESS_MIMETYPES: Mimetypes to compress (JSON, NDJSON, CSV and
+            event streams)
+        COMPRESS_MIN_SIZE: Smallest non-streamed body to compress, in
+            bytes (1024)
+        COMPRESS_GZIP_LEVEL: zlib level, 1-9 (6)
+        COMPRESS_BROTLI_QUALITY: brotli quality, 0-11 (5)
+        COMPRESS_CACHE_BYTES: Total size of compressed bodies kept for
+            responses with an ETag (32 MiB; 0 disables the cache)
+    """
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_MIMETYPES', [
+        'application/json', 'application/x-ndjson', 'text/csv', 'text/event-stream',
+    ])
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BROTLI_QUALITY', 5)
+    app.config.setdefault('COMPRESS_CACHE_BYTES', 32 * 1024 * 1024)
+    if not app.config['COMPRESS_ENABLED']:
+        return
+
+    cache = CompressionCache(app.config['COMPRESS_CACHE_BYTES'])
+    app.extensions['compression'] = cache
+    mimetypes = frozenset(app.config['COMPRESS_MIMETYPES'])
+    min_size = app.config['COMPRESS_MIN_SIZE']
+    levels = {'gzip': app.config['COMPRESS_GZIP_LEVEL'],
+              'br': app.config['COMPRESS_BROTLI_QUALITY']}
+    # Preferred first; best_match keeps that order among equal qualities
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.mimetype not in mimetypes
+                or response.direct_passthrough or 'Content-Encoding' in response.headers):
+            return response
+        # The body depends on Accept-Encoding whether or not this one is compressed
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(offered)
+        if encoding is None:
+            return response
+        level = levels[encoding]
+
+        if response.is_streamed:
+            stream = response.response
+            response.response = compress_chunks(response.iter_encoded(), encoding, level)
+            # Closing the response must still close the original generator
+            # (e.g. to unsubscribe a stream)
+            if hasattr(stream, 'close'):
+                response.call_on_close(stream.close)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            etag, weak = response.get_etag()
+            key = (request.path, etag, encoding) if etag and not weak else None
+            body = cache.get(key) if key is not None else None
+            if body is None:
+                body = compress(data, encoding, level)
+                if key is not None:
+                    cache.put(key, body)
+            response.set_data(body)
+            if etag:
+                response.set_etag(etag, weak=True)
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,85 @@
+"""Streaming encoders for exporting large tables as NDJSON or CSV."""
+
+import csv
+import io
+
+from flask import current_app
+
+# Column order for CSV exports. Trade rows of either type share one header;
+# columns that don't apply to a row's type are left empty.
+USER_FIELDS = ['id', 'name', 'balance']
+TRADE_FIELDS = [
+    'id', 'type', 'status', 'description',
+    'party_a', 'party_b', 'stake_a', 'stake_b', 'outcome',
+    'long_party', 'short_party', 'lot_size', 'trade_price', 'settlement_price',
+    'underlying', 'created_at', 'settled_at',
+]
+
+# Content types for each supported export format
+MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Rows encoded into each chunk handed to the WSGI server
+CHUNK_ROWS = 500
+
+
+def ndjson_chunks(rows):
+    """
+    Encode rows as newline-delimited JSON, one object per line.
+
+    Args:
+        rows: Iterable of dicts
+
+    Yields:
+        Strings holding up to CHUNK_ROWS lines each
+    """
+    dumps = current_app.json.dumps
+    lines = []
+    for row in rows:
+        lines.append(dumps(row))
+        if len(lines) >= CHUNK_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def csv_chunks(rows, fields):
+    """
+    Encode rows as CSV with a header line.
+
+    The header is yielded on its own first, so clients get a response
+    before the first batch of rows has been fetched.
+
+    Args:
+        rows: Iterable of dicts
+        fields: Column names, in order
+
+    Yields:
+        Strings holding the header, then up to CHUNK_ROWS rows each
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+
+    writer.writeheader()
+    yield _drain(buffer)
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= CHUNK_ROWS:
+            yield _drain(buffer)
+            pending = 0
+    if pending:
+        yield _drain(buffer)
+
+
+def _drain(buffer):
+    """Return everything written to buffer so far and empty it."""
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return text
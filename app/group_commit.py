@@ -0,0 +1,169 @@
+"""Optional group commit: many callers' inserts share one transaction.
+
+With GROUP_COMMIT enabled, create_user and the create_*_trade operations
+hand their insert to a single writer thread instead of committing it
+themselves. The writer collects whatever is queued, up to
+GROUP_COMMIT_MAX_BATCH items or GROUP_COMMIT_MAX_DELAY seconds after the
+first one, commits them together, and then wakes every caller. A caller
+is only released once its row is committed, so durability is unchanged;
+the saving is one commit (and one fsync) per batch instead of per row.
+
+The batch opens its transaction with an explicit BEGIN IMMEDIATE, and
+each insert runs inside its own SAVEPOINT within it, so one bad row
+fails only its own caller and the rest of the batch still commits.
+
+Group commit needs a file database: an in-memory database is a single
+connection shared by every thread.
+"""
+
+import queue
+import threading
+import time
+
+from flask import current_app
+
+from app import db
+
+_STOP = object()
+
+
+class _Pending:
+    """One queued insert and, once committed, its result or error."""
+
+    def __init__(self, fn, on_commit):
+        self.fn = fn
+        self.on_commit = on_commit
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class GroupCommitter:
+    """A writer thread that commits queued inserts in batches."""
+
+    def __init__(self, app, max_batch, max_delay):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, fn, on_commit=None):
+        """
+        Run fn in the writer thread and block until it has been committed.
+
+        Args:
+            fn: Callable that stages rows in db.session (no commit) and
+                returns a plain value, e.g. the new row's id
+            on_commit: Optional callable run in the writer thread with fn's
+                result once the batch has committed
+
+        Returns:
+            Whatever fn returned
+
+        Raises:
+            Whatever fn raised, or the error that made the commit fail
+        """
+        self._ensure_started()
+        pending = _Pending(fn, on_commit)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def stop(self):
+        """Commit anything still queued and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='group-commit', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        with self.app.app_context():
+            stopping = False
+            while not stopping:
+                first = self._queue.get()
+                if first is _STOP:
+                    break
+
+                batch = [first]
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_batch:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+                self._commit(batch)
+            db.session.remove()
+
+    def _commit(self, batch):
+        try:
+            # pysqlite only opens a transaction before INSERT/UPDATE/DELETE,
+            # not before SAVEPOINT, so without this the first savepoint would
+            # start one and its RELEASE would commit each row on its own.
+            # IMMEDIATE takes the write lock up front, as the batch is all
+            # writes.
+            db.session.connection().exec_driver_sql('BEGIN IMMEDIATE')
+            for pending in batch:
+                try:
+                    with db.session.begin_nested():
+                        pending.result = pending.fn()
+                except Exception as e:
+                    pending.error = e
+            db.session.commit()
+        except Exception as e:
+            # e.g. "database is locked" from BEGIN; fail the whole batch
+            # but keep the writer running for the next one
+            db.session.rollback()
+            for pending in batch:
+                if pending.error is None:
+                    pending.error = e
+
+        for pending in batch:
+            if pending.error is None and pending.on_commit is not None:
+                try:
+                    pending.on_commit(pending.result)
+                except Exception:
+                    current_app.logger.exception("group commit on_commit hook failed")
+            pending.done.set()
+
+
+def init_group_commit(app):
+    """
+    Attach a GroupCommitter to app if GROUP_COMMIT is enabled.
+
+    Config keys:
+        GROUP_COMMIT: Enable group commit (default False)
+        GROUP_COMMIT_MAX_BATCH: Most inserts per commit (default 100)
+        GROUP_COMMIT_MAX_DELAY: Seconds to wait for more inserts after the
+            first one arrives (default 0.005)
+    """
+    app.config.setdefault('GROUP_COMMIT', False)
+    app.config.setdefault('GROUP_COMMIT_MAX_BATCH', 100)
+    app.config.setdefault('GROUP_COMMIT_MAX_DELAY', 0.005)
+
+    if app.config['GROUP_COMMIT']:
+        app.extensions['group_commit'] = GroupCommitter(
+            app,
+            max_batch=app.config['GROUP_COMMIT_MAX_BATCH'],
+            max_delay=app.config['GROUP_COMMIT_MAX_DELAY'],
+        )
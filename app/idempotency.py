@@ -0,0 +1,282 @@
+"""Idempotency-Key support for POST endpoints.
+
+A client that may retry a POST sends an Idempotency-Key header (any
+string of up to 255 characters, e.g. a UUID). The first request with a
+key runs the view and stores its response in the idempotency_key table.
+A retry with the same key and the same request gets that response back,
+marked `Idempotent-Replayed: true`, without running the view again.
+Reusing a key for a different request is refused with a 422.
+
+A key is claimed with a row before the view runs. Duplicates that
+arrive while it is still running are coalesced onto it: in the same
+process they wait for it to finish, and in another process they poll
+the row, then replay its response. They wait at most IDEMPOTENCY_WAIT
+seconds before getting a 409. A claim whose request never finished (its
+worker died) is taken over after IDEMPOTENCY_CLAIM_TIMEOUT seconds.
+
+Responses with a 5xx status are not stored, and neither is anything
+when the view raises. The claim is released so a retry runs the
+request again. 4xx responses are stored like any other, since the same
+request would be refused the same way.
+
+Keys live for IDEMPOTENCY_TTL seconds. At most IDEMPOTENCY_MAX_KEYS
+finished keys are kept, oldest dropped first. Expired and excess keys
+are purged at most once per IDEMPOTENCY_PURGE_INTERVAL seconds.
+"""
+
+import functools
+import hashlib
+import threading
+import time
+from datetime import timedelta
+
+from flask import current_app, jsonify, make_response, request
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import IdempotencyKey, utcnow
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# Seconds between looks at a key that another process has in flight
+POLL_INTERVAL = 0.05
+
+
+class IdempotencyStore:
+    """Runs each keyed request once and replays its stored response."""
+
+    def __init__(self, ttl, max_keys, wait, claim_timeout, purge_interval):
+        self.ttl = timedelta(seconds=ttl)
+        self.max_keys = max_keys
+        self.wait = wait
+        self.claim_timeout = timedelta(seconds=claim_timeout)
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._in_flight = {}  # key -> Event set when its request finishes
+        self._purged_at = None
+
+    def run(self, key, fingerprint, execute):
+        """
+        Return the response for a keyed request, running it at most once.
+
+        Args:
+            key: The request's Idempotency-Key
+            fingerprint: Digest of the request (see request_fingerprint)
+            execute: Callable that runs the view and returns its Response
+
+        Returns:
+            The view's response, the stored one for a replay, or an error
+            response if the key is misused or stays busy too long
+        """
+        deadline = time.monotonic() + self.wait
+        while True:
+            with self._lock:
+                done = self._in_flight.get(key)
+                leading = done is None
+                if leading:
+                    done = self._in_flight[key] = threading.Event()
+            if leading:
+                break
+            # The key is in flight in this process; wait for it, then look
+            # again (its response is stored, or its claim was released)
+            if not done.wait(max(0.0, deadline - time.monotonic())):
+                return _in_progress()
+
+        try:
+            return self._run_claimed(key, fingerprint, execute, deadline)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            done.set()
+
+    def _run_claimed(self, key, fingerprint, execute, deadline):
+        while True:
+            state, row = self._claim(key, fingerprint)
+            if state == 'claimed':
+                break
+            if state == 'done':
+                return _replay(row)
+            if state == 'mismatch':
+                return jsonify({'error': f"{HEADER} was already used for a different request"}), 422
+            # In flight in another process
+            if time.monotonic() >= deadline:
+                return _in_progress()
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            response = execute()
+        except BaseException:
+            db.session.rollback()
+            self._release(key)
+            raise
+        if response.status_code >= 500:
+            self._release(key)
+        else:
+            self._store(key, response)
+        return response
+
+    def _claim(self, key, fingerprint):
+        """
+        Claim key for this request, or say why it can't be.
+
+        Returns:
+            Tuple of (state, row): 'claimed', 'done' (row holds the stored
+            response), 'mismatch' (the key belongs to another request) or
+            'busy' (in flight elsewhere)
+        """
+        table = IdempotencyKey.__table__
+        now = utcnow()
+        row = db.session.execute(select(table).where(table.c.key == key)).first()
+        if row is not None and row.created_at < now - self.ttl:
+            db.session.execute(
+                delete(table).where(table.c.key == key, table.c.created_at == row.created_at))
+            row = None
+
+        if row is None:
+            try:
+                db.session.execute(
+                    insert(table).values(key=key, fingerprint=fingerprint, created_at=now))
+                db.session.commit()
+            except IntegrityError:
+                # Another process claimed it since we looked
+                db.session.rollback()
+                return 'busy', None
+            return 'claimed', None
+
+        if row.fingerprint != fingerprint:
+            return 'mismatch', row
+        if row.status is not None:
+            return 'done', row
+        if row.created_at >= now - self.claim_timeout:
+            return 'busy', row
+        # The claim's request never finished; take it over unless someone
+        # else just did
+        taken = db.session.execute(
+            update(table)
+            .where(table.c.key == key, table.c.status.is_(None),
+                   table.c.created_at == row.created_at)
+            .values(created_at=now)
+        ).rowcount
+        db.session.commit()
+        return ('claimed' if taken else 'busy'), row
+
+    def _store(self, key, response):
+        table = IdempotencyKey.__table__
+        db.session.execute(
+            update(table)
+            .where(table.c.key == key)
+            .values(status=response.status_code, mimetype=response.mimetype,
+                    body=response.get_data())
+        )
+        db.session.commit()
+        self._maybe_purge()
+
+    def _release(self, key):
+        table = IdempotencyKey.__table__
+        db.session.execute(delete(table).where(table.c.key == key, table.c.status.is_(None)))
+        db.session.commit()
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._purged_at is not None and now - self._purged_at < self.purge_interval:
+                return
+            self._purged_at = now
+        purge_idempotency_keys(self.ttl, self.max_keys)
+
+
+def purge_idempotency_keys(ttl, max_keys):
+    """
+    Delete expired keys, then the oldest finished ones beyond max_keys.
+
+    Args:
+        ttl: timedelta after which a key expires
+        max_keys: Most finished keys to keep
+
+    Returns:
+        The number of keys deleted
+    """
+    table = IdempotencyKey.__table__
+    deleted = db.session.execute(
+        delete(table).where(table.c.created_at < utcnow() - ttl)
+    ).rowcount
+    excess = (
+        select(table.c.key)
+        .where(table.c.status.is_not(None))
+        .order_by(table.c.created_at.desc())
+        .offset(max_keys)
+    )
+    deleted += db.session.execute(delete(table).where(table.c.key.in_(excess))).rowcount
+    db.session.commit()
+    return deleted
+
+
+def request_fingerprint():
+    """SHA-256 hex digest of the current request's method, path, query and body."""
+    digest = hashlib.sha256()
+    for part in (request.method, request.full_path):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _replay(row):
+    response = current_app.response_class(row.body, status=row.status, mimetype=row.mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _in_progress():
+    response = jsonify({'error': f"a request with this {HEADER} is still in progress"})
+    response.status_code = 409
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+def idempotent(view):
+    """
+    Make a view honour the Idempotency-Key header.
+
+    Requests without the header run the view as usual.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        store = current_app.extensions.get('idempotency')
+        if key is None or store is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"}), 400
+        return store.run(key, request_fingerprint(),
+                         lambda: make_response(view(*args, **kwargs)))
+    return wrapper
+
+
+def init_idempotency(app):
+    """
+    Attach an IdempotencyStore to app.
+
+    Config keys:
+        IDEMPOTENCY_TTL: Seconds a key and its response are kept (86400)
+        IDEMPOTENCY_MAX_KEYS: Most finished keys kept (100000)
+        IDEMPOTENCY_WAIT: Seconds a duplicate waits for the request
+            already in flight before getting a 409 (10.0)
+        IDEMPOTENCY_CLAIM_TIMEOUT: Seconds after which an unfinished
+            claim is presumed dead and taken over (60.0)
+        IDEMPOTENCY_PURGE_INTERVAL: Minimum seconds between purges (60.0)
+    """
+    app.config.setdefault('IDEMPOTENCY_TTL', 86400)
+    app.config.setdefault('IDEMPOTENCY_MAX_KEYS', 100_000)
+    app.config.setdefault('IDEMPOTENCY_WAIT', 10.0)
+    app.config.setdefault('IDEMPOTENCY_CLAIM_TIMEOUT', 60.0)
+    app.config.setdefault('IDEMPOTENCY_PURGE_INTERVAL', 60.0)
+    app.extensions['idempotency'] = IdempotencyStore(
+        ttl=app.config['IDEMPOTENCY_TTL'],
+        max_keys=app.config['IDEMPOTENCY_MAX_KEYS'],
+        wait=app.config['IDEMPOTENCY_WAIT'],
+        claim_timeout=app.config['IDEMPOTENCY_CLAIM_TIMEOUT'],
+        purge_interval=app.config['IDEMPOTENCY_PURGE_INTERVAL'],
+    )
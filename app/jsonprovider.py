@@ -0,0 +1,81 @@
+"""Fast JSON encoding for responses through Flask's JSON provider hook.
+
+Every JSON body the app produces goes through app.json: jsonify, the
+cached leaderboard, NDJSON exports and stream events. JSON_PROVIDER picks
+the encoder behind it:
+
+    'auto'    orjson if it is installed, the stdlib otherwise (default)
+    'orjson'  orjson, failing at startup if it is missing
+    'stdlib'  the stdlib json module
+
+Both providers keep the keys in the order the dicts were built instead
+of sorting every object as Flask's default does, and hand anything they
+can't encode natively (dates, Decimals, dataclasses) to Flask's own
+fallback, so the two produce the same JSON values.
+"""
+
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; StdlibJSONProvider is used instead
+    orjson = None
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's default provider without the per-object key sort."""
+
+    sort_keys = False
+
+
+class OrjsonProvider(JSONProvider):
+    """Encode with orjson, writing response bodies straight as bytes."""
+
+    default = staticmethod(DefaultJSONProvider.default)
+
+    def __init__(self, app):
+        if orjson is None:
+            raise RuntimeError("JSON_PROVIDER is 'orjson' but orjson is not installed")
+        super().__init__(app)
+        # Non-string keys become strings and datetimes go through Flask's
+        # fallback (HTTP dates), matching the stdlib provider
+        self.option = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                       | orjson.OPT_PASSTHROUGH_DATACLASS)
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self.option | orjson.OPT_INDENT_2 if self._app.debug else self.option
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=option), mimetype='application/json')
+
+
+# JSON_PROVIDER values and the providers they select
+PROVIDERS = {
+    'stdlib': StdlibJSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+
+def init_json(app):
+    """
+    Install the JSON provider chosen by JSON_PROVIDER as app.json.
+
+    Config keys:
+        JSON_PROVIDER: 'auto', 'orjson' or 'stdlib' (see module docstring)
+
+    Raises:
+        ValueError: If JSON_PROVIDER is not one of those
+    """
+    app.config.setdefault('JSON_PROVIDER', 'auto')
+    name = app.config['JSON_PROVIDER']
+    if name == 'auto':
+        name = 'stdlib' if orjson is None else 'orjson'
+    if name not in PROVIDERS:
+        raise ValueError(f"unknown JSON_PROVIDER: {name}")
+    app.json = PROVIDERS[name](app)
@@ -0,0 +1,85 @@
+"""In-process cache of the serialized leaderboard behind GET /users."""
+
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from app.models import User
+from app.signals import trades_settled, user_created
+from app.versions import USERS_VERSION, get_version
+
+
+class LeaderboardCache:
+    """
+    The users list sorted by balance, serialized once and reused.
+
+    Writes in this process invalidate the cache straight away through the
+    operation signals. Writes in other worker processes are noticed by
+    comparing the 'users' data-version counter, which is checked at most
+    once per check_interval seconds; in between, reads are served from
+    memory without touching the database.
+    """
+
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._payload = None
+        self._checked_at = None
+
+    def get(self):
+        """
+        Return the current leaderboard.
+
+        Returns:
+            Tuple of (version, payload) where payload is the JSON text of a
+            list of {'id', 'name', 'balance'} dicts, highest balance first
+        """
+        with self._lock:
+            now = time.monotonic()
+            if (self._checked_at is not None
+                    and now - self._checked_at < self.check_interval):
+                return self._version, self._payload
+
+            version = get_version(USERS_VERSION)
+            if version != self._version or self._payload is None:
+                # Read the version before the rows: a write that lands in
+                # between only makes the next check rebuild again
+                self._payload = self._build()
+                self._version = version
+            self._checked_at = now
+            return self._version, self._payload
+
+    def invalidate(self):
+        """Force the next get() to re-check the version counter."""
+        with self._lock:
+            self._checked_at = None
+
+    def _build(self):
+        rows = db.session.execute(
+            select(User.id, User.name, User.balance)
+            .order_by(User.balance.desc(), User.id)
+        )
+        return current_app.json.dumps([row._asdict() for row in rows])
+
+
+def init_leaderboard(app):
+    """Attach a LeaderboardCache to app (see LEADERBOARD_CHECK_INTERVAL)."""
+    app.config.setdefault('LEADERBOARD_CHECK_INTERVAL', 1.0)
+    app.extensions['leaderboard'] = LeaderboardCache(app.config['LEADERBOARD_CHECK_INTERVAL'])
+
+
+def get_leaderboard():
+    """Return (version, payload) from the current app's leaderboard cache."""
+    return current_app.extensions['leaderboard'].get()
+
+
+@user_created.connect
+@trades_settled.connect
+def _invalidate(app, **kwargs):
+    cache = app.extensions.get('leaderboard')
+    if cache is not None:
+        cache.invalidate()
@@ -0,0 +1,158 @@
+"""Append-only balance ledger with periodic per-user snapshots."""
+
+import math
+
+from sqlalchemy import and_, func, insert, select
+
+from app import db
+from app.models import User, LedgerEntry, BalanceSnapshot
+
+# A user gets a new snapshot once this many entries follow their last one,
+# which bounds the tail scanned by balance_as_of
+SNAPSHOT_INTERVAL = 100
+
+
+def record_entries(entries):
+    """
+    Append ledger entries in the current transaction (no commit).
+
+    Args:
+        entries: List of dicts with 'user_id', 'delta' and, for trade
+            settlements, 'trade_type' and 'trade_id'
+    """
+    if not entries:
+        return
+    rows = [
+        {'trade_type': None, 'trade_id': None, **entry}
+        for entry in entries
+    ]
+    db.session.execute(insert(LedgerEntry.__table__), rows)
+
+
+def checkpoint_balances(user_ids=None, interval=None):
+    """
+    Snapshot every user whose ledger tail has reached interval entries.
+
+    Runs in the current transaction (no commit). Settlement calls this for
+    the users it touched, so no tail ever grows much past interval.
+
+    Args:
+        user_ids: Only consider these users (all users if None)
+        interval: Minimum tail length that triggers a snapshot
+            (defaults to SNAPSHOT_INTERVAL)
+
+    Returns:
+        Number of snapshots written
+    """
+    if interval is None:
+        interval = SNAPSHOT_INTERVAL
+
+    snapshots = []
+    for row in _ledger_tails(user_ids):
+        if row.tail_count >= interval:
+            snapshots.append({
+                'user_id': row.user_id,
+                'seq': row.last_seq,
+                'balance': (row.snapshot_balance or 0) + row.tail_sum,
+            })
+    if snapshots:
+        db.session.execute(insert(BalanceSnapshot.__table__), snapshots)
+    return len(snapshots)
+
+
+def balance_as_of(user_id, seq=None):
+    """
+    Rebuild a user's balance from the ledger.
+
+    Starts from the latest snapshot at or before seq and adds the entries
+    after it, so the work is one index lookup plus a bounded tail scan.
+
+    Args:
+        user_id: The ID of the user
+        seq: Ledger sequence number to stop at (inclusive), or None for now
+
+    Returns:
+        The user's balance after every entry up to seq
+    """
+    snapshot_query = (
+        select(BalanceSnapshot.seq, BalanceSnapshot.balance)
+        .where(BalanceSnapshot.user_id == user_id)
+        .order_by(BalanceSnapshot.seq.desc())
+        .limit(1)
+    )
+    tail_query = select(func.coalesce(func.sum(LedgerEntry.delta), 0)).where(
+        LedgerEntry.user_id == user_id
+    )
+    if seq is not None:
+        snapshot_query = snapshot_query.where(BalanceSnapshot.seq <= seq)
+        tail_query = tail_query.where(LedgerEntry.seq <= seq)
+
+    snapshot = db.session.execute(snapshot_query).first()
+    start_seq, base = snapshot if snapshot else (0, 0)
+    tail = db.session.execute(tail_query.where(LedgerEntry.seq > start_seq)).scalar()
+    return base + tail
+
+
+def verify_ledger(tolerance=1e-6):
+    """
+    Check that every user's balance equals their snapshot plus ledger tail.
+
+    Args:
+        tolerance: Allowed absolute difference (underlying P&L is fractional)
+
+    Returns:
+        A list of dicts with 'user_id', 'balance' and 'ledger_balance' for
+        every user whose balance disagrees with the ledger (empty if none)
+    """
+    mismatches = []
+    for row in _ledger_tails():
+        ledger_balance = (row.snapshot_balance or 0) + row.tail_sum
+        if not math.isclose(row.balance, ledger_balance, abs_tol=tolerance):
+            mismatches.append({
+                'user_id': row.user_id,
+                'balance': row.balance,
+                'ledger_balance': ledger_balance,
+            })
+    return mismatches
+
+
+def _ledger_tails(user_ids=None):
+    """
+    Summarise each user's latest snapshot and the ledger entries after it.
+
+    Returns:
+        Rows with user_id, balance, snapshot_balance (None if no snapshot),
+        tail_count, tail_sum and last_seq
+    """
+    latest = (
+        select(BalanceSnapshot.user_id, func.max(BalanceSnapshot.seq).label('seq'))
+        .group_by(BalanceSnapshot.user_id)
+        .subquery()
+    )
+    snapshot = (
+        select(BalanceSnapshot.user_id, BalanceSnapshot.seq, BalanceSnapshot.balance)
+        .join(latest, and_(
+            BalanceSnapshot.user_id == latest.c.user_id,
+            BalanceSnapshot.seq == latest.c.seq,
+        ))
+        .subquery()
+    )
+    query = (
+        select(
+            User.id.label('user_id'),
+            User.balance,
+            snapshot.c.balance.label('snapshot_balance'),
+            func.count(LedgerEntry.seq).label('tail_count'),
+            func.coalesce(func.sum(LedgerEntry.delta), 0).label('tail_sum'),
+            func.max(LedgerEntry.seq).label('last_seq'),
+        )
+        .outerjoin(snapshot, snapshot.c.user_id == User.id)
+        .outerjoin(LedgerEntry, and_(
+            LedgerEntry.user_id == User.id,
+            LedgerEntry.seq > func.coalesce(snapshot.c.seq, 0),
+        ))
+        .group_by(User.id, User.balance, snapshot.c.balance)
+    )
+    if user_ids is not None:
+        query = query.where(User.id.in_(user_ids))
+    return db.session.execute(query).all()
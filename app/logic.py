@@ -1,5 +1,64 @@
 """Pure business logic functions for trade calculations."""
 
+import numpy as np
+
+
+def calculate_binary_payouts(alice_stakes, bob_stakes, outcomes):
+    """
+    Calculate P&L for many binary trades in one vectorized pass.
+
+    This is the array version of calculate_binary_payout. All inputs are
+    broadcast against each other, so a single outcome can be applied to a
+    whole array of trades.
+
+    Args:
+        alice_stakes: Array of amounts Alice risks (she wins if outcome is YES)
+        bob_stakes: Array of amounts Bob risks (he wins if outcome is NO)
+        outcomes: Array of booleans, True for YES, False for NO
+
+    Returns:
+        Tuple of (alice_pnls, bob_pnls) arrays - always zero-sum element-wise
+    """
+    alice_stakes = np.asarray(alice_stakes)
+    bob_stakes = np.asarray(bob_stakes)
+    outcomes = np.asarray(outcomes, dtype=bool)
+
+    # YES: Alice wins Bob's stake, NO: Alice loses her own stake
+    alice_pnls = np.where(outcomes, bob_stakes, -alice_stakes)
+    # Bob's P&L is the mirror image, so the pair is zero-sum by construction
+    bob_pnls = -alice_pnls
+
+    return alice_pnls, bob_pnls
+
+
+def calculate_underlying_payouts(lot_sizes, trade_prices, settlement_prices):
+    """
+    Calculate P&L for many underlying trades in one vectorized pass.
+
+    This is the array version of calculate_underlying_payout. All inputs are
+    broadcast against each other, so a single settlement price can be applied
+    to a whole array of trades, or a column of positions can be revalued
+    against a row of scenario prices.
+
+    Args:
+        lot_sizes: Array of units traded (can be fractional)
+        trade_prices: Array of prices at which the trades were entered
+        settlement_prices: Array of final prices to settle the trades at
+
+    Returns:
+        Tuple of (long_pnls, short_pnls) arrays - always zero-sum element-wise
+    """
+    lot_sizes = np.asarray(lot_sizes, dtype=float)
+    trade_prices = np.asarray(trade_prices, dtype=float)
+    settlement_prices = np.asarray(settlement_prices, dtype=float)
+
+    # P&L = lot_size × (settlement_price - trade_price)
+    long_pnls = lot_sizes * (settlement_prices - trade_prices)
+    # Short party gets exactly the opposite, so minimarbles are conserved
+    short_pnls = -long_pnls
+
+    return long_pnls, short_pnls
+
 
 def calculate_binary_payout(alice_stake, bob_stake, outcome):
     """
@@ -17,13 +76,51 @@ def calculate_binary_payout(alice_stake, bob_stake, outcome):
     Returns:
         Tuple of (alice_pnl, bob_pnl) - always zero-sum
     """
-    if outcome:
-        # YES: Alice wins Bob's stake
-        alice_pnl = bob_stake
-        bob_pnl = -bob_stake
-    else:
-        # NO: Bob wins Alice's stake
-        alice_pnl = -alice_stake
-        bob_pnl = alice_stake
+    alice_pnl, bob_pnl = calculate_binary_payouts(alice_stake, bob_stake, outcome)
+    # .item() turns 0-d arrays back into plain Python numbers for the database
+    return alice_pnl.item(), bob_pnl.item()
+
+
+def calculate_underlying_payout(lot_size, trade_price, settlement_price):
+    """
+    Calculate P&L for an underlying trade.
+
+    An underlying trade gives linear exposure to a price:
+    P&L = lot_size × (settlement_price - trade_price)
+
+    Args:
+        lot_size: Number of units traded (can be fractional)
+        trade_price: Price at which the trade was entered
+        settlement_price: Final price the trade settles at
+
+    Returns:
+        Tuple of (long_pnl, short_pnl) - always zero-sum
+    """
+    long_pnl, short_pnl = calculate_underlying_payouts(lot_size, trade_price, settlement_price)
+    return long_pnl.item(), short_pnl.item()
+
+
+def net_pnl_by_user(user_ids, pnls):
+    """
+    Net many per-trade P&L legs into one total per user.
+
+    Settling or revaluing a batch of trades produces one P&L leg per party
+    per trade. Summing them per user first means each user's balance only
+    has to be touched once.
+
+    Args:
+        user_ids: Array of user IDs, one per P&L leg
+        pnls: Array of P&L amounts, same length as user_ids (a 2-D array
+            nets every column at once, e.g. one column per scenario)
+
+    Returns:
+        Tuple of (unique_user_ids, totals) arrays, sorted by user ID
+    """
+    user_ids = np.asarray(user_ids)
+    pnls = np.asarray(pnls)
+
+    unique_ids, inverse = np.unique(user_ids, return_inverse=True)
+    totals = np.zeros((len(unique_ids),) + pnls.shape[1:], dtype=pnls.dtype)
+    np.add.at(totals, inverse, pnls)
 
-    return alice_pnl, bob_pnl
+    return unique_ids, totals
@@ -0,0 +1,372 @@
+"""Mark-to-market valuation of open underlying trades.
+
+Prices posted to POST /marks are stored in the mark table, one row per
+underlying. A MarkBook per process holds every open underlying trade in
+flat numpy arrays and keeps each trade's and each user's unrealized P&L
+up to date: a new mark only revalues the trades on that underlying, and
+when the 'trades' data version moves only the underlying trades stamped
+with a later change_seq are read back and applied to the arrays.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from app import db
+from app.logic import calculate_underlying_payouts
+from app.models import Mark, Trade, utcnow
+from app.signals import trades_created, trades_settled
+from app.versions import (
+    CHANGES_VERSION,
+    MARKS_VERSION,
+    TRADES_VERSION,
+    bump_version,
+    get_versions,
+)
+
+
+# Open underlying trades as parallel arrays: trade i is between
+# user_ids[long_slots[i]] and user_ids[short_slots[i]] on symbols[codes[i]],
+# whose latest mark is marks[codes[i]] (NaN if never marked)
+Positions = namedtuple('Positions', [
+    'user_ids', 'long_slots', 'short_slots', 'codes', 'symbols',
+    'lot_sizes', 'trade_prices', 'marks',
+])
+
+
+class MarkBook:
+    """
+    Unrealized P&L of every open underlying trade, kept in arrays.
+
+    Trade i is long_slots[i] vs short_slots[i] (indexes into user_ids) on
+    underlying codes[i] (an index into symbols). pnls[i] is the long
+    side's unrealized P&L at the current mark, or 0 while its underlying
+    has no mark, and user_totals holds the per-user sums of those legs.
+
+    Reads compare the 'trades' and 'marks' data versions with the ones
+    the book was built from, so writes from any worker process are picked
+    up: new marks revalue only the trades on the underlyings whose price
+    changed, and new or settled trades are applied as a delta of the
+    underlying trades whose change_seq is past the last one seen. Writes
+    in this process invalidate the book through the operation signals;
+    otherwise the versions are checked at most once per check_interval
+    seconds.
+    """
+
+    def __init__(self, check_interval=0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._trades_version = None
+        self._marks_version = None
+        self._change_seq = None
+        self._checked_at = None
+        self._prices = {}
+        self._load_trades([])
+
+    def __len__(self):
+        """Number of open trades in the book as of the last refresh."""
+        return len(self._trade_ids)
+
+    def refresh(self):
+        """
+        Bring the book up to date with the database, whatever the interval.
+
+        Returns:
+            The number of trades that were revalued
+        """
+        with self._lock:
+            return self._refresh()
+
+    def invalidate(self):
+        """Force the next read to re-check the version counters."""
+        with self._lock:
+            self._checked_at = None
+
+    def positions(self):
+        """
+        Snapshot the open trades and latest marks for whole-book analysis.
+
+        Returns:
+            A Positions tuple of arrays, safe to use after the book changes
+        """
+        with self._lock:
+            self._maybe_refresh()
+            return Positions(
+                user_ids=self._user_ids,
+                long_slots=self._long_slots,
+                short_slots=self._short_slots,
+                codes=self._codes,
+                symbols=list(self._symbols),
+                lot_sizes=self._lot_sizes,
+                trade_prices=self._trade_prices,
+                marks=self._marks.copy(),
+            )
+
+    def unrealized(self, user_id):
+        """
+        Value one user's open underlying trades at the latest marks.
+
+        Args:
+            user_id: The user to value
+
+        Returns:
+            Dict with 'user_id', the total 'unrealized' P&L and a list of
+            'positions', one per open trade the user is a party to
+        """
+        with self._lock:
+            self._maybe_refresh()
+
+            slot = np.searchsorted(self._user_ids, user_id)
+            if slot == len(self._user_ids) or self._user_ids[slot] != user_id:
+                return {'user_id': user_id, 'unrealized': 0.0, 'positions': []}
+
+            is_long = self._long_slots == slot
+            rows = np.flatnonzero(is_long | (self._short_slots == slot))
+            signs = np.where(is_long[rows], 1.0, -1.0)
+            marks = self._marks[self._codes[rows]]
+            positions = [
+                {
+                    'id': trade_id,
+                    'underlying': self._symbols[code],
+                    'side': 'long' if sign > 0 else 'short',
+                    'lot_size': lot_size,
+                    'trade_price': trade_price,
+                    'mark': None if np.isnan(mark) else mark,
+                    'unrealized': sign * pnl,
+                }
+                for trade_id, code, sign, lot_size, trade_price, mark, pnl in zip(
+                    self._trade_ids[rows].tolist(),
+                    self._codes[rows].tolist(),
+                    signs.tolist(),
+                    self._lot_sizes[rows].tolist(),
+                    self._trade_prices[rows].tolist(),
+                    marks.tolist(),
+                    self._pnls[rows].tolist(),
+                )
+            ]
+            return {
+                'user_id': user_id,
+                'unrealized': self._user_totals[slot].item(),
+                'positions': positions,
+            }
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            self._refresh()
+
+    def _refresh(self):
+        # Read the versions before the rows: a write that lands in between
+        # has a later change_seq and is applied by the next refresh
+        trades_version, marks_version, change_seq = get_versions(
+            TRADES_VERSION, MARKS_VERSION, CHANGES_VERSION
+        )
+        self._checked_at = time.monotonic()
+
+        if marks_version != self._marks_version:
+            changed = self._load_prices()
+        else:
+            changed = set()
+
+        table = Trade.__table__
+        columns = (
+            table.c.id, table.c.first_party_id, table.c.second_party_id,
+            table.c.lot_size, table.c.trade_price, table.c.underlying,
+        )
+        if self._change_seq is None:
+            trades = db.session.execute(
+                select(*columns)
+                .where(table.c.type == 'underlying', table.c.status == 'open',
+                       table.c.underlying.is_not(None), table.c.change_seq <= change_seq)
+            ).all()
+            self._load_trades(trades)
+            codes = np.arange(len(self._symbols))
+        elif trades_version != self._trades_version:
+            trades = db.session.execute(
+                select(*columns, table.c.status)
+                .where(table.c.change_seq > self._change_seq,
+                       table.c.change_seq <= change_seq, table.c.type == 'underlying')
+            ).all()
+            codes = self._apply_trades(trades)
+            codes.update(self._symbol_codes[s] for s in changed if s in self._symbol_codes)
+            codes = np.array(sorted(codes), dtype=np.intp)
+        else:
+            codes = np.array([self._symbol_codes[s] for s in changed if s in self._symbol_codes],
+                             dtype=np.intp)
+
+        self._trades_version = trades_version
+        self._marks_version = marks_version
+        self._change_seq = change_seq
+        return self._revalue(codes)
+
+    def _load_prices(self):
+        """Reload every mark; return the underlyings whose price changed."""
+        prices = dict(db.session.execute(select(Mark.underlying, Mark.price)).all())
+        changed = {symbol for symbol, price in prices.items()
+                   if self._prices.get(symbol) != price}
+        self._prices = prices
+        return changed
+
+    def _load_trades(self, trades):
+        """Rebuild the arrays from (id, long, short, lot, price, underlying) rows."""
+        if trades:
+            trade_ids, long_ids, short_ids, lot_sizes, trade_prices, underlyings = zip(*trades)
+        else:
+            trade_ids = long_ids = short_ids = lot_sizes = trade_prices = underlyings = ()
+
+        self._trade_ids = np.array(trade_ids, dtype=np.int64)
+        self._lot_sizes = np.array(lot_sizes, dtype=float)
+        self._trade_prices = np.array(trade_prices, dtype=float)
+
+        symbols, codes = np.unique(np.array(underlyings, dtype=object).astype(str),
+                                   return_inverse=True)
+        self._symbols = symbols.tolist()
+        self._symbol_codes = {symbol: code for code, symbol in enumerate(self._symbols)}
+        self._codes = codes.reshape(-1)
+        self._marks = np.full(len(self._symbols), np.nan)
+
+        user_ids, slots = np.unique(np.array(long_ids + short_ids, dtype=np.int64),
+                                    return_inverse=True)
+        self._user_ids = user_ids
+        self._long_slots = slots[:len(trade_ids)]
+        self._short_slots = slots[len(trade_ids):]
+
+        self._pnls = np.zeros(len(trade_ids))
+        self._user_totals = np.zeros(len(user_ids))
+
+    def _apply_trades(self, trades):
+        """
+        Apply underlying trades written since the last refresh.
+
+        Each row is (id, long, short, lot, price, underlying, status). Any
+        trade in the book with one of the ids is dropped, taking its legs
+        out of the user totals, and the rows still open are added with no
+        P&L yet.
+
+        Returns:
+            The set of codes of the added trades, to be revalued
+        """
+        if not trades:
+            return set()
+
+        keep = ~np.isin(self._trade_ids, [trade.id for trade in trades])
+        if not keep.all():
+            dropped = ~keep
+            np.add.at(self._user_totals, self._long_slots[dropped], -self._pnls[dropped])
+            np.add.at(self._user_totals, self._short_slots[dropped], self._pnls[dropped])
+
+        opened = [trade for trade in trades
+                  if trade.status == 'open' and trade.underlying is not None]
+        for trade in opened:
+            if trade.underlying not in self._symbol_codes:
+                self._symbol_codes[trade.underlying] = len(self._symbols)
+                self._symbols.append(trade.underlying)
+        if len(self._symbols) > len(self._marks):
+            self._marks = np.concatenate(
+                [self._marks, np.full(len(self._symbols) - len(self._marks), np.nan)]
+            )
+
+        # Merge in the new users, keeping user_ids sorted for searchsorted
+        long_ids = np.array([trade.first_party_id for trade in opened], dtype=np.int64)
+        short_ids = np.array([trade.second_party_id for trade in opened], dtype=np.int64)
+        user_ids = np.union1d(self._user_ids, np.concatenate([long_ids, short_ids]))
+        moved = np.searchsorted(user_ids, self._user_ids)
+        user_totals = np.zeros(len(user_ids))
+        user_totals[moved] = self._user_totals
+
+        codes = np.array([self._symbol_codes[trade.underlying] for trade in opened],
+                         dtype=np.intp)
+        self._trade_ids = np.concatenate(
+            [self._trade_ids[keep], np.array([trade.id for trade in opened], dtype=np.int64)]
+        )
+        self._lot_sizes = np.concatenate(
+            [self._lot_sizes[keep], np.array([trade.lot_size for trade in opened], dtype=float)]
+        )
+        self._trade_prices = np.concatenate(
+            [self._trade_prices[keep],
+             np.array([trade.trade_price for trade in opened], dtype=float)]
+        )
+        self._codes = np.concatenate([self._codes[keep], codes])
+        self._long_slots = np.concatenate(
+            [moved[self._long_slots[keep]], np.searchsorted(user_ids, long_ids)]
+        )
+        self._short_slots = np.concatenate(
+            [moved[self._short_slots[keep]], np.searchsorted(user_ids, short_ids)]
+        )
+        self._pnls = np.concatenate([self._pnls[keep], np.zeros(len(opened))])
+        self._user_ids = user_ids
+        self._user_totals = user_totals
+        return set(codes.tolist())
+
+    def _revalue(self, codes):
+        """Revalue the trades on the given underlying codes at the latest marks."""
+        if len(codes) == 0:
+            return 0
+        self._marks[codes] = [self._prices.get(self._symbols[code], np.nan) for code in codes]
+
+        rows = np.flatnonzero(np.isin(self._codes, codes))
+        long_pnls, _ = calculate_underlying_payouts(
+            self._lot_sizes[rows], self._trade_prices[rows], self._marks[self._codes[rows]]
+        )
+        long_pnls = np.nan_to_num(long_pnls, nan=0.0)
+
+        # Move each user's total by the change in their legs only
+        changes = long_pnls - self._pnls[rows]
+        self._pnls[rows] = long_pnls
+        np.add.at(self._user_totals, self._long_slots[rows], changes)
+        np.add.at(self._user_totals, self._short_slots[rows], -changes)
+        return len(rows)
+
+
+def init_marks(app):
+    """Attach a MarkBook to app (see MARKS_CHECK_INTERVAL)."""
+    app.config.setdefault('MARKS_CHECK_INTERVAL', 1.0)
+    app.extensions['marks'] = MarkBook(app.config['MARKS_CHECK_INTERVAL'])
+
+
+def record_marks(prices):
+    """
+    Store new prices for some underlyings and revalue the trades on them.
+
+    Args:
+        prices: Dict mapping underlying symbol to its latest price
+
+    Returns:
+        The number of open trades that were revalued
+    """
+    if not prices:
+        return 0
+
+    table = Mark.__table__
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.underlying],
+        set_={'price': statement.excluded.price, 'marked_at': statement.excluded.marked_at},
+    )
+    now = utcnow()
+    db.session.execute(statement, [
+        {'underlying': symbol, 'price': price, 'marked_at': now}
+        for symbol, price in prices.items()
+    ])
+    bump_version(MARKS_VERSION)
+    db.session.commit()
+
+    return current_app.extensions['marks'].refresh()
+
+
+def get_unrealized(user_id):
+    """Return MarkBook.unrealized(user_id) from the current app's book."""
+    return current_app.extensions['marks'].unrealized(user_id)
+
+
+@trades_created.connect
+@trades_settled.connect
+def _invalidate(app, **kwargs):
+    book = app.extensions.get('marks')
+    if book is not None:
+        book.invalidate()
@@ -0,0 +1,261 @@
+"""Per-endpoint request and SQL metrics, exposed at GET /metrics.
+
+Flask before/after-request hooks time every request, and SQLAlchemy
+cursor listeners count the statements each request runs, their time and
+the rows they affect and return. Everything is aggregated in memory per
+endpoint and rendered in the Prometheus text format.
+
+Rows affected are what the driver reports in cursor.rowcount, i.e. rows
+written by INSERT/UPDATE/DELETE. sqlite3 does not know how many rows a
+SELECT returns until they have been fetched, so rows returned are
+counted as they are fetched, through a thin wrapper around the cursor
+of every statement that produces a result.
+
+The per-statement listeners only add to a list held for the request;
+the endpoint's stats are looked up once per request, and the registry
+lock is taken once when the request is recorded.
+
+A streamed response (e.g. an export) runs most of its SQL after the
+view has returned, while the body is being sent. The request is recorded
+as usual, with its latency to the start of the response, and the SQL run
+while streaming is added to its endpoint when the response is closed.
+"""
+
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+from flask import Response, request
+from sqlalchemy import event
+
+from app import db
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# The measurements of the request being handled (see init_metrics). A
+# context variable rather than flask.g, which is read through a proxy
+# and costs more than the rest of the per-request bookkeeping together.
+_current = ContextVar('minimarbles_metrics', default=None)
+
+
+class _EndpointStats:
+    """Aggregated measurements for one endpoint."""
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)  # last is +Inf
+        self.latency_sum = 0.0
+        self.requests = {}  # (method, status) -> count
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.sql_rows_affected = 0
+        self.sql_rows_returned = 0
+
+
+class _CountingCursor:
+    """Wraps a DBAPI cursor to count the rows fetched from it."""
+
+    __slots__ = ('_cursor', '_metrics')
+
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._metrics[4] += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._metrics[4] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._metrics[4] += len(rows)
+        return rows
+
+
+class MetricsRegistry:
+    """Thread-safe in-memory store of per-endpoint metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def endpoint(self, name):
+        """Return the stats for the endpoint called name, creating them on first use."""
+        stats = self._endpoints.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self._endpoints.setdefault(name, _EndpointStats())
+        return stats
+
+    def observe(self, metrics, status, seconds):
+        """
+        Record one finished request.
+
+        Args:
+            metrics: The request's [start time, statements, SQL seconds,
+                rows affected, rows returned, stats (see endpoint), method]
+            status: The response status code
+            seconds: The request's latency
+        """
+        _, statements, sql_seconds, rows_affected, rows_returned, stats, method = metrics
+        with self._lock:
+            stats.bucket_counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats.latency_sum += seconds
+            key = (method, status)
+            stats.requests[key] = stats.requests.get(key, 0) + 1
+            stats.sql_statements += statements
+            stats.sql_seconds += sql_seconds
+            stats.sql_rows_affected += rows_affected
+            stats.sql_rows_returned += rows_returned
+
+    def observe_sql(self, metrics):
+        """Add the SQL counted in metrics for an already recorded request,
+        e.g. while its body was streamed."""
+        _, statements, sql_seconds, rows_affected, rows_returned, stats, _ = metrics
+        with self._lock:
+            stats.sql_statements += statements
+            stats.sql_seconds += sql_seconds
+            stats.sql_rows_affected += rows_affected
+            stats.sql_rows_returned += rows_returned
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = [
+                '# HELP minimarbles_request_duration_seconds Request latency by endpoint.',
+                '# TYPE minimarbles_request_duration_seconds histogram',
+            ]
+            for endpoint, stats in endpoints:
+                label = f'endpoint="{endpoint}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), stats.bucket_counts):
+                    cumulative += count
+                    lines.append(
+                        f'minimarbles_request_duration_seconds_bucket{{{label},le="{bound}"}} '
+                        f'{cumulative}'
+                    )
+                lines.append(f'minimarbles_request_duration_seconds_sum{{{label}}} '
+                             f'{stats.latency_sum}')
+                lines.append(f'minimarbles_request_duration_seconds_count{{{label}}} '
+                             f'{cumulative}')
+
+            lines += [
+                '# HELP minimarbles_requests_total Requests by endpoint, method and status.',
+                '# TYPE minimarbles_requests_total counter',
+            ]
+            for endpoint, stats in endpoints:
+                for (method, status), count in sorted(stats.requests.items()):
+                    lines.append(
+                        f'minimarbles_requests_total{{endpoint="{endpoint}",'
+                        f'method="{method}",status="{status}"}} {count}'
+                    )
+
+            for name, attr, help_text in (
+                ('sql_statements_total', 'sql_statements', 'SQL statements executed.'),
+                ('sql_seconds_total', 'sql_seconds', 'Time spent executing SQL.'),
+                ('sql_rows_affected_total', 'sql_rows_affected',
+                 'Rows inserted, updated or deleted by SQL.'),
+                ('sql_rows_returned_total', 'sql_rows_returned',
+                 'Rows fetched from SQL results.'),
+            ):
+                lines.append(f'# HELP minimarbles_{name} {help_text}')
+                lines.append(f'# TYPE minimarbles_{name} counter')
+                for endpoint, stats in endpoints:
+                    lines.append(f'minimarbles_{name}{{endpoint="{endpoint}"}} '
+                                 f'{getattr(stats, attr)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app):
+    """
+    Install the request/SQL hooks and the GET /metrics endpoint on app.
+
+    Config keys:
+        METRICS_ENABLED: Collect and expose metrics (default True)
+    """
+    app.config.setdefault('METRICS_ENABLED', True)
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    registry = MetricsRegistry()
+    app.extensions['metrics'] = registry
+
+    # Per-request state is a list, which is cheaper to update than a dict:
+    # [start time, statements, SQL seconds, rows affected, rows returned,
+    # the endpoint's stats, method]. Everything the request is labelled by
+    # is resolved here, once.
+    @app.before_request
+    def start_timer():
+        req = request._get_current_object()
+        _current.set([perf_counter(), 0, 0.0, 0, 0,
+                      registry.endpoint(req.endpoint or 'unmatched'), req.method])
+
+    @app.after_request
+    def record_request(response):
+        metrics = _current.get()
+        if metrics is None:
+            return response
+        registry.observe(metrics, response.status_code, perf_counter() - metrics[0])
+        if response.is_streamed:
+            # Count the SQL the body runs from here on, and add it once
+            # the response has been sent
+            streaming = [metrics[0], 0, 0.0, 0, 0, metrics[5], metrics[6]]
+            _current.set(streaming)
+
+            def record_streamed_sql():
+                _current.set(None)
+                registry.observe_sql(streaming)
+
+            response.call_on_close(record_streamed_sql)
+        else:
+            _current.set(None)
+        return response
+
+    def metrics_view():
+        return Response(registry.render(), mimetype=PROMETHEUS_MIMETYPE)
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_statement(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_start', []).append(perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def end_statement(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['metrics_start'].pop()
+        metrics = _current.get()
+        if metrics is None:
+            # Statements run outside a request (e.g. the group-commit
+            # writer) aren't attributed to any endpoint
+            return
+        metrics[1] += 1
+        metrics[2] += perf_counter() - started
+        if cursor.rowcount > 0:
+            metrics[3] += cursor.rowcount
+        if cursor.description is not None and context is not None:
+            # The result reads its rows through context.cursor
+            context.cursor = _CountingCursor(cursor, metrics)
+
+    @event.listens_for(engine, 'handle_error')
+    def failed_statement(exception_context):
+        # after_cursor_execute doesn't run for a failed statement
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('metrics_start'):
+            conn.info['metrics_start'].pop()
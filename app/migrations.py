@@ -0,0 +1,232 @@
+"""One-off data migrations for databases created by older versions.
+
+Run them with `flask --app app migrate-trades`; each one is a no-op on a
+database that doesn't need it.
+"""
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, exists, inspect, insert, select, text, update
+
+from app import db
+from app.models import LedgerEntry, Trade, User, utcnow
+from app.reconcile import reconcile_reserved
+from app.versions import TRADES_VERSION, bump_version, next_change_seq
+
+# Tables that held trades before every type moved into the trade table
+LEGACY_TRADE_TABLES = {
+    'binary': (
+        'binary_trade',
+        'id, party_a_id, party_b_id, stake_a, stake_b, outcome, description, status',
+    ),
+    'underlying': (
+        'underlying_trade',
+        'id, long_party_id, short_party_id, lot_size, trade_price, settlement_price, '
+        'description, status',
+    ),
+}
+
+
+def migrate_legacy_trades():
+    """
+    Move trades from the old per-type tables into the single trade table.
+
+    Binary and underlying trades used to live in their own tables, each
+    numbering its ids from 1. They are copied into the trade table in the
+    order the old listings used (by id, binary before underlying), which
+    gives them new ids unique across types; stakes in open binary trades
+    are reserved, users from before the ledger get their opening entries
+    (see backfill_opening_entries), ledger entries are repointed at the
+    new ids and the old tables are dropped. The old tables recorded no
+    times, so created_at (and settled_at for settled trades) is set to
+    the time of the migration. Everything happens in one transaction.
+
+    Returns:
+        Dict mapping (trade_type, old_id) to the trade's new id; empty if
+        there was nothing to migrate
+    """
+    connection = db.session.connection()
+    existing = set(inspect(connection).get_table_names())
+    legacy = {trade_type: spec for trade_type, spec in LEGACY_TRADE_TABLES.items()
+              if spec[0] in existing}
+    if not legacy:
+        return {}
+
+    rows = []
+    for trade_type, (table_name, columns) in legacy.items():
+        for row in connection.execute(text(f"SELECT {columns} FROM {table_name}")):
+            rows.append((row.id, trade_type, row))
+    rows.sort(key=lambda item: item[:2])
+
+    now = utcnow()
+    change_seq = next_change_seq()
+    next_id = (connection.execute(text("SELECT max(id) FROM trade")).scalar() or 0) + 1
+    trades = []
+    new_ids = {}
+    for new_id, (old_id, trade_type, row) in enumerate(rows, start=next_id):
+        new_ids[(trade_type, old_id)] = new_id
+        trade = {
+            'id': new_id,
+            'type': trade_type,
+            'first_party_id': row[1],
+            'second_party_id': row[2],
+            'stake_a': None,
+            'stake_b': None,
+            'outcome': None,
+            'lot_size': None,
+            'trade_price': None,
+            'settlement_price': None,
+            'underlying': None,
+            'description': row.description,
+            'status': row.status,
+            'created_at': now,
+            'settled_at': now if row.status == 'settled' else None,
+            'change_seq': change_seq,
+        }
+        if trade_type == 'binary':
+            trade.update(stake_a=row.stake_a, stake_b=row.stake_b, outcome=row.outcome)
+        else:
+            # Legacy trades named what they were based on in the description
+            trade.update(lot_size=row.lot_size, trade_price=row.trade_price,
+                         settlement_price=row.settlement_price, underlying=row.description)
+        trades.append(trade)
+
+    if trades:
+        db.session.execute(insert(Trade.__table__), trades)
+
+    # Stakes in open binary trades are held out of their parties' balances
+    stakes = [(trade[party], trade[stake]) for trade in trades
+              if trade['type'] == 'binary' and trade['status'] == 'open'
+              for party, stake in (('first_party_id', 'stake_a'),
+                                   ('second_party_id', 'stake_b'))]
+    if stakes:
+        users = User.__table__
+        db.session.execute(
+            update(users)
+            .where(users.c.id == bindparam('user_id'))
+            .values(reserved=users.c.reserved + bindparam('stake')),
+            [{'user_id': user_id, 'stake': stake} for user_id, stake in stakes],
+        )
+
+    # Books this old usually predate the ledger too
+    backfill_opening_entries()
+
+    # Old and new ids overlap, so park every reference at -id first and
+    # repoint from there; otherwise a repointed entry could be matched again
+    entries = LedgerEntry.__table__
+    db.session.execute(
+        update(entries)
+        .where(entries.c.trade_type.in_(list(legacy)))
+        .values(trade_id=-entries.c.trade_id)
+    )
+    if new_ids:
+        db.session.execute(
+            update(entries)
+            .where(entries.c.trade_type == bindparam('old_type'),
+                   entries.c.trade_id == bindparam('parked_id'))
+            .values(trade_id=bindparam('new_id')),
+            [{'old_type': trade_type, 'parked_id': -old_id, 'new_id': new_id}
+             for (trade_type, old_id), new_id in new_ids.items()],
+        )
+
+    for table_name, _ in legacy.values():
+        db.session.execute(text(f"DROP TABLE {table_name}"))
+    bump_version(TRADES_VERSION)
+    db.session.commit()
+    return new_ids
+
+
+def add_reserved_column():
+    """
+    Add the user.reserved column and fill it in from the open binary trades.
+
+    Returns:
+        True if the column was added, False if it already existed
+    """
+    connection = db.session.connection()
+    columns = {column['name'] for column in inspect(connection).get_columns('user')}
+    if 'reserved' in columns:
+        return False
+
+    connection.execute(text(
+        'ALTER TABLE "user" ADD COLUMN reserved INTEGER NOT NULL DEFAULT 0'
+    ))
+    reconcile_reserved(fix=True)
+    db.session.commit()
+    return True
+
+
+def add_change_seq_columns():
+    """
+    Add the indexed change_seq column to the user and trade tables.
+
+    Existing rows are all stamped with one new change sequence number, so
+    a client syncing from 0 still gets them.
+
+    Returns:
+        True if any column was added, False if both already existed
+    """
+    connection = db.session.connection()
+    inspector = inspect(connection)
+    added = False
+    for table in (User.__table__, Trade.__table__):
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        if 'change_seq' in columns:
+            continue
+        connection.execute(text(
+            f'ALTER TABLE "{table.name}" ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0'
+        ))
+        for index in table.indexes:
+            if list(index.columns.keys()) == ['change_seq']:
+                index.create(connection)
+        added = True
+    if not added:
+        return False
+
+    change_seq = next_change_seq()
+    for table in (User.__table__, Trade.__table__):
+        db.session.execute(update(table).values(change_seq=change_seq))
+    db.session.commit()
+    return True
+
+
+def backfill_opening_entries():
+    """
+    Give every user without ledger entries an opening entry.
+
+    Users created before the ledger existed have none, so their balances
+    disagree with it. Each gets one opening entry (no trade) for their
+    current balance, and later entries build on that. Runs in the current
+    transaction (no commit).
+
+    Returns:
+        Number of entries written
+    """
+    users = User.__table__
+    entries = LedgerEntry.__table__
+    unrecorded = (
+        select(users.c.id, users.c.balance)
+        .where(~exists().where(entries.c.user_id == users.c.id))
+        .order_by(users.c.id)
+    )
+    return db.session.execute(
+        insert(entries).from_select(['user_id', 'delta'], unrecorded)
+    ).rowcount
+
+
+@click.command('migrate-trades')
+@with_appcontext
+def migrate_trades_command():
+    """Move trades from the old per-type tables into the trade table."""
+    db.create_all()
+    # New columns first, since moving legacy trades writes to them
+    if add_reserved_column():
+        click.echo("Added reserved stakes to users.")
+    if add_change_seq_columns():
+        click.echo("Added change sequence numbers to users and trades.")
+    opened = backfill_opening_entries()
+    db.session.commit()
+    if opened:
+        click.echo(f"Recorded opening balances for {opened} user(s).")
+    migrated = migrate_legacy_trades()
+    click.echo(f"Migrated {len(migrated)} trade(s).")
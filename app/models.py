@@ -1,5 +1,7 @@
 """Database models for Minimarbles."""
 
+from datetime import datetime, timezone
+
 from app import db
 
 
@@ -9,37 +11,166 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     balance = db.Column(db.Integer, default=1000)
+    # Sum of the user's stakes in open binary trades; balance - reserved
+    # is what they can still put at risk
+    reserved = db.Column(db.Integer, nullable=False, default=0)
+    # Change sequence number of the last write to name or balance; see
+    # list_changes
+    change_seq = db.Column(db.Integer, nullable=False, default=0, index=True)
 
 
-class BinaryTrade(db.Model):
-    """A binary (yes/no) trade between two users."""
+def utcnow():
+    """The current UTC time as a naive datetime, the way SQLite stores it."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class Trade(db.Model):
+    """A trade between two users; the base of every trade type.
+
+    All trade types share this one table, with `type` saying which one a
+    row is, so listings across types are a single indexed query. Columns
+    that only one type uses are NULL for the others.
+    """
 
     id = db.Column(db.Integer, primary_key=True)
-    party_a_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    party_b_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    stake_a = db.Column(db.Integer, nullable=False)
-    stake_b = db.Column(db.Integer, nullable=False)
+    type = db.Column(db.String(20), nullable=False)
+    first_party_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    second_party_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     description = db.Column(db.String(500), nullable=False)
-    outcome = db.Column(db.Boolean, nullable=True)  # None=open, True/False=settled
     status = db.Column(db.String(20), default='open')
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow, index=True)
+    settled_at = db.Column(db.DateTime, nullable=True, index=True)  # None while open
+    # Change sequence number of the write that created or last settled it
+    change_seq = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+    first_party = db.relationship('User', foreign_keys=[first_party_id])
+    second_party = db.relationship('User', foreign_keys=[second_party_id])
+
+    __mapper_args__ = {'polymorphic_on': type}
+    # Lets paginated listings filtered by status walk the index in id order
+    __table_args__ = (db.Index('ix_trade_status_id', 'status', 'id'),)
+
+
+class BinaryTrade(Trade):
+    """A binary (yes/no) trade between two users."""
 
-    # Relationships to access User objects directly
-    party_a = db.relationship('User', foreign_keys=[party_a_id])
-    party_b = db.relationship('User', foreign_keys=[party_b_id])
+    stake_a = db.Column(db.Integer, nullable=True)  # set for every binary trade
+    stake_b = db.Column(db.Integer, nullable=True)
+    outcome = db.Column(db.Boolean, nullable=True)  # None=open, True/False=settled
+
+    # Party A wins on YES, party B on NO
+    party_a_id = db.synonym('first_party_id')
+    party_b_id = db.synonym('second_party_id')
+    party_a = db.synonym('first_party')
+    party_b = db.synonym('second_party')
+
+    __mapper_args__ = {'polymorphic_identity': 'binary'}
 
 
-class UnderlyingTrade(db.Model):
+class UnderlyingTrade(Trade):
     """An underlying (price-based) trade between two users."""
 
-    id = db.Column(db.Integer, primary_key=True)
-    long_party_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    short_party_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    lot_size = db.Column(db.Float, nullable=False)
-    trade_price = db.Column(db.Float, nullable=False)
+    lot_size = db.Column(db.Float, nullable=True)  # set for every underlying trade
+    trade_price = db.Column(db.Float, nullable=True)
     settlement_price = db.Column(db.Float, nullable=True)  # None until settled
-    description = db.Column(db.String(500), nullable=False)
-    status = db.Column(db.String(20), default='open')
+    # What is traded (e.g. 'AAPL'); open positions are marked by this symbol
+    underlying = db.Column(db.String(50), nullable=True, index=True)
+
+    long_party_id = db.synonym('first_party_id')
+    short_party_id = db.synonym('second_party_id')
+    long_party = db.synonym('first_party')
+    short_party = db.synonym('second_party')
+
+    __mapper_args__ = {'polymorphic_identity': 'underlying'}
+
+
+class Mark(db.Model):
+    """The latest price seen for an underlying, used to value open trades."""
+
+    underlying = db.Column(db.String(50), primary_key=True)
+    price = db.Column(db.Float, nullable=False)
+    marked_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+
+class Order(db.Model):
+    """A bid or offer on a market, resting in the order book while open.
+
+    A market is an underlying symbol (fills create underlying trades) or a
+    binary question (fills create binary trades with it as description).
+    Orders are never deleted: a filled or cancelled one just changes
+    status, so the open ones are the book.
+    """
+
+    # AUTOINCREMENT keeps ids rising, which is the book's time priority
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    market_type = db.Column(db.String(20), nullable=False)  # 'binary' or 'underlying'
+    market = db.Column(db.String(500), nullable=False)
+    side = db.Column(db.String(4), nullable=False)  # 'buy' or 'sell'
+    price = db.Column(db.Float, nullable=False)
+    quantity = db.Column(db.Float, nullable=False)
+    remaining = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='open')  # or 'filled', 'cancelled'
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    # Rebuilding the book reads the open orders in id order
+    __table_args__ = (
+        db.Index('ix_order_status_id', 'status', 'id'),
+        {'sqlite_autoincrement': True},
+    )
+
+
+class LedgerEntry(db.Model):
+    """One change to a user's balance. Entries are only ever appended."""
+
+    # Global sequence number; AUTOINCREMENT stops SQLite from reusing values
+    seq = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    delta = db.Column(db.Float, nullable=False)
+    trade_type = db.Column(db.String(20), nullable=True)  # None for the opening balance
+    trade_id = db.Column(db.Integer, nullable=True)
+
+    # A user's tail after a snapshot is a short range scan on this index
+    __table_args__ = (
+        db.Index('ix_ledger_entry_user_seq', 'user_id', 'seq'),
+        {'sqlite_autoincrement': True},
+    )
+
+
+class BalanceSnapshot(db.Model):
+    """A user's balance including every ledger entry up to and including seq."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    balance = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (db.Index('ix_balance_snapshot_user_seq', 'user_id', 'seq'),)
+
+
+class DataVersion(db.Model):
+    """A named counter bumped in the same transaction as the data it tracks.
+
+    Lets every worker process cheaply tell whether its cached copy of some
+    data (e.g. the leaderboard) is still current.
+    """
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class IdempotencyKey(db.Model):
+    """The stored response to a POST sent with an Idempotency-Key header.
+
+    A row is claimed (status None) before the request runs and filled in
+    with the response once it has; see app.idempotency.
+    """
 
-    # Relationships to access User objects directly
-    long_party = db.relationship('User', foreign_keys=[long_party_id])
-    short_party = db.relationship('User', foreign_keys=[short_party_id])
+    key = db.Column(db.String(255), primary_key=True)
+    # SHA-256 of the method, path and body the key was first used with
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Integer, nullable=True)  # None while in flight
+    mimetype = db.Column(db.String(100), nullable=True)
+    body = db.Column(db.LargeBinary, nullable=True)
+    # Expiry and trimming delete the oldest keys first
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow, index=True)
@@ -0,0 +1,248 @@
+"""Monte Carlo distribution of final balances from open binary trades.
+
+Given a probability of YES for each open binary trade, simulate_balances
+draws many independent outcome vectors, settles every trade in each one
+the way calculate_binary_payouts does and reports, per user, quantiles
+of the resulting balance and the probability of ending below zero.
+
+Each trade's NO and YES payouts come from calculate_binary_payouts once;
+a draw is then just its NO P&L plus the swing to YES where YES came up.
+Every trade touches only its two parties, so the swings of a chunk of
+draws are scattered onto those two users with np.bincount, and the work
+grows with draws × (trades + users) rather than draws × trades × users.
+
+Stakes are whole minimarbles, so every user's P&L in a draw is an
+integer in a known range. Draws are therefore tallied into per-user
+value counts instead of being kept, which makes the quantiles exact for
+the drawn sample while memory stays flat however many draws are made.
+The tally has one bin per possible balance of every user, so its size
+depends on the book rather than the draws; a book whose tally would
+exceed MONTECARLO_MAX_BINS is refused.
+
+Draws are made in chunks, each from its own generator spawned off one
+SeedSequence, so a seed always reproduces the same result however the
+chunks are spread across the process pool.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from app.logic import calculate_binary_payouts
+from app.models import Trade, User
+
+# Quantiles reported when the caller doesn't ask for others
+DEFAULT_QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+
+class SimulationError(ValueError):
+    """Raised when a simulation request is malformed."""
+
+
+def init_montecarlo(app):
+    """
+    Set the Monte Carlo defaults on app.
+
+    Config keys:
+        MONTECARLO_MAX_DRAWS: Most draws one simulation may make; the
+            endpoint runs it within the request (1M)
+        MONTECARLO_CHUNK_CELLS: Draw × trade (or draw × user, if there
+            are more users) cells held in memory per chunk (4M)
+        MONTECARLO_MAX_BINS: Most tally bins (one per possible balance,
+            summed over users) a simulation may need; each worker holds
+            one int64 per bin (4M)
+        MONTECARLO_WORKERS: Processes used for large simulations (os.cpu_count())
+        MONTECARLO_POOL_MIN_CELLS: Smallest simulation sent to the pool (50M cells)
+    """
+    app.config.setdefault('MONTECARLO_MAX_DRAWS', 1_000_000)
+    app.config.setdefault('MONTECARLO_CHUNK_CELLS', 4_000_000)
+    app.config.setdefault('MONTECARLO_MAX_BINS', 4_000_000)
+    app.config.setdefault('MONTECARLO_WORKERS', os.cpu_count() or 1)
+    app.config.setdefault('MONTECARLO_POOL_MIN_CELLS', 50_000_000)
+
+
+def simulate_balances(probabilities, draws, seed, quantiles=DEFAULT_QUANTILES,
+                      default_probability=None):
+    """
+    Simulate the final balances of everyone with open binary trades.
+
+    Args:
+        probabilities: Dict mapping open binary trade ID to its
+            probability of settling YES
+        draws: Number of outcome vectors to draw
+        seed: Integer seed; the same seed and draws give the same result
+        quantiles: Quantiles of the final balance to report, each in [0, 1]
+        default_probability: Probability used for open binary trades
+            missing from probabilities (if None, every trade must be given)
+
+    Returns:
+        Dict with the 'draws', 'seed' and 'trades' simulated and a list
+        of 'users', each with 'user_id', current 'balance', 'mean' and
+        'quantiles' (quantile -> balance) of the final balance and the
+        probability of ending below zero ('p_negative')
+
+    Raises:
+        SimulationError: If the request is malformed or names trades
+            that aren't open binary trades
+    """
+    config = current_app.config
+    _validate(probabilities, draws, seed, quantiles, default_probability,
+              config['MONTECARLO_MAX_DRAWS'])
+
+    trades = Trade.__table__
+    rows = db.session.execute(
+        select(trades.c.id, trades.c.first_party_id, trades.c.second_party_id,
+               trades.c.stake_a, trades.c.stake_b)
+        .where(trades.c.type == 'binary', trades.c.status == 'open')
+        .order_by(trades.c.id)
+    ).all()
+
+    unknown = set(probabilities) - {row.id for row in rows}
+    if unknown:
+        raise SimulationError(f"not open binary trades: {sorted(unknown)}")
+    missing = [row.id for row in rows if row.id not in probabilities]
+    if missing and default_probability is None:
+        raise SimulationError(f"no probability for open binary trades: {missing}")
+
+    result = {'draws': draws, 'seed': seed, 'trades': len(rows), 'users': []}
+    if not rows:
+        return result
+
+    trade_ids, party_a, party_b, stakes_a, stakes_b = (np.array(column) for column in zip(*rows))
+    p_yes = np.array([probabilities.get(trade_id, default_probability)
+                      for trade_id in trade_ids.tolist()])
+    stakes_a = stakes_a.astype(np.int64)
+    stakes_b = stakes_b.astype(np.int64)
+
+    # Party A's P&L in a trade ranges from -stake_a to +stake_b and party
+    # B's is its mirror image, which bounds each user's total P&L
+    user_ids, slots = np.unique(np.concatenate([party_a, party_b]), return_inverse=True)
+    a_slots, b_slots = slots[:len(trade_ids)], slots[len(trade_ids):]
+    lowest = np.zeros(len(user_ids), dtype=np.int64)
+    highest = np.zeros(len(user_ids), dtype=np.int64)
+    np.add.at(lowest, a_slots, -stakes_a)
+    np.add.at(lowest, b_slots, -stakes_b)
+    np.add.at(highest, a_slots, stakes_b)
+    np.add.at(highest, b_slots, stakes_a)
+    offsets = np.concatenate([[0], np.cumsum(highest - lowest + 1)])
+    if offsets[-1] > config['MONTECARLO_MAX_BINS']:
+        raise SimulationError(
+            f"open trades span {offsets[-1]} possible balances across their users; "
+            f"at most {config['MONTECARLO_MAX_BINS']} can be tallied")
+
+    # Settling a trade YES instead of NO moves party A's P&L by swing and
+    # party B's by -swing, so a draw's P&L per user is its NO P&L plus the
+    # swings of the trades that came up YES, scattered onto their parties
+    yes_pnls, _ = calculate_binary_payouts(stakes_a, stakes_b, True)
+    no_pnls, _ = calculate_binary_payouts(stakes_a, stakes_b, False)
+    swings = (yes_pnls - no_pnls).astype(np.int64)
+    base = np.zeros(len(user_ids), dtype=np.int64)
+    np.add.at(base, a_slots, no_pnls)
+    np.add.at(base, b_slots, -no_pnls)
+
+    cells = max(len(trade_ids), len(user_ids))
+    chunk = max(1, min(draws, config['MONTECARLO_CHUNK_CELLS'] // cells))
+    sizes = [chunk] * (draws // chunk) + ([draws % chunk] if draws % chunk else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = (p_yes, a_slots, b_slots, swings, base + offsets[:-1] - lowest, offsets[-1])
+
+    workers = min(config['MONTECARLO_WORKERS'], len(sizes))
+    if workers > 1 and draws * len(trade_ids) >= config['MONTECARLO_POOL_MIN_CELLS']:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_count_draws, sizes[i::workers], seeds[i::workers], *args)
+                       for i in range(workers)]
+            # Add into the first tally rather than allocating another
+            counts = futures[0].result()
+            for future in futures[1:]:
+                counts += future.result()
+    else:
+        counts = _count_draws(sizes, seeds, *args)
+
+    balances = dict(db.session.execute(
+        select(User.id, User.balance).where(User.id.in_(user_ids.tolist()))
+    ).all())
+    for slot, user_id in enumerate(user_ids.tolist()):
+        tally = counts[offsets[slot]:offsets[slot + 1]]
+        values = balances[user_id] + np.arange(lowest[slot], highest[slot] + 1)
+        result['users'].append({
+            'user_id': user_id,
+            'balance': balances[user_id],
+            'mean': float(tally @ values / draws),
+            'quantiles': {str(q): value for q, value in
+                          zip(quantiles, _quantiles(tally, values, quantiles, draws))},
+            'p_negative': float(tally[values < 0].sum() / draws),
+        })
+    return result
+
+
+def _count_draws(sizes, seeds, p_yes, a_slots, b_slots, swings, shifts, bins):
+    """
+    Draw chunks of outcomes and tally every user's P&L.
+
+    Args:
+        sizes: Number of draws in each chunk
+        seeds: A SeedSequence per chunk
+        p_yes: Probability of YES for each trade
+        a_slots: Index of each trade's party A among the users
+        b_slots: Index of each trade's party B among the users
+        swings: What a YES adds to each trade's party A P&L (and takes
+            from party B's)
+        shifts: Per user, what to add to the summed swings to get its bin
+        bins: Total number of bins across all users
+
+    Returns:
+        Array of counts per bin
+    """
+    users = len(shifts)
+    p_yes = p_yes.astype(np.float32)
+    counts = np.zeros(bins, dtype=np.int64)
+    cells = {}
+    for size, seed in zip(sizes, seeds):
+        if size not in cells:
+            # Cell of each trade's party A and party B in a users × draws
+            # array, for every draw in a chunk of this size
+            draws = np.arange(size)
+            cells[size] = (np.ravel(a_slots[:, None] * size + draws),
+                           np.ravel(b_slots[:, None] * size + draws))
+        a_cells, b_cells = cells[size]
+        rng = np.random.default_rng(seed)
+        outcomes = rng.random((len(p_yes), size), dtype=np.float32) < p_yes[:, None]
+        # Each YES adds its swing to party A and takes it from party B;
+        # the sums are exact, being whole numbers far below 2**53
+        yes = np.ravel(outcomes * swings[:, None]).astype(np.float64)
+        pnls = (np.bincount(a_cells, weights=yes, minlength=users * size)
+                - np.bincount(b_cells, weights=yes, minlength=users * size))
+        pnls = np.rint(pnls).astype(np.int64).reshape(users, size) + shifts[:, None]
+        counts += np.bincount(pnls.ravel(), minlength=bins)
+    return counts
+
+
+def _quantiles(tally, values, quantiles, draws):
+    """Exact quantiles of a tallied sample (the smallest value whose
+    cumulative count reaches q × draws)."""
+    cumulative = np.cumsum(tally)
+    targets = np.maximum(np.ceil(np.array(quantiles) * draws), 1)
+    return values[np.searchsorted(cumulative, targets)].tolist()
+
+
+def _validate(probabilities, draws, seed, quantiles, default_probability, max_draws):
+    """Raise SimulationError unless the simulation arguments make sense."""
+    if not isinstance(draws, int) or isinstance(draws, bool) or not 1 <= draws <= max_draws:
+        raise SimulationError(f"draws must be an integer between 1 and {max_draws}")
+    if not isinstance(seed, int) or isinstance(seed, bool) or seed < 0:
+        raise SimulationError("seed must be a non-negative integer")
+    if not quantiles or not all(_is_probability(q) for q in quantiles):
+        raise SimulationError("quantiles must be numbers between 0 and 1")
+    if default_probability is not None and not _is_probability(default_probability):
+        raise SimulationError("default_probability must be between 0 and 1")
+    if not all(_is_probability(p) for p in probabilities.values()):
+        raise SimulationError("probabilities must be between 0 and 1")
+
+
+def _is_probability(value):
+    return (isinstance(value, (int, float)) and not isinstance(value, bool)
+            and 0 <= value <= 1)
@@ -1,24 +1,86 @@
 """Database operations for Minimarbles."""
 
+import numpy as np
+from flask import current_app
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.orm import aliased
+
 from app import db
-from app.models import User, BinaryTrade, UnderlyingTrade
-from app.logic import calculate_binary_payout, calculate_underlying_payout
+from app.ledger import checkpoint_balances, record_entries
+from app.models import User, Trade, BinaryTrade, UnderlyingTrade, utcnow
+from app.signals import trades_created, trades_settled, user_created
+from app.versions import (
+    CHANGES_VERSION,
+    TRADES_VERSION,
+    USERS_VERSION,
+    bump_version,
+    get_version,
+    next_change_seq,
+)
+from app.logic import (
+    calculate_binary_payout,
+    calculate_binary_payouts,
+    calculate_underlying_payout,
+    calculate_underlying_payouts,
+    net_pnl_by_user,
+)
+
+
+# Page sizes for list_trades_page
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows fetched from the database per round trip when streaming exports
+EXPORT_BATCH_SIZE = 1000
+
+# Columns every row staged by add_trades carries, so one INSERT fits all
+_TRADE_COLUMNS = (
+    'type', 'first_party_id', 'second_party_id', 'description', 'status',
+    'stake_a', 'stake_b', 'outcome', 'lot_size', 'trade_price', 'settlement_price',
+    'underlying',
+)
+
+
+class InsufficientBalanceError(Exception):
+    """Raised when a user can't cover a stake from their unreserved balance.
+
+    Attributes:
+        user_id: The user who is short
+        stake: The amount they tried to put at risk
+    """
+
+    def __init__(self, user_id, stake):
+        super().__init__(f"user {user_id} cannot cover a stake of {stake}")
+        self.user_id = user_id
+        self.stake = stake
+
+
+class SettlementError(Exception):
+    """Raised when one or more trades in a settlement cannot be settled.
+
+    Attributes:
+        errors: List of dicts, each with the 'id' of the offending trade
+            and an 'error' message explaining why it was rejected
+    """
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} trade(s) could not be settled")
+        self.errors = errors
 
 
 def create_user(name):
     """
     Create a new user with the default starting balance.
 
+    The starting balance is recorded as the user's opening ledger entry.
+
     Args:
         name: The user's display name
 
     Returns:
         The created User object (with id populated)
     """
-    user = User(name=name)
-    db.session.add(user)
-    db.session.commit()
-    return user
+    return _commit_insert(User, lambda: _add_user(name), on_commit=_announce_user)
 
 
 def create_binary_trade(party_a_id, party_b_id, stake_a, stake_b, description):
@@ -26,7 +88,9 @@ def create_binary_trade(party_a_id, party_b_id, stake_a, stake_b, description):
     Create a new binary trade with open status.
 
     A binary trade is a yes/no bet between two users with potentially
-    asymmetric stakes.
+    asymmetric stakes. Each party's stake is reserved out of their balance
+    until the trade settles, and neither may stake more than their
+    balance minus what they already have reserved.
 
     Args:
         party_a_id: User ID of party A (wins if outcome is YES)
@@ -37,22 +101,18 @@ def create_binary_trade(party_a_id, party_b_id, stake_a, stake_b, description):
 
     Returns:
         The created BinaryTrade object (with id populated)
+
+    Raises:
+        ValueError: If either stake isn't positive
+        InsufficientBalanceError: If either party can't cover their stake
     """
-    trade = BinaryTrade(
-        party_a_id=party_a_id,
-        party_b_id=party_b_id,
-        stake_a=stake_a,
-        stake_b=stake_b,
-        description=description,
-        status="open",
-        outcome=None
-    )
-    db.session.add(trade)
-    db.session.commit()
-    return trade
+    return _commit_insert(BinaryTrade, lambda: _add_binary_trade(
+        party_a_id, party_b_id, stake_a, stake_b, description
+    ), on_commit=_announce_trade)
 
 
-def create_underlying_trade(long_party_id, short_party_id, lot_size, trade_price, description):
+def create_underlying_trade(long_party_id, short_party_id, lot_size, trade_price, description,
+                            underlying=None):
     """
     Create a new underlying trade with open status.
 
@@ -65,121 +125,757 @@ def create_underlying_trade(long_party_id, short_party_id, lot_size, trade_price
         lot_size: Number of units traded (can be fractional)
         trade_price: Price at which the trade is entered
         description: Description of what the trade is based on
+        underlying: Symbol the trade is marked by (e.g. 'AAPL'); defaults
+            to the description
 
     Returns:
         The created UnderlyingTrade object (with id populated)
     """
+    return _commit_insert(UnderlyingTrade, lambda: _add_underlying_trade(
+        long_party_id, short_party_id, lot_size, trade_price, description,
+        underlying if underlying is not None else description,
+    ), on_commit=_announce_trade)
+
+
+def _commit_insert(model, add, on_commit=None):
+    """
+    Run add() and make the row it stages durable.
+
+    With group commit enabled (see app.group_commit) the writer thread runs
+    add() and commits it together with other callers' rows, and this call
+    blocks until that commit is done. Otherwise it commits right here.
+
+    Args:
+        model: The model class of the staged row
+        add: Callable that stages one row in db.session (flushed, no
+            commit) and returns it
+        on_commit: Optional callable run with the new row's id after commit
+
+    Returns:
+        The created row, as an object in the caller's session
+    """
+    committer = current_app.extensions.get('group_commit')
+    if committer is not None:
+        row_id = committer.submit(lambda: add().id, on_commit=on_commit)
+        return db.session.get(model, row_id)
+
+    try:
+        row = add()
+    except Exception:
+        db.session.rollback()
+        raise
+    # Read before commit expires the row, so the hook doesn't reload it
+    row_id = row.id
+    db.session.commit()
+    if on_commit is not None:
+        on_commit(row_id)
+    return row
+
+
+def _add_user(name):
+    """Stage a new user and their opening ledger entry (no commit)."""
+    user = User(name=name, change_seq=next_change_seq())
+    db.session.add(user)
+    db.session.flush()  # assigns the id and default balance
+    record_entries([{'user_id': user.id, 'delta': user.balance}])
+    bump_version(USERS_VERSION)
+    return user
+
+
+def _announce_user(user_id):
+    """Signal that a user has been created and committed."""
+    user_created.send(current_app._get_current_object(), user_id=user_id)
+
+
+def _announce_trade(trade_id):
+    """Signal that a trade has been created and committed."""
+    trades_created.send(current_app._get_current_object(), trade_ids=[trade_id])
+
+
+def _add_binary_trade(party_a_id, party_b_id, stake_a, stake_b, description):
+    """Stage a new open binary trade and reserve both stakes (no commit)."""
+    # A negative stake would lower the party's reservation and let them
+    # commit more than their balance elsewhere
+    for stake in (stake_a, stake_b):
+        if not stake > 0:
+            raise ValueError(f"stakes must be positive, got {stake}")
+    reserve_stake(party_a_id, stake_a)
+    reserve_stake(party_b_id, stake_b)
+    trade = BinaryTrade(
+        party_a_id=party_a_id,
+        party_b_id=party_b_id,
+        stake_a=stake_a,
+        stake_b=stake_b,
+        description=description,
+        status="open",
+        outcome=None,
+        change_seq=next_change_seq(),
+    )
+    db.session.add(trade)
+    db.session.flush()
+    bump_version(TRADES_VERSION)
+    return trade
+
+
+def reserve_stake(user_id, stake):
+    """
+    Reserve stake out of a user's balance, or raise if they can't cover it.
+
+    The check and the reservation are one conditional UPDATE of the user's
+    row, so admission costs the same however many trades are open and two
+    concurrent trades can't both spend the same balance. Runs in the
+    current transaction (no commit).
+
+    Args:
+        user_id: The ID of the user
+        stake: The amount to hold out of their balance
+
+    Raises:
+        ValueError: If stake isn't positive
+        InsufficientBalanceError: If their unreserved balance is below stake
+    """
+    if not stake > 0:
+        raise ValueError(f"stake must be positive, got {stake}")
+    users = User.__table__
+    reserved = db.session.execute(
+        update(users)
+        .where(users.c.id == user_id, users.c.balance - users.c.reserved >= stake)
+        .values(reserved=users.c.reserved + stake)
+    ).rowcount
+    if not reserved:
+        raise InsufficientBalanceError(user_id, stake)
+
+
+def release_stake(user_id, amount):
+    """
+    Give back amount of a user's reserved balance (no commit).
+
+    Args:
+        user_id: The ID of the user
+        amount: The amount to release, e.g. the stake of a cancelled order
+    """
+    users = User.__table__
+    db.session.execute(
+        update(users)
+        .where(users.c.id == user_id)
+        .values(reserved=users.c.reserved - amount)
+    )
+
+
+def _add_underlying_trade(long_party_id, short_party_id, lot_size, trade_price, description,
+                          underlying):
+    """Stage a new open underlying trade (no commit)."""
     trade = UnderlyingTrade(
         long_party_id=long_party_id,
         short_party_id=short_party_id,
         lot_size=lot_size,
         trade_price=trade_price,
         description=description,
+        underlying=underlying,
         status="open",
-        settlement_price=None
+        settlement_price=None,
+        change_seq=next_change_seq(),
     )
     db.session.add(trade)
-    db.session.commit()
+    db.session.flush()
+    bump_version(TRADES_VERSION)
     return trade
 
 
+def add_trades(trades):
+    """
+    Stage many new open trades of either type with one INSERT (no commit).
+
+    This is the batch form of _add_binary_trade and _add_underlying_trade
+    for callers that create trades in bulk, such as the matching engine.
+    It reserves nothing: the caller must already hold every binary stake
+    in reserve (resting orders do).
+
+    Args:
+        trades: List of dicts of trade columns, each with its 'type' and
+            'first_party_id' / 'second_party_id'
+
+    Returns:
+        The new trades' ids, in the order given
+    """
+    if not trades:
+        return []
+    change_seq = next_change_seq()
+    rows = []
+    for trade in trades:
+        row = dict.fromkeys(_TRADE_COLUMNS)
+        row.update(trade, status='open', change_seq=change_seq)
+        rows.append(row)
+    table = Trade.__table__
+    trade_ids = db.session.execute(
+        insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    bump_version(TRADES_VERSION)
+    return trade_ids
+
+
 def settle_binary_trade(trade_id, outcome):
     """
     Settle a binary trade and update both users' balances.
 
+    The trade is claimed with a conditional UPDATE (only while it is still
+    open) and balances move with `balance = balance + delta` statements, so
+    concurrent settlements can neither settle a trade twice nor lose an
+    update to a shared user.
+
     Args:
         trade_id: The ID of the trade to settle
         outcome: True for YES (party A wins), False for NO (party B wins)
 
     Returns:
         The updated BinaryTrade object
+
+    Raises:
+        SettlementError: If the trade doesn't exist or isn't open
     """
-    trade = db.session.get(BinaryTrade, trade_id)
+    trades = Trade.__table__
+    change_seq = next_change_seq()
+    claimed = db.session.execute(
+        update(trades)
+        .where(trades.c.id == trade_id, trades.c.type == 'binary', trades.c.status == 'open')
+        .values(outcome=outcome, status='settled', settled_at=utcnow(), change_seq=change_seq)
+        .returning(
+            trades.c.first_party_id, trades.c.second_party_id,
+            trades.c.stake_a, trades.c.stake_b,
+        )
+    ).first()
+    if claimed is None:
+        _reject_settlement(BinaryTrade, trade_id)
+    party_a_id, party_b_id, stake_a, stake_b = claimed
 
     # Calculate P&L using the pure business logic function
-    party_a_pnl, party_b_pnl = calculate_binary_payout(
-        trade.stake_a, trade.stake_b, outcome
-    )
+    party_a_pnl, party_b_pnl = calculate_binary_payout(stake_a, stake_b, outcome)
 
-    # Update user balances
-    trade.party_a.balance += party_a_pnl
-    trade.party_b.balance += party_b_pnl
-
-    # Update trade status
-    trade.outcome = outcome
-    trade.status = "settled"
+    # Update user balances and release the stakes reserved at entry
+    legs = [(party_a_id, party_a_pnl), (party_b_id, party_b_pnl)]
+    released = {}
+    _add_releases(released, [party_a_id, party_b_id], [stake_a, stake_b])
+    _apply_balance_deltas(legs, change_seq, released)
+    _record_settlement('binary', trade_id, legs)
 
     db.session.commit()
-    return trade
+    _notify_settled([{'id': trade_id, 'type': 'binary'}], legs)
+    return db.session.get(BinaryTrade, trade_id)
 
 
 def settle_underlying_trade(trade_id, settlement_price):
     """
     Settle an underlying trade and update both users' balances.
 
+    Like settle_binary_trade, the trade is claimed with a conditional
+    UPDATE and balances move with atomic increments.
+
     Args:
         trade_id: The ID of the trade to settle
         settlement_price: The final price to settle the trade at
 
     Returns:
         The updated UnderlyingTrade object
+
+    Raises:
+        SettlementError: If the trade doesn't exist or isn't open
     """
-    trade = db.session.get(UnderlyingTrade, trade_id)
+    trades = Trade.__table__
+    change_seq = next_change_seq()
+    claimed = db.session.execute(
+        update(trades)
+        .where(trades.c.id == trade_id, trades.c.type == 'underlying',
+               trades.c.status == 'open')
+        .values(settlement_price=settlement_price, status='settled', settled_at=utcnow(),
+                change_seq=change_seq)
+        .returning(
+            trades.c.first_party_id, trades.c.second_party_id,
+            trades.c.lot_size, trades.c.trade_price,
+        )
+    ).first()
+    if claimed is None:
+        _reject_settlement(UnderlyingTrade, trade_id)
+    long_party_id, short_party_id, lot_size, trade_price = claimed
 
     # Calculate P&L using the pure business logic function
-    long_pnl, short_pnl = calculate_underlying_payout(
-        trade.lot_size, trade.trade_price, settlement_price
-    )
+    long_pnl, short_pnl = calculate_underlying_payout(lot_size, trade_price, settlement_price)
 
     # Update user balances
-    trade.long_party.balance += long_pnl
-    trade.short_party.balance += short_pnl
-
-    # Update trade status
-    trade.settlement_price = settlement_price
-    trade.status = "settled"
+    legs = [(long_party_id, long_pnl), (short_party_id, short_pnl)]
+    _apply_balance_deltas(legs, change_seq)
+    _record_settlement('underlying', trade_id, legs)
 
     db.session.commit()
-    return trade
+    _notify_settled([{'id': trade_id, 'type': 'underlying'}], legs)
+    return db.session.get(UnderlyingTrade, trade_id)
+
+
+def settle_trades_bulk(settlements):
+    """
+    Settle many binary and underlying trades in a single transaction.
+
+    Each settlement is a (trade_id, outcome_or_price) pair. A bool value
+    settles a binary trade (True for YES, False for NO); any other number
+    settles an underlying trade at that price.
+
+    The trades are loaded with one query per trade type, P&L is computed
+    with the vectorized payout kernels, and each affected user's balance is
+    updated once with their net P&L. The whole batch is all-or-nothing: if
+    any trade is missing, already settled or repeated, nothing is written.
+
+    Args:
+        settlements: Iterable of (trade_id, outcome_or_price) pairs
+
+    Returns:
+        A list of dicts with the 'id' and 'type' of each settled trade
+
+    Raises:
+        SettlementError: If any trade cannot be settled (see its 'errors')
+    """
+    binary = {}
+    underlying = {}
+    errors = []
+
+    for trade_id, value in settlements:
+        if isinstance(value, bool):
+            pending = binary
+        elif isinstance(value, (int, float)):
+            pending = underlying
+        else:
+            errors.append({'id': trade_id, 'error': 'invalid outcome or settlement price'})
+            continue
+
+        if trade_id in pending:
+            errors.append({'id': trade_id, 'error': 'trade appears more than once'})
+            continue
+        pending[trade_id] = value
+
+    binary_rows = _load_open_trades(BinaryTrade, binary, errors, (
+        BinaryTrade.party_a_id, BinaryTrade.party_b_id,
+        BinaryTrade.stake_a, BinaryTrade.stake_b,
+    ))
+    underlying_rows = _load_open_trades(UnderlyingTrade, underlying, errors, (
+        UnderlyingTrade.long_party_id, UnderlyingTrade.short_party_id,
+        UnderlyingTrade.lot_size, UnderlyingTrade.trade_price,
+    ))
+
+    if errors:
+        raise SettlementError(errors)
+
+    # Net every P&L leg per user so each balance is updated exactly once,
+    # but keep one ledger entry per leg so every trade stays auditable
+    deltas = {}
+    released = {}
+    entries = []
+    if binary_rows:
+        ids, party_a_ids, party_b_ids, stakes_a, stakes_b = zip(*binary_rows)
+        outcomes = [binary[trade_id] for trade_id in ids]
+        party_a_pnls, party_b_pnls = calculate_binary_payouts(
+            np.array(stakes_a), np.array(stakes_b), np.array(outcomes)
+        )
+        _add_net_deltas(deltas, party_a_ids + party_b_ids,
+                        np.concatenate([party_a_pnls, party_b_pnls]))
+        entries.extend(_ledger_legs('binary', ids, party_a_ids, party_a_pnls))
+        entries.extend(_ledger_legs('binary', ids, party_b_ids, party_b_pnls))
+        _add_releases(released, party_a_ids + party_b_ids, stakes_a + stakes_b)
+    if underlying_rows:
+        ids, long_ids, short_ids, lot_sizes, trade_prices = zip(*underlying_rows)
+        prices = [underlying[trade_id] for trade_id in ids]
+        long_pnls, short_pnls = calculate_underlying_payouts(
+            np.array(lot_sizes), np.array(trade_prices), np.array(prices)
+        )
+        _add_net_deltas(deltas, long_ids + short_ids,
+                        np.concatenate([long_pnls, short_pnls]))
+        entries.extend(_ledger_legs('underlying', ids, long_ids, long_pnls))
+        entries.extend(_ledger_legs('underlying', ids, short_ids, short_pnls))
+
+    trades = Trade.__table__
+    settled_at = utcnow()
+    try:
+        # Claim the trades first: a trade settled by someone else since we
+        # read it is no longer 'open', so fewer rows match and we back out
+        change_seq = next_change_seq()
+        claimed = 0
+        if binary:
+            claimed += db.session.execute(
+                update(trades)
+                .where(trades.c.id == bindparam('trade_id'), trades.c.type == 'binary',
+                       trades.c.status == 'open')
+                .values(outcome=bindparam('trade_outcome'), status='settled',
+                        settled_at=settled_at, change_seq=change_seq),
+                [{'trade_id': trade_id, 'trade_outcome': outcome}
+                 for trade_id, outcome in binary.items()],
+            ).rowcount
+        if underlying:
+            claimed += db.session.execute(
+                update(trades)
+                .where(trades.c.id == bindparam('trade_id'), trades.c.type == 'underlying',
+                       trades.c.status == 'open')
+                .values(settlement_price=bindparam('price'), status='settled',
+                        settled_at=settled_at, change_seq=change_seq),
+                [{'trade_id': trade_id, 'price': price}
+                 for trade_id, price in underlying.items()],
+            ).rowcount
+        if claimed != len(binary) + len(underlying):
+            db.session.rollback()
+            _load_open_trades(BinaryTrade, binary, errors, ())
+            _load_open_trades(UnderlyingTrade, underlying, errors, ())
+            raise SettlementError(errors)
+
+        _apply_balance_deltas(deltas.items(), change_seq, released)
+        record_entries(entries)
+        checkpoint_balances(list(deltas))
+        bump_version(USERS_VERSION)
+        bump_version(TRADES_VERSION)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    settled = (
+        [{'id': trade_id, 'type': 'binary'} for trade_id in binary]
+        + [{'id': trade_id, 'type': 'underlying'} for trade_id in underlying]
+    )
+    if settled:
+        _notify_settled(settled, deltas.items())
+    return settled
+
+
+def _load_open_trades(model, pending, errors, columns):
+    """Load (id, *columns) rows for the pending trade IDs in one query.
+
+    Missing or already-settled trades are appended to errors.
+    """
+    if not pending:
+        return []
+
+    rows = db.session.execute(
+        select(model.id, model.status, *columns).where(model.id.in_(pending))
+    ).all()
+
+    found = set()
+    open_rows = []
+    for trade_id, status, *values in rows:
+        found.add(trade_id)
+        if status != 'open':
+            errors.append({'id': trade_id, 'error': 'trade is not open'})
+        else:
+            open_rows.append((trade_id, *values))
+
+    for trade_id in pending:
+        if trade_id not in found:
+            errors.append({'id': trade_id, 'error': 'trade not found'})
+
+    return open_rows
+
+
+def _reject_settlement(model, trade_id):
+    """Roll back a failed trade claim and raise a SettlementError explaining it."""
+    db.session.rollback()
+    exists = db.session.execute(select(model.id).where(model.id == trade_id)).first()
+    error = 'trade is not open' if exists else 'trade not found'
+    raise SettlementError([{'id': trade_id, 'error': error}])
+
+
+def _apply_balance_deltas(legs, change_seq, released=None):
+    """
+    Add each (user_id, delta) to that user's balance in the database.
+
+    Uses `balance = balance + :delta` so the database does the arithmetic
+    under its own lock instead of a Python read-modify-write.
+
+    Args:
+        legs: Iterable of (user_id, delta) pairs, one per user
+        change_seq: The write's change sequence number, stamped on each user
+        released: Optional dict of user_id -> stake to take off that
+            user's reserved amount in the same statement
+    """
+    released = released or {}
+    params = [{'user_id': user_id, 'delta': delta, 'release': released.get(user_id, 0)}
+              for user_id, delta in legs]
+    if not params:
+        return
+    users = User.__table__
+    db.session.execute(
+        update(users)
+        .where(users.c.id == bindparam('user_id'))
+        .values(balance=users.c.balance + bindparam('delta'),
+                reserved=users.c.reserved - bindparam('release'),
+                change_seq=change_seq),
+        params,
+    )
+
+
+def _add_releases(released, user_ids, stakes):
+    """Add each user's settled stakes into the released dict."""
+    for user_id, stake in zip(user_ids, stakes):
+        released[user_id] = released.get(user_id, 0) + stake
+
+
+def _record_settlement(trade_type, trade_id, legs):
+    """Write ledger entries for one settled trade, checkpoint its users and
+    bump the data versions."""
+    record_entries([
+        {'user_id': user_id, 'delta': pnl, 'trade_type': trade_type, 'trade_id': trade_id}
+        for user_id, pnl in legs
+    ])
+    checkpoint_balances([user_id for user_id, _ in legs])
+    bump_version(USERS_VERSION)
+    bump_version(TRADES_VERSION)
+
+
+def _notify_settled(trades, legs):
+    """Tell signal receivers which trades settled and whose balances moved."""
+    trades_settled.send(
+        current_app._get_current_object(),
+        trades=trades,
+        user_ids=sorted({user_id for user_id, _ in legs}),
+    )
+
+
+def _ledger_legs(trade_type, trade_ids, user_ids, pnls):
+    """Build one ledger entry per (trade, user, pnl) leg of a batch."""
+    return [
+        {'user_id': user_id, 'delta': pnl, 'trade_type': trade_type, 'trade_id': trade_id}
+        for trade_id, user_id, pnl in zip(trade_ids, user_ids, pnls.tolist())
+    ]
+
+
+def _add_net_deltas(deltas, user_ids, pnls):
+    """Add per-user net P&L into the deltas dict as plain Python numbers."""
+    unique_ids, totals = net_pnl_by_user(user_ids, pnls)
+    for user_id, total in zip(unique_ids.tolist(), totals.tolist()):
+        deltas[user_id] = deltas.get(user_id, 0) + total
 
 
 def list_all_trades():
     """
-    List all trades (binary and underlying) in the database.
+    List all trades (binary and underlying) in the database, oldest first.
+
+    Every trade type lives in one table and party names are joined in by
+    the database, so this is a single query no matter how many trades
+    there are.
 
     Returns:
         A list of dicts, each representing a trade with a 'type' field
         indicating whether it's 'binary' or 'underlying'.
     """
-    trades = []
-
-    for t in BinaryTrade.query.all():
-        trades.append({
-            'id': t.id,
-            'type': 'binary',
-            'party_a': t.party_a.name,
-            'party_b': t.party_b.name,
-            'stake_a': t.stake_a,
-            'stake_b': t.stake_b,
-            'description': t.description,
-            'outcome': t.outcome,
-            'status': t.status,
-        })
-
-    for t in UnderlyingTrade.query.all():
-        trades.append({
-            'id': t.id,
-            'type': 'underlying',
-            'long_party': t.long_party.name,
-            'short_party': t.short_party.name,
-            'lot_size': t.lot_size,
-            'trade_price': t.trade_price,
-            'settlement_price': t.settlement_price,
-            'description': t.description,
-            'status': t.status,
-        })
-
-    return trades
+    return [_trade_dict(row) for row in db.session.execute(_trades_query())]
+
+
+def list_trades_by_id(trade_ids):
+    """
+    List the given trades (of any type) as dicts, in id order.
+
+    Args:
+        trade_ids: IDs of the trades to list; unknown ids are skipped
+
+    Returns:
+        A list of trade dicts, as from list_all_trades
+    """
+    trades = Trade.__table__
+    query = _trades_query().where(trades.c.id.in_(list(trade_ids)))
+    return [_trade_dict(row) for row in db.session.execute(query)]
+
+
+def list_recent_trades(limit=50, since=None, until=None):
+    """
+    List the most recently created trades of every type, newest first.
+
+    Runs as one query walking the created_at index backwards, so it reads
+    `limit` rows however large the table is.
+
+    Args:
+        limit: Maximum number of trades to return
+        since: Only return trades created at or after this datetime (UTC)
+        until: Only return trades created before this datetime (UTC)
+
+    Returns:
+        A list of dicts like list_all_trades returns
+    """
+    query = _trades_query().order_by(None).order_by(Trade.created_at.desc(), Trade.id.desc())
+    if since is not None:
+        query = query.where(Trade.created_at >= since)
+    if until is not None:
+        query = query.where(Trade.created_at < until)
+    return [_trade_dict(row) for row in db.session.execute(query.limit(limit))]
+
+
+def list_trades_page(limit=DEFAULT_PAGE_SIZE, after=None, trade_type=None,
+                     status=None, user_id=None, min_id=None, max_id=None):
+    """
+    List one page of trades using keyset (cursor) pagination.
+
+    Trades are ordered by id. Each page starts strictly after the cursor,
+    so it costs an index range scan of `limit` rows no matter how deep
+    into the history it is.
+
+    Args:
+        limit: Maximum number of trades to return
+        after: Cursor from a previous page's next_cursor, or None to start
+        trade_type: Only return 'binary' or 'underlying' trades
+        status: Only return trades with this status (e.g. 'open')
+        user_id: Only return trades where this user is either party
+        min_id: Only return trades with id >= min_id
+        max_id: Only return trades with id <= max_id
+
+    Returns:
+        Tuple of (trades, next_cursor). trades is a list of dicts like
+        list_all_trades returns; next_cursor is None on the last page.
+
+    Raises:
+        ValueError: If the cursor or trade_type is invalid
+    """
+    if trade_type not in (None, 'binary', 'underlying'):
+        raise ValueError(f"unknown trade type: {trade_type}")
+
+    query = _trades_query()
+    if after is not None:
+        query = query.where(Trade.id > parse_trade_cursor(after))
+    if trade_type is not None:
+        query = query.where(Trade.type == trade_type)
+    if status is not None:
+        query = query.where(Trade.status == status)
+    if user_id is not None:
+        query = query.where((Trade.first_party_id == user_id) | (Trade.second_party_id == user_id))
+    if min_id is not None:
+        query = query.where(Trade.id >= min_id)
+    if max_id is not None:
+        query = query.where(Trade.id <= max_id)
+
+    # One extra row tells us whether another page follows
+    rows = [_trade_dict(row) for row in db.session.execute(query.limit(limit + 1))]
+    trades = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit and trades:
+        next_cursor = str(trades[-1]['id'])
+    return trades, next_cursor
+
+
+def parse_trade_cursor(cursor):
+    """
+    Turn a trade page cursor back into the trade id it points after.
+
+    Args:
+        cursor: A next_cursor value returned by list_trades_page
+
+    Returns:
+        The trade id
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if not cursor.isdigit():
+        raise ValueError(f"invalid cursor: {cursor}")
+    return int(cursor)
+
+
+def iter_trades(batch_size=EXPORT_BATCH_SIZE):
+    """
+    Stream every trade, oldest first, without loading them all.
+
+    Rows are pulled from the database cursor batch_size at a time, so
+    memory use stays flat however many trades there are, and the first
+    trade is available as soon as the first batch arrives.
+
+    Args:
+        batch_size: Number of rows to fetch per round trip
+
+    Yields:
+        One dict per trade, with the same keys as list_all_trades
+    """
+    result = db.session.execute(_trades_query().execution_options(yield_per=batch_size))
+    for row in result:
+        yield _trade_dict(row)
+
+
+def iter_users(batch_size=EXPORT_BATCH_SIZE):
+    """
+    Stream every user without loading them all.
+
+    Args:
+        batch_size: Number of rows to fetch per round trip
+
+    Yields:
+        One dict per user with 'id', 'name' and 'balance'
+    """
+    query = select(User.id, User.name, User.balance).order_by(User.id)
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+    for row in result:
+        yield row._asdict()
+
+
+def _trades_query():
+    """
+    Build a SELECT of trades of every type as flat rows with party names joined in.
+
+    Type-specific columns are read straight off the shared table, so
+    selecting them doesn't restrict the query to that type. The parties
+    are outer-joined: a trade whose user row is missing is still listed,
+    with None for that party's name. Callers can
+    add their own filters, ordering and limits before executing, and turn
+    each row into a trade dict with _trade_dict.
+
+    Returns:
+        A SQLAlchemy Select ordered by trade id
+    """
+    trades = Trade.__table__
+    first_party = aliased(User)
+    second_party = aliased(User)
+    return (
+        select(
+            trades.c.id,
+            trades.c.type,
+            first_party.name.label('first_party'),
+            second_party.name.label('second_party'),
+            trades.c.stake_a,
+            trades.c.stake_b,
+            trades.c.outcome,
+            trades.c.lot_size,
+            trades.c.trade_price,
+            trades.c.settlement_price,
+            trades.c.underlying,
+            trades.c.description,
+            trades.c.status,
+            trades.c.created_at,
+            trades.c.settled_at,
+        )
+        .outerjoin(first_party, trades.c.first_party_id == first_party.id)
+        .outerjoin(second_party, trades.c.second_party_id == second_party.id)
+        .order_by(trades.c.id)
+    )
+
+
+def _trade_dict(row):
+    """Shape a _trades_query row into the dict for its trade type."""
+    if row.type == 'binary':
+        trade = {
+            'id': row.id,
+            'type': row.type,
+            'party_a': row.first_party,
+            'party_b': row.second_party,
+            'stake_a': row.stake_a,
+            'stake_b': row.stake_b,
+            'description': row.description,
+            'outcome': row.outcome,
+            'status': row.status,
+        }
+    else:
+        trade = {
+            'id': row.id,
+            'type': row.type,
+            'long_party': row.first_party,
+            'short_party': row.second_party,
+            'lot_size': row.lot_size,
+            'trade_price': row.trade_price,
+            'settlement_price': row.settlement_price,
+            'underlying': row.underlying,
+            'description': row.description,
+            'status': row.status,
+        }
+    trade['created_at'] = row.created_at.isoformat()
+    trade['settled_at'] = row.settled_at.isoformat() if row.settled_at else None
+    return trade
 
 
 def get_user_balance(user_id):
@@ -206,3 +902,63 @@ def list_all_users():
         A list of User objects with their current balances
     """
     return User.query.all()
+
+
+def list_users_by_id(user_ids):
+    """
+    List the given users as {'id', 'name', 'balance'} dicts, in id order.
+
+    Args:
+        user_ids: IDs of the users to list; unknown ids are skipped
+    """
+    rows = db.session.execute(
+        select(User.id, User.name, User.balance)
+        .where(User.id.in_(list(user_ids)))
+        .order_by(User.id)
+    )
+    return [row._asdict() for row in rows]
+
+
+def list_changes(since=0):
+    """
+    List the users and trades written after a point in the change sequence.
+
+    Every write stamps the users and trades it touches with the next
+    change sequence number, so a client that keeps the 'seq' of its last
+    call can ask for just what changed since then. Both queries are range
+    scans of the change_seq indexes, so they cost what changed, not the
+    size of the tables.
+
+    Rows are only returned up to the sequence number read at the start.
+    A write that commits while this runs is left for the next call, which
+    it is certain to be in, instead of being seen half-way.
+
+    Args:
+        since: 'seq' from a previous call, or 0 for everything
+
+    Returns:
+        Dict with 'seq', the sequence number to pass as since next time,
+        'users' as {'id', 'name', 'balance'} dicts and 'trades' as from
+        list_all_trades, each in the order they last changed
+    """
+    seq = get_version(CHANGES_VERSION)
+    if since >= seq:
+        return {'seq': seq, 'users': [], 'trades': []}
+
+    users = db.session.execute(
+        select(User.id, User.name, User.balance)
+        .where(User.change_seq > since, User.change_seq <= seq)
+        .order_by(User.change_seq, User.id)
+    )
+    trades = Trade.__table__
+    query = (
+        _trades_query()
+        .where(trades.c.change_seq > since, trades.c.change_seq <= seq)
+        .order_by(None)
+        .order_by(trades.c.change_seq, trades.c.id)
+    )
+    return {
+        'seq': seq,
+        'users': [row._asdict() for row in users],
+        'trades': [_trade_dict(row) for row in db.session.execute(query)],
+    }
@@ -0,0 +1,559 @@
+"""Resting bids and offers, matched in price-time priority.
+
+Orders are placed on a market: an underlying symbol, whose fills create
+underlying trades, or a binary question, whose fills create binary
+trades with the question as description. Each market's open orders sit
+in an OrderBook of two heaps; an incoming order fills against the best
+priced, then oldest, orders on the other side at their price, and
+whatever is left rests in the book.
+
+A binary order prices a contract whose two stakes add up to
+BINARY_CONTRACT minimarbles: a buy at 60 is YES staking 60 per contract
+against NO's 40, and a sell at 60 is NO staking 40 against YES's 60.
+The order's stake is reserved out of the user's balance while it rests,
+so a fill can always be paid for; the fill hands that reservation over
+to the binary trade it creates. Underlying orders, like underlying
+trades, reserve nothing.
+
+Orders, fills and trades are written in one transaction. Each write
+first bumps the 'orders' data version, which takes SQLite's write lock,
+so the MatchingEngine can tell whether another process has changed the
+book since its own last write and rebuilds from the open orders if so,
+as it does on first use after startup.
+"""
+
+import heapq
+import threading
+
+from flask import current_app
+from sqlalchemy import bindparam, func, insert, select, update
+
+from app import db
+from app.models import Order, User, utcnow
+from app.operations import add_trades, release_stake, reserve_stake
+from app.signals import trades_created
+from app.versions import ORDERS_VERSION, bump_version, get_version
+
+# A binary contract's YES and NO stakes add up to this many minimarbles
+BINARY_CONTRACT = 100
+
+MARKET_TYPES = ('binary', 'underlying')
+SIDES = ('buy', 'sell')
+
+# Longest market name per type (the underlying column is shorter)
+MAX_MARKET_LENGTH = {'binary': 500, 'underlying': 50}
+
+# Most orders POST /orders takes in one list body
+MAX_BATCH_ORDERS = 1000
+
+# Underlying quantities are fractional lots; remainders are rounded so
+# fills that add up to an order leave exactly nothing
+QUANTITY_DIGITS = 9
+
+
+class OrderError(ValueError):
+    """Raised when an order is malformed or can't be placed."""
+
+
+class RestingOrder:
+    """An open order in a book; remaining shrinks as it fills."""
+
+    __slots__ = ('id', 'user_id', 'side', 'price', 'remaining', 'live')
+
+    def __init__(self, order_id, user_id, side, price, remaining):
+        self.id = order_id
+        self.user_id = user_id
+        self.side = side
+        self.price = price
+        self.remaining = remaining
+        self.live = True
+
+
+class OrderBook:
+    """
+    One market's resting orders in price-time priority.
+
+    Bids and asks are heaps of (price key, id, order), so the best price
+    comes first and, within a price, the lowest (oldest) id. Filled and
+    cancelled orders are only marked dead and are dropped when they reach
+    the top of their heap, which keeps adding, cancelling and filling an
+    order O(log n).
+    """
+
+    def __init__(self, orders=()):
+        self._orders = {}
+        self._bids = []
+        self._asks = []
+        for order in orders:
+            self._orders[order.id] = order
+            self._heap(order.side).append(_entry(order))
+        heapq.heapify(self._bids)
+        heapq.heapify(self._asks)
+
+    def __len__(self):
+        """Number of orders resting in the book."""
+        return len(self._orders)
+
+    def __contains__(self, order_id):
+        return order_id in self._orders
+
+    def add(self, order):
+        """Rest an order in the book."""
+        self._orders[order.id] = order
+        heapq.heappush(self._heap(order.side), _entry(order))
+
+    def cancel(self, order_id):
+        """Take an order out of the book; return it, or None if it isn't there."""
+        order = self._orders.pop(order_id, None)
+        if order is not None:
+            order.live = False
+        return order
+
+    def match(self, side, price, quantity, user_id):
+        """
+        Fill an incoming order against the other side of the book.
+
+        Resting orders that cross the incoming limit price are filled
+        best price first, oldest first within a price, each at its own
+        price. A resting order from the same user is cancelled instead of
+        being filled, so nobody trades with themselves.
+
+        Args:
+            side: 'buy' or 'sell'
+            price: Limit price of the incoming order
+            quantity: Quantity of the incoming order
+            user_id: User placing the incoming order
+
+        Returns:
+            Tuple of (fills, cancelled, remaining): (resting order,
+            quantity) pairs in fill order, the user's own resting orders
+            that were cancelled, and the incoming quantity left unfilled
+        """
+        heap = self._asks if side == 'buy' else self._bids
+        fills = []
+        cancelled = []
+        while quantity > 0 and heap:
+            resting = heap[0][2]
+            if not resting.live:
+                heapq.heappop(heap)
+                continue
+            if resting.price > price if side == 'buy' else resting.price < price:
+                break
+            if resting.user_id == user_id:
+                heapq.heappop(heap)
+                cancelled.append(self.cancel(resting.id))
+                continue
+
+            filled = min(quantity, resting.remaining)
+            fills.append((resting, filled))
+            quantity = round(quantity - filled, QUANTITY_DIGITS)
+            resting.remaining = round(resting.remaining - filled, QUANTITY_DIGITS)
+            if resting.remaining <= 0:
+                heapq.heappop(heap)
+                self.cancel(resting.id)
+        return fills, cancelled, quantity
+
+    def depth(self):
+        """
+        Sum the resting orders at each price.
+
+        Returns:
+            Tuple of (bids, asks), best price first, each a list of dicts
+            with 'price', total 'quantity' and number of 'orders'
+        """
+        levels = {'buy': {}, 'sell': {}}
+        for order in self._orders.values():
+            level = levels[order.side].setdefault(order.price, [0, 0])
+            level[0] += order.remaining
+            level[1] += 1
+        return tuple(
+            [{'price': price, 'quantity': round(quantity, QUANTITY_DIGITS), 'orders': count}
+             for price, (quantity, count) in sorted(levels[side].items(),
+                                                    reverse=side == 'buy')]
+            for side in SIDES
+        )
+
+    def _heap(self, side):
+        return self._bids if side == 'buy' else self._asks
+
+
+class MatchingEngine:
+    """
+    Every market's OrderBook, kept in step with the order table.
+
+    Placing and cancelling hold one lock, so this process matches orders
+    one at a time in the order they arrive. A batch of orders is matched
+    in memory first and then written with a few executemany statements
+    (orders, fills' trades, touched resting orders), so a batch costs
+    about one transaction however many orders and fills it has. If a
+    write fails part way the transaction is rolled back and the books are
+    rebuilt before the next use, since matching already changed them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._books = {}
+        self._version = None  # 'orders' version the books match; None to rebuild
+
+    def place(self, orders):
+        """
+        Place orders one after another and commit them with their fills.
+
+        Args:
+            orders: List of validated (user_id, market_type, market, side,
+                price, quantity) tuples
+
+        Returns:
+            A list of dicts, one per order, with the 'order' as placed and
+            its 'fills' (trade_id, order_id of the resting order, price
+            and quantity)
+
+        Raises:
+            OrderError: If an order's user doesn't exist
+            InsufficientBalanceError: If a binary order's stake can't be
+                covered; nothing is placed
+        """
+        results = self._write(self._place, orders)
+        trade_ids = [fill['trade_id'] for result in results for fill in result['fills']]
+        if trade_ids:
+            trades_created.send(current_app._get_current_object(), trade_ids=trade_ids)
+        return results
+
+    def cancel(self, order_ids):
+        """
+        Cancel open orders and release whatever they reserved.
+
+        Args:
+            order_ids: IDs of the orders to cancel
+
+        Returns:
+            A list with, for each id, the cancelled order as a dict, or
+            None if there was no open order with that id
+        """
+        return self._write(self._cancel, order_ids)
+
+    def depth(self, market_type, market):
+        """
+        Sum one market's resting orders at each price.
+
+        Returns:
+            Tuple of (bids, asks), see OrderBook.depth
+        """
+        with self._lock:
+            version = get_version(ORDERS_VERSION)
+            if version != self._version:
+                self._load()
+                self._version = version
+            book = self._books.get((market_type, market))
+            return book.depth() if book is not None else ([], [])
+
+    def rebuild(self):
+        """Reload every book from the open orders in the database."""
+        with self._lock:
+            self._load()
+            self._version = get_version(ORDERS_VERSION)
+
+    def _write(self, fn, items):
+        """Run fn(items) in one transaction under the lock and commit it."""
+        with self._lock:
+            try:
+                # Bumping first takes SQLite's write lock, so nobody else
+                # can change the orders between the check below and commit
+                bump_version(ORDERS_VERSION)
+                version = get_version(ORDERS_VERSION)
+                if self._version != version - 1:
+                    self._load()
+                result = fn(items)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self._version = None
+                raise
+            self._version = version
+            return result
+
+    def _load(self):
+        table = Order.__table__
+        rows = db.session.execute(
+            select(table.c.id, table.c.user_id, table.c.market_type, table.c.market,
+                   table.c.side, table.c.price, table.c.remaining)
+            .where(table.c.status == 'open')
+            .order_by(table.c.id)
+        )
+        orders = {}
+        for row in rows:
+            orders.setdefault((row.market_type, row.market), []).append(RestingOrder(
+                row.id, row.user_id, row.side,
+                *_amounts(row.market_type, row.price, row.remaining),
+            ))
+        self._books = {market: OrderBook(resting) for market, resting in orders.items()}
+
+    def _place(self, orders):
+        user_ids = {order[0] for order in orders}
+        unknown = user_ids - set(db.session.execute(
+            select(User.id).where(User.id.in_(user_ids))
+        ).scalars())
+        if unknown:
+            raise OrderError(f"unknown users: {sorted(unknown)}")
+
+        # We hold the write lock, so ids can be handed out before inserting;
+        # orders need theirs to rest in the book and be filled within the batch
+        table = Order.__table__
+        next_id = (db.session.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+        now = utcnow()
+        placed = []
+        results = []
+        trades = []
+        touched = {}
+        for order_id, (user_id, market_type, market, side, price, quantity) in enumerate(
+                orders, start=next_id):
+            book = self._books.get((market_type, market))
+            if book is None:
+                book = self._books[(market_type, market)] = OrderBook()
+            fills, cancelled, remaining = book.match(side, price, quantity, user_id)
+
+            if market_type == 'binary':
+                _reserve_binary(user_id, side, price, quantity, fills, cancelled)
+            fill_dicts = []
+            for resting in cancelled:
+                touched[resting.id] = resting
+            for resting, filled in fills:
+                touched[resting.id] = resting
+                fill_dicts.append({'trade_id': len(trades), 'order_id': resting.id,
+                                   'price': resting.price, 'quantity': filled})
+                trades.append(_trade(market_type, market, side, user_id, resting, filled))
+
+            order = {
+                'id': order_id, 'user_id': user_id, 'market_type': market_type,
+                'market': market, 'side': side, 'price': price, 'quantity': quantity,
+                'remaining': remaining, 'status': 'open' if remaining > 0 else 'filled',
+                'created_at': now,
+            }
+            placed.append(order)
+            results.append({'order': _order_dict(order), 'fills': fill_dicts})
+            if remaining > 0:
+                book.add(RestingOrder(order_id, user_id, side, price, remaining))
+
+        trade_ids = add_trades(trades)
+        for result in results:
+            for fill in result['fills']:
+                fill['trade_id'] = trade_ids[fill['trade_id']]
+
+        db.session.execute(insert(table), placed)
+        # Orders placed earlier in the batch may have been filled since
+        if touched:
+            db.session.execute(
+                update(table)
+                .where(table.c.id == bindparam('order_id'))
+                .values(remaining=bindparam('order_remaining'),
+                        status=bindparam('order_status')),
+                [{'order_id': resting.id, 'order_remaining': resting.remaining,
+                  'order_status': _status(resting)} for resting in touched.values()],
+            )
+        return results
+
+    def _cancel(self, order_ids):
+        table = Order.__table__
+        rows = db.session.execute(
+            update(table)
+            .where(table.c.id.in_(order_ids), table.c.status == 'open')
+            .values(status='cancelled')
+            .returning(*table.c)
+        ).all()
+        for row in rows:
+            if row.market_type == 'binary':
+                price, remaining = _amounts('binary', row.price, row.remaining)
+                release_stake(row.user_id, _stake(row.side, price) * remaining)
+            book = self._books.get((row.market_type, row.market))
+            if book is not None:
+                book.cancel(row.id)
+        cancelled = {row.id: _order_dict(row) for row in rows}
+        return [cancelled.get(order_id) for order_id in order_ids]
+
+
+def init_orderbook(app):
+    """Attach a MatchingEngine to app; it loads the books on first use."""
+    app.extensions['orderbook'] = MatchingEngine()
+
+
+def place_order(user_id, market_type, market, side, price, quantity):
+    """
+    Place one order, filling it against the book as far as it crosses.
+
+    Args:
+        user_id: User placing the order
+        market_type: 'binary' or 'underlying'
+        market: Underlying symbol, or the binary question
+        side: 'buy' (long, or YES) or 'sell' (short, or NO)
+        price: Limit price; for binary orders a whole number of
+            minimarbles from 1 to BINARY_CONTRACT - 1 that YES stakes
+        quantity: Lots, or for binary orders a whole number of contracts
+
+    Returns:
+        Dict with the placed 'order' and its 'fills', see MatchingEngine.place
+
+    Raises:
+        OrderError: If the order is malformed or its user doesn't exist
+        InsufficientBalanceError: If a binary order's stake can't be covered
+    """
+    return place_orders([{
+        'user_id': user_id, 'type': market_type, 'market': market,
+        'side': side, 'price': price, 'quantity': quantity,
+    }])[0]
+
+
+def place_orders(orders):
+    """
+    Place many orders in one transaction, in list order.
+
+    The batch is all-or-nothing: if any order is malformed or can't be
+    covered, none is placed.
+
+    Args:
+        orders: List of dicts with 'user_id', 'type', 'market', 'side',
+            'price' and 'quantity', as for place_order
+
+    Returns:
+        A list of results, one per order, see place_order
+    """
+    validated = [_validate(i, order) for i, order in enumerate(orders)]
+    if not validated:
+        return []
+    return current_app.extensions['orderbook'].place(validated)
+
+
+def cancel_order(order_id):
+    """Cancel an open order; return it as a dict, or None if none is open."""
+    return cancel_orders([order_id])[0]
+
+
+def cancel_orders(order_ids):
+    """Cancel many open orders in one transaction, see MatchingEngine.cancel."""
+    if not order_ids:
+        return []
+    return current_app.extensions['orderbook'].cancel(list(order_ids))
+
+
+def get_order_book(market_type, market):
+    """
+    Return one market's depth: the resting quantity at each price.
+
+    Returns:
+        Dict with the 'type' and 'market' and its 'bids' and 'asks', best
+        price first, each level a dict of 'price', 'quantity' and 'orders'
+    """
+    bids, asks = current_app.extensions['orderbook'].depth(market_type, market)
+    return {'type': market_type, 'market': market, 'bids': bids, 'asks': asks}
+
+
+def _reserve_binary(user_id, side, price, quantity, fills, cancelled):
+    """
+    Reserve a binary order's stake at its limit price.
+
+    Resting orders already hold their stakes at their own price, which is
+    what their fills stake, so they hand over their reservation as is.
+    The incoming order gets back the difference on fills at a better
+    price than its limit, and the stakes of its user's own orders that
+    crossing it cancelled.
+    """
+    released = sum(_stake(resting.side, resting.price) * resting.remaining
+                   for resting in cancelled)
+    released += sum((_stake(side, price) - _stake(side, resting.price)) * filled
+                    for resting, filled in fills)
+    if released:
+        release_stake(user_id, released)
+    reserve_stake(user_id, _stake(side, price) * quantity)
+
+
+def _trade(market_type, market, side, user_id, resting, filled):
+    """The trade row for one fill, at the resting order's price."""
+    buyer, seller = (user_id, resting.user_id) if side == 'buy' else (resting.user_id, user_id)
+    trade = {'type': market_type, 'first_party_id': buyer, 'second_party_id': seller,
+             'description': market}
+    if market_type == 'underlying':
+        trade.update(lot_size=filled, trade_price=resting.price, underlying=market)
+    else:
+        trade.update(stake_a=resting.price * filled,
+                     stake_b=(BINARY_CONTRACT - resting.price) * filled)
+    return trade
+
+
+def _stake(side, price):
+    """Minimarbles one binary contract stakes on the given side at price."""
+    return price if side == 'buy' else BINARY_CONTRACT - price
+
+
+def _entry(order):
+    return (-order.price if order.side == 'buy' else order.price, order.id, order)
+
+
+def _amounts(market_type, price, quantity):
+    """Binary prices and quantities are whole numbers; the table stores floats."""
+    if market_type == 'binary':
+        return int(price), int(quantity)
+    return price, quantity
+
+
+def _status(resting):
+    if resting.live:
+        return 'open'
+    return 'filled' if resting.remaining <= 0 else 'cancelled'
+
+
+def _order_dict(order):
+    """Shape an order row (or the dict it was inserted from) for JSON."""
+    order = dict(order._mapping) if hasattr(order, '_mapping') else order
+    price, quantity = _amounts(order['market_type'], order['price'], order['quantity'])
+    return {
+        'id': order['id'],
+        'user_id': order['user_id'],
+        'type': order['market_type'],
+        'market': order['market'],
+        'side': order['side'],
+        'price': price,
+        'quantity': quantity,
+        'remaining': _amounts(order['market_type'], order['price'], order['remaining'])[1],
+        'status': order['status'],
+        'created_at': order['created_at'].isoformat(),
+    }
+
+
+def _validate(index, order):
+    """Check one order dict; return it as a tuple for MatchingEngine.place."""
+    if not isinstance(order, dict):
+        raise OrderError(f"order {index}: must be an object")
+    user_id, market_type, market, side, price, quantity = (order.get(key) for key in (
+        'user_id', 'type', 'market', 'side', 'price', 'quantity'))
+
+    if not _is_int(user_id):
+        raise OrderError(f"order {index}: user_id must be an integer")
+    if market_type not in MARKET_TYPES:
+        raise OrderError(f"order {index}: type must be 'binary' or 'underlying'")
+    if not isinstance(market, str) or not 0 < len(market) <= MAX_MARKET_LENGTH[market_type]:
+        raise OrderError(f"order {index}: market must be 1 to "
+                         f"{MAX_MARKET_LENGTH[market_type]} characters")
+    if side not in SIDES:
+        raise OrderError(f"order {index}: side must be 'buy' or 'sell'")
+
+    if market_type == 'binary':
+        if not _is_int(price) or not 0 < price < BINARY_CONTRACT:
+            raise OrderError(f"order {index}: binary price must be a whole number "
+                             f"from 1 to {BINARY_CONTRACT - 1}")
+        if not _is_int(quantity) or quantity <= 0:
+            raise OrderError(f"order {index}: binary quantity must be a positive whole number")
+    else:
+        if not _is_number(price) or price <= 0:
+            raise OrderError(f"order {index}: price must be a positive number")
+        if not _is_number(quantity) or quantity <= 0:
+            raise OrderError(f"order {index}: quantity must be a positive number")
+        price, quantity = float(price), round(float(quantity), QUANTITY_DIGITS)
+
+    return user_id, market_type, market, side, price, quantity
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
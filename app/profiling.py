@@ -0,0 +1,197 @@
+"""On-demand request profiling, stored in a bounded on-disk ring buffer.
+
+A request is profiled when it carries an X-Profile header equal to
+PROFILE_TOKEN, or when PROFILE_SAMPLE_RATE picks it at random. The
+handler then runs under cProfile, and every SQL statement it executes is
+traced with its duration. The results are written to PROFILE_DIR as
+<id>.prof (pstats format, e.g. for snakeviz) and <id>.json (request
+details and the SQL trace). Only the newest PROFILE_MAX_ENTRIES profiles
+are kept.
+
+A streamed response (such as the exports) is profiled until the server
+closes it, so the profile covers generating its body, and its files are
+written then rather than when the headers go out; the X-Profile-Id
+header names them up front.
+
+GET /debug/profiles lists the stored profiles and
+GET /debug/profiles/<file> downloads one; both require the same
+X-Profile token and are disabled unless PROFILE_TOKEN is set.
+"""
+
+import cProfile
+import hmac
+import json
+import os
+import random
+import time
+import uuid
+
+from flask import (
+    Blueprint,
+    abort,
+    current_app,
+    g,
+    jsonify,
+    request,
+    send_from_directory,
+)
+from sqlalchemy import event
+
+from app import db
+
+HEADER = 'X-Profile'
+
+bp = Blueprint('debug', __name__, url_prefix='/debug')
+
+
+def init_profiling(app):
+    """
+    Install the profiling hooks and /debug/profiles routes on app.
+
+    Config keys:
+        PROFILE_TOKEN: Secret for the X-Profile header (None disables it)
+        PROFILE_SAMPLE_RATE: Fraction of requests profiled at random (0.0)
+        PROFILE_DIR: Where profiles are stored (<instance>/profiles)
+        PROFILE_MAX_ENTRIES: How many profiles to keep (50)
+    """
+    app.config.setdefault('PROFILE_TOKEN', None)
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    app.config.setdefault('PROFILE_MAX_ENTRIES', 50)
+
+    if not app.config['PROFILE_TOKEN'] and not app.config['PROFILE_SAMPLE_RATE']:
+        return
+
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.register_blueprint(bp)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _start_statement)
+    event.listen(engine, 'after_cursor_execute', _end_statement)
+
+
+def _authorized():
+    """True if the request carries the configured profiling token."""
+    token = current_app.config['PROFILE_TOKEN']
+    supplied = request.headers.get(HEADER)
+    return bool(token and supplied) and hmac.compare_digest(supplied, token)
+
+
+def _start_profile():
+    rate = current_app.config['PROFILE_SAMPLE_RATE']
+    if request.blueprint == 'debug':
+        return
+    if not _authorized() and not (rate and random.random() < rate):
+        return
+
+    profiler = cProfile.Profile()
+    g.profile = {'profiler': profiler, 'sql': [], 'start': time.perf_counter()}
+    profiler.enable()
+
+
+def _finish_profile(response):
+    profile = g.get('profile')
+    if profile is None:
+        return response
+
+    # Time-first ids sort oldest to newest, which the ring buffer relies on
+    profile_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    details = {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+    }
+    directory = current_app.config['PROFILE_DIR']
+    keep = current_app.config['PROFILE_MAX_ENTRIES']
+
+    if response.is_streamed:
+        # The body is generated after this hook; g.profile stays so its
+        # SQL is traced too, and the profile is saved once it is sent
+        response.call_on_close(lambda: _save_profile(profile, details, directory, keep))
+    else:
+        g.pop('profile')
+        _save_profile(profile, details, directory, keep)
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def _save_profile(profile, details, directory, keep):
+    """Stop the profiler and write its stats and details to directory."""
+    profile['profiler'].disable()
+    duration = time.perf_counter() - profile['start']
+
+    os.makedirs(directory, exist_ok=True)
+    profile['profiler'].dump_stats(os.path.join(directory, f"{details['id']}.prof"))
+    with open(os.path.join(directory, f"{details['id']}.json"), 'w') as f:
+        json.dump({
+            **details,
+            'duration_s': duration,
+            'created': time.time(),
+            'sql': profile['sql'],
+        }, f)
+
+    _trim(directory, keep)
+
+
+def _trim(directory, keep):
+    """Delete the oldest profiles so at most keep remain."""
+    ids = sorted(name[:-len('.json')] for name in os.listdir(directory)
+                 if name.endswith('.json'))
+    for profile_id in ids[:-keep] if keep else ids:
+        for suffix in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    if g and 'profile' in g:
+        conn.info['profile_start'] = time.perf_counter()
+
+
+def _end_statement(conn, cursor, statement, parameters, context, executemany):
+    if g and 'profile' in g:
+        started = conn.info.pop('profile_start', None)
+        g.profile['sql'].append({
+            'statement': statement,
+            'executemany': executemany,
+            'seconds': time.perf_counter() - started if started else None,
+        })
+
+
+@bp.before_request
+def _require_token():
+    if not _authorized():
+        abort(404)
+
+
+@bp.route('/profiles')
+def list_profiles():
+    """List stored profiles, newest first, without their SQL traces."""
+    directory = current_app.config['PROFILE_DIR']
+    if not os.path.isdir(directory):
+        return jsonify([])
+
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(directory, name)) as f:
+            info = json.load(f)
+        info['sql_statements'] = len(info.pop('sql'))
+        info['files'] = [f"{info['id']}.prof", f"{info['id']}.json"]
+        profiles.append(info)
+    return jsonify(profiles)
+
+
+@bp.route('/profiles/<path:filename>')
+def download_profile(filename):
+    """Download a stored .prof or .json file."""
+    if not filename.endswith(('.prof', '.json')):
+        abort(404)
+    return send_from_directory(current_app.config['PROFILE_DIR'], filename, as_attachment=True)
@@ -0,0 +1,87 @@
+"""Reconciliation of maintained balances against the trades they summarise.
+
+Each user's reserved column is kept up to date by trade entry and
+settlement (and by resting binary orders), so the balance check at entry
+never has to sum open trades. reconcile_reserved recomputes it from the
+open binary trades and orders with one aggregate query and reports (and
+optionally repairs) any drift, e.g. from rows edited by hand or a
+database restored from before the column existed.
+
+Run it with `flask --app app reconcile-reserved [--fix]`.
+"""
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Integer, bindparam, case, cast, func, select, union_all, update
+
+from app import db
+from app.models import Order, Trade, User
+from app.orderbook import BINARY_CONTRACT
+
+
+def reconcile_reserved(fix=False):
+    """
+    Compare every user's reserved amount with their open binary stakes.
+
+    A user's open binary stakes are their side of each open binary trade
+    plus the stake of whatever is left of their open binary orders.
+
+    Args:
+        fix: If True, set each drifted user's reserved to the expected
+            amount and commit
+
+    Returns:
+        A list of dicts with 'user_id', the stored 'reserved' amount and
+        the 'expected' amount, one per user whose two amounts differ
+    """
+    trades = Trade.__table__
+    orders = Order.__table__
+    users = User.__table__
+    open_binary = (trades.c.type == 'binary', trades.c.status == 'open')
+    contract_stake = case((orders.c.side == 'buy', orders.c.price),
+                          else_=BINARY_CONTRACT - orders.c.price)
+    stakes = union_all(
+        select(trades.c.first_party_id.label('user_id'), trades.c.stake_a.label('stake'))
+        .where(*open_binary),
+        select(trades.c.second_party_id, trades.c.stake_b).where(*open_binary),
+        select(orders.c.user_id, cast(contract_stake * orders.c.remaining, Integer))
+        .where(orders.c.market_type == 'binary', orders.c.status == 'open'),
+    ).subquery()
+    expected = dict(db.session.execute(
+        select(stakes.c.user_id, func.sum(stakes.c.stake)).group_by(stakes.c.user_id)
+    ).all())
+
+    drift = [
+        {'user_id': user_id, 'reserved': reserved, 'expected': expected.get(user_id, 0)}
+        for user_id, reserved in db.session.execute(
+            select(users.c.id, users.c.reserved).order_by(users.c.id)
+        )
+        if reserved != expected.get(user_id, 0)
+    ]
+
+    if fix and drift:
+        # Only overwrite what was read, so a trade entered or settled
+        # meanwhile isn't clobbered; that user shows up again next run
+        db.session.execute(
+            update(users)
+            .where(users.c.id == bindparam('user_id'),
+                   users.c.reserved == bindparam('seen'))
+            .values(reserved=bindparam('expected_reserved')),
+            [{'user_id': row['user_id'], 'seen': row['reserved'],
+              'expected_reserved': row['expected']} for row in drift],
+        )
+        db.session.commit()
+    return drift
+
+
+@click.command('reconcile-reserved')
+@click.option('--fix', is_flag=True, help="Correct any drift that is found.")
+@with_appcontext
+def reconcile_reserved_command(fix):
+    """Check users' reserved amounts against their open binary trades and orders."""
+    drift = reconcile_reserved(fix=fix)
+    for row in drift:
+        click.echo(f"user {row['user_id']}: reserved {row['reserved']}, "
+                   f"expected {row['expected']}")
+    action = "Fixed" if fix else "Found"
+    click.echo(f"{action} drift for {len(drift)} user(s).")
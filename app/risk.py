@@ -0,0 +1,203 @@
+"""Price-shock scenario grids over open underlying trades.
+
+A scenario grid shocks each underlying's latest mark by a relative amount
+per scenario (e.g. -0.5 to +0.5 in 0.01 steps) and reports every user's
+P&L on their open underlying trades in each scenario.
+
+P&L is linear in lot size, so each user's trades on one underlying are
+first netted into a single position (net lot at its average entry
+price) and valued with calculate_underlying_payouts against every
+shocked price at once. The grid is then summed per user. Large grids are
+cut into chunks of whole users, which run in a process pool when more
+than one worker is configured.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from flask import current_app
+
+from app.logic import calculate_underlying_payouts
+
+
+class ScenarioError(ValueError):
+    """Raised when a shock grid is malformed."""
+
+
+def init_risk(app):
+    """
+    Set the scenario grid defaults on app.
+
+    Config keys:
+        RISK_MAX_SCENARIOS: Most scenarios one grid may have (1001)
+        RISK_CHUNK_CELLS: Position × scenario cells valued per chunk (1e6)
+        RISK_WORKERS: Processes used for large grids (os.cpu_count())
+        RISK_POOL_MIN_CELLS: Smallest grid sent to the pool (1e7 cells)
+    """
+    app.config.setdefault('RISK_MAX_SCENARIOS', 1001)
+    app.config.setdefault('RISK_CHUNK_CELLS', 1_000_000)
+    app.config.setdefault('RISK_WORKERS', os.cpu_count() or 1)
+    app.config.setdefault('RISK_POOL_MIN_CELLS', 10_000_000)
+
+
+def shock_matrix(shocks, symbols, max_scenarios):
+    """
+    Turn a shock specification into one row of relative shocks per symbol.
+
+    Args:
+        shocks: Either a list of shocks applied to every underlying, or a
+            dict mapping underlying to its own list; all lists must have
+            the same length and underlyings left out are not shocked
+        symbols: Underlyings in book order
+        max_scenarios: Upper bound on the number of scenarios
+
+    Returns:
+        Array of shape (len(symbols), scenarios)
+
+    Raises:
+        ScenarioError: If the specification is malformed
+    """
+    if isinstance(shocks, dict):
+        columns = list(shocks.values())
+    elif isinstance(shocks, list):
+        columns = [shocks]
+    else:
+        raise ScenarioError("shocks must be a list or an object of lists")
+
+    lengths = {len(column) if isinstance(column, list) else None for column in columns}
+    if len(lengths) != 1 or None in lengths:
+        raise ScenarioError("every list of shocks must have the same length")
+    scenarios = lengths.pop()
+    if not 1 <= scenarios <= max_scenarios:
+        raise ScenarioError(f"between 1 and {max_scenarios} scenarios are allowed")
+    if any(not isinstance(value, (int, float)) or isinstance(value, bool) or value < -1
+           for column in columns for value in column):
+        raise ScenarioError("shocks must be numbers no lower than -1")
+
+    if isinstance(shocks, list):
+        return np.tile(np.array(shocks, dtype=float), (len(symbols), 1))
+
+    matrix = np.zeros((len(symbols), scenarios))
+    for row, symbol in enumerate(symbols):
+        if symbol in shocks:
+            matrix[row] = shocks[symbol]
+    return matrix
+
+
+def scenario_grid(shocks):
+    """
+    Compute every user's P&L on open underlying trades under each scenario.
+
+    Scenario j prices each underlying at mark × (1 + shock[j]). Trades on
+    underlyings that have never been marked have no base price and are
+    left out (their symbols are listed in 'unmarked').
+
+    Args:
+        shocks: Shock specification, see shock_matrix
+
+    Returns:
+        Dict with 'user_ids', the matching rows of the 'pnl' matrix
+        (users × scenarios), the 'marks' each scenario was shocked from,
+        and the 'unmarked' underlyings
+
+    Raises:
+        ScenarioError: If the specification is malformed
+    """
+    config = current_app.config
+    positions = current_app.extensions['marks'].positions()
+    shocks = shock_matrix(shocks, positions.symbols, config['RISK_MAX_SCENARIOS'])
+    prices = positions.marks[:, None] * (1 + shocks)
+
+    slots, codes, lots, entry_prices = _net_positions(positions)
+    pnl = np.zeros((len(positions.user_ids), shocks.shape[1]))
+    if len(slots):
+        users, totals = _grid(slots, codes, lots, entry_prices, prices, config)
+        pnl[users] = totals
+
+    marked = ~np.isnan(positions.marks)
+    return {
+        'user_ids': positions.user_ids.tolist(),
+        'pnl': pnl,
+        'marks': {symbol: mark for symbol, mark, ok
+                  in zip(positions.symbols, positions.marks.tolist(), marked) if ok},
+        'unmarked': [symbol for symbol, ok in zip(positions.symbols, marked) if not ok],
+    }
+
+
+def _net_positions(positions):
+    """
+    Net every user's trades on each marked underlying into one position.
+
+    Returns:
+        Tuple of (user slots, underlying codes, net lots, entry prices)
+        arrays, one element per netted position, sorted by user slot. A
+        position whose lots cancel out has a zero lot and carries its
+        locked-in P&L (minus its net cost) in place of an entry price.
+    """
+    n_symbols = len(positions.symbols)
+    slots = np.concatenate([positions.long_slots, positions.short_slots])
+    codes = np.concatenate([positions.codes, positions.codes])
+    lots = np.concatenate([positions.lot_sizes, -positions.lot_sizes])
+    costs = lots * np.concatenate([positions.trade_prices, positions.trade_prices])
+
+    marked = ~np.isnan(positions.marks[codes])
+    keys, inverse = np.unique(slots[marked] * n_symbols + codes[marked], return_inverse=True)
+    # astype: bincount of an empty selection comes back as integers
+    net_lots = np.bincount(inverse, weights=lots[marked], minlength=len(keys)).astype(float)
+    net_costs = np.bincount(inverse, weights=costs[marked], minlength=len(keys)).astype(float)
+
+    flat = net_lots == 0
+    entry_prices = np.divide(net_costs, net_lots, out=-net_costs, where=~flat)
+    return keys // n_symbols, keys % n_symbols, net_lots, entry_prices
+
+
+def _grid(slots, codes, lots, entry_prices, prices, config):
+    """Value netted positions in chunks of whole users; return (users, totals)."""
+    scenarios = prices.shape[1]
+    users, starts = np.unique(slots, return_index=True)
+    bounds = np.append(starts, len(slots))
+
+    # Cut the positions into chunks of about RISK_CHUNK_CELLS cells, only
+    # ever between users so each chunk's sums are final
+    per_chunk = max(1, config['RISK_CHUNK_CELLS'] // scenarios)
+    chunks = []
+    first = 0
+    while first < len(users):
+        last = np.searchsorted(bounds, bounds[first] + per_chunk, side='right') - 1
+        last = min(max(last, first + 1), len(users))
+        lo, hi = bounds[first], bounds[last]
+        chunks.append((
+            lots[lo:hi], entry_prices[lo:hi], codes[lo:hi], prices, bounds[first:last] - lo,
+        ))
+        first = last
+
+    workers = config['RISK_WORKERS']
+    if workers > 1 and len(chunks) > 1 and len(slots) * scenarios >= config['RISK_POOL_MIN_CELLS']:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            totals = list(pool.map(_grid_chunk, *zip(*chunks)))
+    else:
+        totals = [_grid_chunk(*chunk) for chunk in chunks]
+    return users, np.concatenate(totals)
+
+
+def _grid_chunk(lots, entry_prices, codes, prices, user_starts):
+    """
+    Value one chunk of netted positions and sum them per user.
+
+    Args:
+        lots: Net lot of each position
+        entry_prices: Average entry price of each position (for a zero
+            lot, minus its net cost)
+        codes: Underlying of each position (a row of prices)
+        prices: Shocked prices, one row per underlying, one column per scenario
+        user_starts: Index of each user's first position in the chunk
+
+    Returns:
+        Array of shape (users in chunk, scenarios)
+    """
+    pnls, _ = calculate_underlying_payouts(lots[:, None], entry_prices[:, None], prices[codes])
+    flat = lots == 0
+    if flat.any():
+        pnls[flat] = entry_prices[flat, None]
+    return np.add.reduceat(pnls, user_starts, axis=0)
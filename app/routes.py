@@ -1,8 +1,49 @@
-from flask import Blueprint, jsonify, request
-from app.operations import list_all_users, list_all_trades, create_user
+import zlib
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from app.export import (
+    MIMETYPES,
+    TRADE_FIELDS,
+    USER_FIELDS,
+    csv_chunks,
+    ndjson_chunks,
+)
+from app.idempotency import idempotent
+from app.leaderboard import get_leaderboard
+from app.marks import get_unrealized, record_marks
+from app.montecarlo import DEFAULT_QUANTILES, SimulationError, simulate_balances
+from app.orderbook import (
+    MARKET_TYPES,
+    MAX_BATCH_ORDERS,
+    OrderError,
+    cancel_order,
+    get_order_book,
+    place_order,
+    place_orders,
+)
+from app.risk import ScenarioError, scenario_grid
+from app.stream import stream_events
+from app.operations import (
+    list_changes,
+    list_recent_trades,
+    list_trades_page,
+    create_user,
+    get_user_balance,
+    iter_trades,
+    iter_users,
+    settle_trades_bulk,
+    SettlementError,
+    InsufficientBalanceError,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+)
+from app.versions import CHANGES_VERSION, TRADES_VERSION, get_version
 
 bp = Blueprint('main', __name__)
 
+# Default number of trades served by GET /trades/recent
+RECENT_TRADES = 50
+
 
 @bp.route('/')
 def index():
@@ -12,21 +53,208 @@ def index():
 
 @bp.route('/users')
 def get_users():
-    """Return all users and their balances as JSON."""
-    users = list_all_users()
-    return jsonify([
-        {'id': user.id, 'name': user.name, 'balance': user.balance}
-        for user in users
-    ])
+    """
+    Return all users and their balances as JSON, highest balance first.
+
+    Supports conditional GET: the ETag changes whenever a user or balance
+    does, and a matching If-None-Match gets an empty 304.
+    """
+    version, payload = get_leaderboard()
+    etag = f"users-{version}"
+    if _etag_matches(etag):
+        return _not_modified(etag)
+
+    response = Response(payload, mimetype='application/json')
+    return _with_etag(response, etag)
 
 
 @bp.route('/trades')
 def get_trades():
-    """Return all trades (binary and underlying) as JSON."""
-    return jsonify(list_all_trades())
+    """
+    Return one page of trades (binary and underlying) as JSON.
+
+    Query parameters:
+        limit: Page size (default 100, at most 1000)
+        after: Cursor from the previous page's X-Next-Cursor header
+        type: 'binary' or 'underlying'
+        status: e.g. 'open' or 'settled'
+        user_id: Only trades where this user is either party
+        min_id, max_id: Inclusive trade id range
+
+    The X-Next-Cursor response header is set when another page follows.
+    Supports conditional GET like /users; the ETag covers the query string.
+    """
+    # One counter lookup decides whether the page could have changed
+    query = zlib.crc32(request.query_string)
+    etag = f"trades-{get_version(TRADES_VERSION)}-{query:08x}"
+    if _etag_matches(etag):
+        return _not_modified(etag)
+
+    try:
+        limit = _int_arg('limit', DEFAULT_PAGE_SIZE)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        trades, next_cursor = list_trades_page(
+            limit=limit,
+            after=request.args.get('after'),
+            trade_type=request.args.get('type'),
+            status=request.args.get('status'),
+            user_id=_int_arg('user_id'),
+            min_id=_int_arg('min_id'),
+            max_id=_int_arg('max_id'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = jsonify(trades)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return _with_etag(response, etag)
+
+
+@bp.route('/trades/recent')
+def get_recent_trades():
+    """
+    Return the latest trades of every type as JSON, newest first.
+
+    Query parameters:
+        limit: How many trades (default 50, at most 1000)
+
+    Supports conditional GET like /trades.
+    """
+    query = zlib.crc32(request.query_string)
+    etag = f"recent-{get_version(TRADES_VERSION)}-{query:08x}"
+    if _etag_matches(etag):
+        return _not_modified(etag)
+
+    try:
+        limit = _int_arg('limit', RECENT_TRADES)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return _with_etag(jsonify(list_recent_trades(limit)), etag)
+
+
+@bp.route('/changes')
+def get_changes():
+    """
+    Return the users and trades changed since a change sequence number.
+
+    Query parameters:
+        since: 'seq' from the previous response (default 0, everything)
+
+    The response is {'seq', 'users', 'trades'}; a client keeps seq and
+    sends it back next time to download only what changed meanwhile.
+    Supports conditional GET like /users.
+    """
+    etag = f"changes-{get_version(CHANGES_VERSION)}-{zlib.crc32(request.query_string):08x}"
+    if _etag_matches(etag):
+        return _not_modified(etag)
+
+    try:
+        since = _int_arg('since', 0)
+        if since < 0:
+            raise ValueError("since must not be negative")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return _with_etag(jsonify(list_changes(since)), etag)
+
+
+@bp.route('/stream')
+def stream():
+    """
+    Stream user and trade changes as Server-Sent Events.
+
+    Each event carries only the rows that changed (see app.stream); a
+    comment line is sent as a heartbeat while nothing happens.
+    """
+    broker = current_app.extensions['stream']
+    events = stream_events(broker, broker.subscribe(), current_app.config['STREAM_HEARTBEAT'])
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Tells nginx-style proxies not to buffer the stream
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@bp.route('/users/export')
+def export_users():
+    """Stream all users as ?format=ndjson (default) or ?format=csv."""
+    return _export('users', iter_users, USER_FIELDS)
+
+
+@bp.route('/trades/export')
+def export_trades():
+    """Stream all trades as ?format=ndjson (default) or ?format=csv."""
+    return _export('trades', iter_trades, TRADE_FIELDS)
+
+
+def _export(name, iter_rows, fields):
+    """Build a streaming export response in the requested format."""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in MIMETYPES:
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    if fmt == 'csv':
+        chunks = csv_chunks(iter_rows(), fields)
+    else:
+        chunks = ndjson_chunks(iter_rows())
+
+    # stream_with_context keeps the database session alive while streaming
+    response = Response(stream_with_context(chunks), mimetype=MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.{fmt}'
+    return response
+
+
+def _etag_matches(etag):
+    """
+    True if the request's If-None-Match names this ETag.
+
+    The comparison is weak, as HTTP specifies for If-None-Match, so the
+    weak ETag sent with a compressed body (see app.compression) matches.
+    """
+    return request.if_none_match.contains_weak(etag)
+
+
+def _not_modified(etag):
+    """
+    An empty 304 response carrying the ETag.
+
+    It repeats the ETag in the form the client sent back: weak if the
+    cached copy was a compressed body, as the 200 for it said.
+    """
+    weak = not request.if_none_match.contains(etag)
+    return _with_etag(Response(status=304), etag, weak=weak)
+
+
+def _with_etag(response, etag, weak=False):
+    """
+    Set the ETag and ask clients to revalidate before reusing it.
+
+    The ETag is strong unless weak is given, but app.compression turns it
+    weak when it compresses the body, so clients may send back either form.
+    """
+    response.set_etag(etag, weak=weak)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _int_arg(name, default=None):
+    """Read an integer query parameter, raising ValueError if malformed."""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer") from None
 
 
 @bp.route('/users', methods=['POST'])
+@idempotent
 def post_user():
     """Create a new user from JSON body with a 'name' field."""
     data = request.get_json()
@@ -36,3 +264,214 @@ def post_user():
 
     user = create_user(name)
     return jsonify({'id': user.id, 'name': user.name, 'balance': user.balance}), 201
+
+
+@bp.route('/trades/settle/batch', methods=['POST'])
+@idempotent
+def post_settle_batch():
+    """
+    Settle many trades at once from a JSON body like:
+
+        {"settlements": [{"id": 1, "outcome": true},
+                         {"id": 2, "settlement_price": 110.0}]}
+
+    Binary trades take a boolean 'outcome', underlying trades a numeric
+    'settlement_price'. Either every trade settles or none do.
+    """
+    data = request.get_json(silent=True)
+    entries = data.get('settlements') if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return jsonify({'error': 'settlements list is required'}), 400
+
+    settlements = []
+    errors = []
+    for entry in entries:
+        trade_id = entry.get('id') if isinstance(entry, dict) else None
+        if not isinstance(trade_id, int) or isinstance(trade_id, bool):
+            errors.append({'id': trade_id, 'error': 'id must be an integer'})
+            continue
+
+        outcome = entry.get('outcome')
+        price = entry.get('settlement_price')
+        if isinstance(outcome, bool) and price is None:
+            settlements.append((trade_id, outcome))
+        elif (outcome is None and isinstance(price, (int, float))
+                and not isinstance(price, bool)):
+            settlements.append((trade_id, float(price)))
+        else:
+            errors.append({
+                'id': trade_id,
+                'error': 'exactly one of outcome (bool) or settlement_price (number) is required',
+            })
+
+    if errors:
+        return jsonify({'error': 'invalid settlements', 'errors': errors}), 400
+
+    try:
+        settled = settle_trades_bulk(settlements)
+    except SettlementError as e:
+        return jsonify({'error': 'settlement failed', 'errors': e.errors}), 400
+
+    return jsonify({'settled': settled})
+
+
+@bp.route('/marks', methods=['POST'])
+@idempotent
+def post_marks():
+    """
+    Mark underlyings at new prices from a JSON body like:
+
+        {"marks": {"AAPL": 110.0, "MSFT": 402.5}}
+
+    Open underlying trades on those underlyings are revalued straight away.
+    """
+    data = request.get_json(silent=True)
+    marks = data.get('marks') if isinstance(data, dict) else None
+    if not isinstance(marks, dict) or not marks:
+        return jsonify({'error': 'marks object is required'}), 400
+
+    errors = [
+        {'underlying': symbol, 'error': 'price must be a number'}
+        for symbol, price in marks.items()
+        if not isinstance(price, (int, float)) or isinstance(price, bool)
+    ]
+    if errors:
+        return jsonify({'error': 'invalid marks', 'errors': errors}), 400
+
+    revalued = record_marks({symbol: float(price) for symbol, price in marks.items()})
+    return jsonify({'marked': sorted(marks), 'revalued': revalued})
+
+
+@bp.route('/orders', methods=['POST'])
+@idempotent
+def post_order():
+    """
+    Place a bid or offer from a JSON body like:
+
+        {"user_id": 1, "type": "underlying", "market": "AAPL",
+         "side": "buy", "price": 101.5, "quantity": 2}
+
+    It fills against the book as far as it crosses and the rest rests.
+    Binary orders price the YES stake of a 100-minimarble contract, e.g.
+    {"type": "binary", "market": "Rain tomorrow?", "side": "sell",
+    "price": 60, "quantity": 3} stakes 40 on NO per contract.
+
+    A list of up to MAX_BATCH_ORDERS such objects places them in order in
+    one transaction, all or nothing, and returns a list of results. Each
+    request costs a commit, so one order per request tops out at a few
+    hundred orders a second, while a batch of a thousand places over ten
+    thousand a second (see benchmarks/bench_orderbook.py).
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, list):
+        if not 0 < len(data) <= MAX_BATCH_ORDERS:
+            return jsonify({'error': f"send 1 to {MAX_BATCH_ORDERS} orders"}), 400
+    elif not isinstance(data, dict):
+        return jsonify({'error': 'JSON body is required'}), 400
+
+    try:
+        if isinstance(data, list):
+            result = place_orders(data)
+        else:
+            result = place_order(data.get('user_id'), data.get('type'), data.get('market'),
+                                 data.get('side'), data.get('price'), data.get('quantity'))
+    except (OrderError, InsufficientBalanceError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result), 201
+
+
+@bp.route('/orders/<int:order_id>', methods=['DELETE'])
+def delete_order(order_id):
+    """Cancel an open order."""
+    order = cancel_order(order_id)
+    if order is None:
+        return jsonify({'error': 'no open order with that id'}), 404
+    return jsonify(order)
+
+
+@bp.route('/orders/book')
+def get_book():
+    """
+    Return one market's resting quantity at each price, best first.
+
+    Query parameters:
+        type: 'binary' or 'underlying'
+        market: The underlying symbol or binary question
+    """
+    market_type = request.args.get('type')
+    market = request.args.get('market')
+    if market_type not in MARKET_TYPES or not market:
+        return jsonify({'error': 'type and market are required'}), 400
+    return jsonify(get_order_book(market_type, market))
+
+
+@bp.route('/users/<int:user_id>/unrealized')
+def get_user_unrealized(user_id):
+    """Return a user's unrealized P&L on open underlying trades at the latest marks."""
+    if get_user_balance(user_id) is None:
+        return jsonify({'error': 'user not found'}), 404
+    return jsonify(get_unrealized(user_id))
+
+
+@bp.route('/risk/scenarios', methods=['POST'])
+def post_risk_scenarios():
+    """
+    Return every user's P&L on open underlying trades under price shocks.
+
+    The JSON body shocks every underlying's latest mark by the same
+    relative amounts:
+
+        {"shocks": [-0.5, -0.49, ..., 0.5]}
+
+    or each underlying by its own (all lists the same length):
+
+        {"shocks": {"AAPL": [-0.1, 0.1], "MSFT": [-0.2, 0.2]}}
+
+    The response has one row of 'pnl' per entry in 'user_ids', one column
+    per scenario.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'shocks' not in data:
+        return jsonify({'error': 'shocks is required'}), 400
+
+    try:
+        grid = scenario_grid(data['shocks'])
+    except ScenarioError as e:
+        return jsonify({'error': str(e)}), 400
+
+    grid['pnl'] = grid['pnl'].tolist()
+    return jsonify(grid)
+
+
+@bp.route('/risk/montecarlo', methods=['POST'])
+def post_risk_montecarlo():
+    """
+    Simulate final balances from open binary trades, from a JSON body like:
+
+        {"probabilities": {"12": 0.6, "15": 0.2}, "draws": 1000000, "seed": 7}
+
+    Optional 'quantiles' (default 1%, 5%, 25%, 50%, 75%, 95%, 99%) and
+    'default_probability' (for open binary trades not listed) may be given.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'JSON body is required'}), 400
+
+    probabilities = data.get('probabilities', {})
+    if not isinstance(probabilities, dict) or not all(k.isdigit() for k in probabilities):
+        return jsonify({'error': 'probabilities must map trade ids to probabilities'}), 400
+    quantiles = data.get('quantiles', list(DEFAULT_QUANTILES))
+    if not isinstance(quantiles, list):
+        return jsonify({'error': 'quantiles must be a list'}), 400
+
+    try:
+        result = simulate_balances(
+            {int(trade_id): p for trade_id, p in probabilities.items()},
+            draws=data.get('draws'),
+            seed=data.get('seed'),
+            quantiles=quantiles,
+            default_probability=data.get('default_probability'),
+        )
+    except SimulationError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
@@ -0,0 +1,20 @@
+"""Signals sent by app.operations after a write has committed.
+
+Receivers get the Flask app as the sender, so per-app state (caches,
+subscribers) can be looked up in app.extensions.
+"""
+
+from blinker import Namespace
+
+_signals = Namespace()
+
+# Sent with user_id=<id> after create_user commits
+user_created = _signals.signal('user-created')
+
+# Sent with trade_ids=[...] after new trades commit, whether from
+# create_*_trade or from orders filled by the matching engine
+trades_created = _signals.signal('trades-created')
+
+# Sent with trades=[{'id', 'type'}, ...] and user_ids=[...] after any
+# settlement commits
+trades_settled = _signals.signal('trades-settled')
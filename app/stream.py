@@ -0,0 +1,170 @@
+"""Live feed of user and trade changes for GET /stream (Server-Sent Events).
+
+An EventBroker per process fans events out to every open stream. Events
+are published from the operation signals, i.e. only after a write has
+committed, and carry just the rows that changed:
+
+    user-created    {"users": [user]}
+    trades-created  {"trades": [trade, ...]}
+    trades-settled  {"trades": [trade, ...], "users": [user, ...]}
+
+where users are {'id', 'name', 'balance'} and trades are shaped as in
+GET /trades. Each event is queried and serialized once however many
+streams are open, and not at all when none are.
+
+A stream waits on a condition variable between events, so an idle one
+costs no CPU until the next event or heartbeat. A client that stops
+reading is disconnected once STREAM_MAX_PENDING events are queued for
+it, rather than letting its queue grow; EventSource reconnects on its
+own and can catch up from GET /users and GET /trades.
+
+The broker only sees writes made by its own process, so with several
+worker processes each stream only hears about its own worker's writes.
+"""
+
+import threading
+from collections import deque
+
+from app.operations import list_trades_by_id, list_users_by_id
+from app.signals import trades_created, trades_settled, user_created
+
+# Sent as an SSE comment so proxies and clients see the stream is alive
+HEARTBEAT = ': heartbeat\n\n'
+
+# Returned by Subscription.get once the subscriber has been dropped
+CLOSED = object()
+
+
+class Subscription:
+    """One stream's queue of formatted events waiting to be sent."""
+
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self.dropped = False
+        self._events = deque()
+        self._ready = threading.Condition()
+
+    def push(self, event):
+        """Queue an event; drop the subscriber if it has fallen too far behind."""
+        with self._ready:
+            if len(self._events) >= self.max_pending:
+                # It has missed events either way; free what it hasn't read
+                self.dropped = True
+                self._events.clear()
+            else:
+                self._events.append(event)
+            self._ready.notify()
+
+    def get(self, timeout):
+        """
+        Wait up to timeout seconds for the next event.
+
+        Returns:
+            The event text, None if nothing arrived in time, or CLOSED if
+            the subscriber was dropped
+        """
+        with self._ready:
+            if not self._events and not self.dropped:
+                self._ready.wait(timeout)
+            if self.dropped:
+                return CLOSED
+            return self._events.popleft() if self._events else None
+
+
+class EventBroker:
+    """In-process publish/subscribe of formatted SSE events."""
+
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def __len__(self):
+        """Number of open subscriptions."""
+        return len(self._subscriptions)
+
+    def subscribe(self):
+        """Open a new subscription; close it with unsubscribe."""
+        subscription = Subscription(self.max_pending)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, name, payload):
+        """
+        Send an event to every subscriber.
+
+        Args:
+            name: SSE event name, e.g. 'trades-created'
+            payload: JSON text of the event's data
+        """
+        event = f"event: {name}\ndata: {payload}\n\n"
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.push(event)
+
+
+def init_stream(app):
+    """
+    Attach an EventBroker to app.
+
+    Config keys:
+        STREAM_HEARTBEAT: Seconds between heartbeats on an idle stream (15)
+        STREAM_MAX_PENDING: Events queued for a slow client before it is
+            disconnected (100)
+    """
+    app.config.setdefault('STREAM_HEARTBEAT', 15.0)
+    app.config.setdefault('STREAM_MAX_PENDING', 100)
+    app.extensions['stream'] = EventBroker(app.config['STREAM_MAX_PENDING'])
+
+
+def stream_events(broker, subscription, heartbeat):
+    """
+    Yield the text of an SSE stream for one subscription until it is
+    dropped; unsubscribes when the generator is closed.
+
+    Args:
+        broker: The EventBroker the subscription came from
+        subscription: The stream's Subscription
+        heartbeat: Seconds of silence after which a heartbeat is sent
+    """
+    try:
+        # Sent straight away so the response starts before the first event
+        yield ': connected\n\n'
+        while True:
+            event = subscription.get(heartbeat)
+            if event is CLOSED:
+                return
+            yield HEARTBEAT if event is None else event
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def _publish(app, name, build):
+    """Build and publish an event, unless nobody is listening."""
+    broker = app.extensions.get('stream')
+    if broker is not None and len(broker):
+        broker.publish(name, app.json.dumps(build()))
+
+
+@user_created.connect
+def _on_user_created(app, user_id, **kwargs):
+    _publish(app, 'user-created', lambda: {'users': list_users_by_id([user_id])})
+
+
+@trades_created.connect
+def _on_trades_created(app, trade_ids, **kwargs):
+    _publish(app, 'trades-created', lambda: {'trades': list_trades_by_id(trade_ids)})
+
+
+@trades_settled.connect
+def _on_trades_settled(app, trades, user_ids, **kwargs):
+    _publish(app, 'trades-settled', lambda: {
+        'trades': list_trades_by_id([trade['id'] for trade in trades]),
+        'users': list_users_by_id(user_ids),
+    })
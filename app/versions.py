@@ -0,0 +1,92 @@
+"""Named data-version counters shared by every worker through the database."""
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from app import db
+from app.models import DataVersion
+
+# Counter names. 'users' moves whenever a user or balance changes,
+# 'trades' whenever a trade is created or settled, 'marks' whenever a
+# new price is marked, 'orders' whenever the order book changes.
+USERS_VERSION = 'users'
+TRADES_VERSION = 'trades'
+MARKS_VERSION = 'marks'
+ORDERS_VERSION = 'orders'
+
+# The global change sequence; see next_change_seq
+CHANGES_VERSION = 'changes'
+
+
+def bump_version(name):
+    """
+    Increment a data-version counter in the current transaction (no commit).
+
+    The bump commits (or rolls back) together with the write it describes,
+    so a reader never sees a new version without the new data.
+
+    Args:
+        name: Counter name, e.g. 'users'
+    """
+    db.session.execute(_bump_statement(name))
+
+
+def next_change_seq():
+    """
+    Take the next number of the global change sequence (no commit).
+
+    Every write to users or trades takes one and stamps it on the rows
+    it touches, as their change_seq. Like bump_version the number is
+    taken inside the write's transaction, which holds SQLite's write lock
+    until commit, so numbers become visible in the order they were taken.
+
+    Returns:
+        The new sequence number
+    """
+    table = DataVersion.__table__
+    return db.session.execute(
+        _bump_statement(CHANGES_VERSION).returning(table.c.version)
+    ).scalar_one()
+
+
+def _bump_statement(name):
+    """The upsert that adds one to a counter, creating it at 1."""
+    table = DataVersion.__table__
+    statement = insert(table).values(name=name, version=1)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={'version': table.c.version + 1},
+    )
+
+
+def get_version(name):
+    """
+    Read a data-version counter.
+
+    Args:
+        name: Counter name, e.g. 'users'
+
+    Returns:
+        The current version, or 0 if the counter has never been bumped
+    """
+    version = db.session.execute(
+        select(DataVersion.version).where(DataVersion.name == name)
+    ).scalar()
+    return version or 0
+
+
+def get_versions(*names):
+    """
+    Read several data-version counters with one query.
+
+    Args:
+        *names: Counter names, e.g. 'trades', 'marks'
+
+    Returns:
+        Tuple of the current versions in the order given, 0 for a counter
+        that has never been bumped
+    """
+    versions = dict(db.session.execute(
+        select(DataVersion.name, DataVersion.version).where(DataVersion.name.in_(names))
+    ).all())
+    return tuple(versions.get(name, 0) for name in names)
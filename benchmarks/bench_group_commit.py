@@ -0,0 +1,89 @@
+"""Compare concurrent insert throughput with and without group commit.
+
+Usage:
+    python -m benchmarks.bench_group_commit [--threads 16] [--ops 100] [--synchronous FULL]
+
+Each mode gets a fresh database file. Worker threads create users as
+fast as they can; the script prints one JSON object per mode with the
+throughput and how many commits were issued. Commits are counted from
+the statements SQLite itself runs (a trace on each DBAPI connection), so
+an implicit commit counts as much as an explicit one.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.operations import create_user
+
+
+def run_mode(group_commit, threads, ops, synchronous):
+    """Create threads × ops users concurrently and time it."""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'SQLITE_PRAGMAS': {'synchronous': synchronous},
+            'SQLITE_POOL_SIZE': threads + 1,
+            'GROUP_COMMIT': group_commit,
+        })
+        with app.app_context():
+            db.create_all()
+            commits = []
+
+            def trace(dbapi_connection, connection_record, connection_proxy):
+                dbapi_connection.set_trace_callback(
+                    lambda sql: sql.startswith('COMMIT') and commits.append(1))
+
+            event.listen(db.engine, 'checkout', trace)
+
+        def work(n):
+            with app.app_context():
+                for i in range(ops):
+                    create_user(f"user {n}-{i}")
+
+        workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        with app.app_context():
+            if group_commit:
+                app.extensions['group_commit'].stop()
+            db.engine.dispose()
+
+    total = threads * ops
+    return {
+        'benchmark': 'group_commit_inserts',
+        'group_commit': group_commit,
+        'synchronous': synchronous,
+        'threads': threads,
+        'inserts': total,
+        'commits': len(commits),
+        'seconds': round(elapsed, 4),
+        'inserts_per_second': round(total / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--ops', type=int, default=100, help='inserts per thread')
+    parser.add_argument('--synchronous', default='FULL',
+                        help='SQLite synchronous setting for both runs')
+    args = parser.parse_args()
+
+    for group_commit in (False, True):
+        print(json.dumps(run_mode(group_commit, args.threads, args.ops, args.synchronous)))
+
+
+if __name__ == '__main__':
+    main()
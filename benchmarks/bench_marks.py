@@ -0,0 +1,88 @@
+"""Time the mark-to-market book: a full load versus incremental re-marks.
+
+Usage:
+    python -m benchmarks.bench_marks [--users 1000] [--trades 100000] [--repeat 20]
+
+Builds a synthetic book (see benchmarks.datagen), then prints one JSON
+object per measurement: loading and valuing every open underlying trade,
+re-marking a single underlying, re-marking all of them, applying one new
+underlying trade, and reading one user's unrealized P&L.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from app import create_app, db
+from app.marks import MarkBook, record_marks
+from app.operations import create_underlying_trade
+from benchmarks.datagen import UNDERLYINGS, populate
+
+
+def timed(fn, repeat):
+    """Run fn repeat times; return the fastest run in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--trades', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}"})
+        with app.app_context():
+            db.create_all()
+            user_ids = populate(args.users, args.trades, settled_fraction=0.2)
+            record_marks({symbol: 100.0 for symbol in UNDERLYINGS})
+            book = app.extensions['marks']
+            positions = len(book)
+
+            def full_load():
+                fresh = MarkBook()
+                fresh.refresh()
+
+            tick = iter(range(1, 10 ** 9))
+
+            def remark_one():
+                record_marks({UNDERLYINGS[0]: 100.0 + next(tick)})
+
+            def remark_all():
+                step = next(tick)
+                record_marks({symbol: 100.0 + step for symbol in UNDERLYINGS})
+
+            def new_trade():
+                create_underlying_trade(user_ids[0], user_ids[1], 1, 100.0, "Bench",
+                                        underlying=UNDERLYINGS[0])
+                book.refresh()
+
+            results = {
+                'full_load': timed(full_load, args.repeat),
+                'remark_one_underlying': timed(remark_one, args.repeat),
+                'remark_all_underlyings': timed(remark_all, args.repeat),
+                'apply_new_trade': timed(new_trade, args.repeat),
+                'read_user_unrealized': timed(lambda: book.unrealized(user_ids[0]), args.repeat),
+            }
+            db.engine.dispose()
+
+    for name, seconds in results.items():
+        print(json.dumps({
+            'benchmark': f"marks_{name}",
+            'positions': positions,
+            'underlyings': len(UNDERLYINGS),
+            'best_s': round(seconds, 6),
+        }))
+
+
+if __name__ == '__main__':
+    main()
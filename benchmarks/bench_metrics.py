@@ -0,0 +1,74 @@
+"""Measure the overhead of request/SQL metrics on GET /users.
+
+Usage:
+    python -m benchmarks.bench_metrics [--users 100] [--requests 5000]
+
+Alternates blocks of GET /users through two test clients, one with
+METRICS_ENABLED off and one with it on, and prints JSON with the best
+per-request time of each and the relative overhead.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from app import create_app, db
+from benchmarks.datagen import populate
+
+
+def make_app(tmp, metrics_enabled, users):
+    """Create an app with its own populated database."""
+    name = 'on.db' if metrics_enabled else 'off.db'
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, name)}",
+        'METRICS_ENABLED': metrics_enabled,
+    })
+    with app.app_context():
+        db.create_all()
+        populate(users, 0)
+    return app
+
+
+def best_block(client, blocks, block_size):
+    """Fastest seconds per request over several blocks of requests."""
+    best = float('inf')
+    for _ in range(blocks):
+        start = time.perf_counter()
+        for _ in range(block_size):
+            client.get('/users')
+        best = min(best, (time.perf_counter() - start) / block_size)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    block_size = 250
+    rounds = max(1, args.requests // block_size)
+    with tempfile.TemporaryDirectory() as tmp:
+        clients = {
+            enabled: make_app(tmp, enabled, args.users).test_client()
+            for enabled in (False, True)
+        }
+        # Alternate short blocks so both modes see the same machine noise,
+        # and keep the best block of each
+        off = on = float('inf')
+        for _ in range(rounds):
+            off = min(off, best_block(clients[False], 1, block_size))
+            on = min(on, best_block(clients[True], 1, block_size))
+    print(json.dumps({
+        'benchmark': 'metrics_overhead_get_users',
+        'requests': args.requests,
+        'seconds_per_request_off': off,
+        'seconds_per_request_on': on,
+        'overhead': round((on - off) / off, 4),
+    }))
+
+
+if __name__ == '__main__':
+    main()
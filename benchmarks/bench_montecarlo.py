@@ -0,0 +1,59 @@
+"""Measure Monte Carlo throughput in draws per second.
+
+Usage:
+    python -m benchmarks.bench_montecarlo [--users 200] [--trades 1000] [--draws 1000000]
+
+Builds a book of open binary trades (see benchmarks.datagen) and prints
+one JSON object per run: in process, and across a process pool where
+more than one CPU is available.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from app import create_app, db
+from app.montecarlo import simulate_balances
+from benchmarks.datagen import populate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--trades', type=int, default=1000, help='open binary trades')
+    parser.add_argument('--draws', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    modes = [('in_process', 1)]
+    if (os.cpu_count() or 1) > 1:
+        modes.append(('process_pool', os.cpu_count()))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}"})
+        with app.app_context():
+            db.create_all()
+            # Every other generated trade is binary; keep them all open
+            populate(args.users, 2 * args.trades, settled_fraction=0.0)
+
+            for mode, workers in modes:
+                app.config.update(MONTECARLO_WORKERS=workers, MONTECARLO_POOL_MIN_CELLS=0)
+                start = time.perf_counter()
+                simulate_balances({}, draws=args.draws, seed=0, default_probability=0.5)
+                elapsed = time.perf_counter() - start
+                print(json.dumps({
+                    'benchmark': 'montecarlo_draws',
+                    'mode': mode,
+                    'workers': workers,
+                    'trades': args.trades,
+                    'users': args.users,
+                    'draws': args.draws,
+                    'seconds': round(elapsed, 3),
+                    'draws_per_second': round(args.draws / elapsed),
+                }))
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Time the order book: in-memory matching versus placing through the engine.
+
+Usage:
+    python -m benchmarks.bench_orderbook [--ops 200000] [--engine-ops 20000] [--batches 1 100 1000]
+
+Replays one random order flow (limit orders around a fixed mid price on
+several underlyings, with a share of them cancels) straight into
+OrderBook objects, which is the matching work alone, and then through
+place_orders / cancel_orders on a database file, one operation per
+transaction and in batches. Prints one JSON object per run with the
+operations per second and how many fills there were.
+
+The bare-book figure is the matching alone and no request gets near it:
+every place_orders call is a commit, so the batch-1 run is the ceiling
+for POST /orders with a single order per request, and the larger batches
+are what a list body of that many orders can reach.
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from app import create_app, db
+from app.operations import create_user
+from app.orderbook import OrderBook, RestingOrder, cancel_orders, place_orders
+
+USERS = 50
+
+
+def order_flow(ops, markets, cancel_ratio, seed=0):
+    """
+    Make a reproducible list of ('place', order) and ('cancel', n) steps.
+
+    A cancel names the n-th order placed so far, which may already be
+    filled or cancelled; either way it costs a lookup.
+    """
+    rng = random.Random(seed)
+    steps = []
+    placed = 0
+    for _ in range(ops):
+        if placed and rng.random() < cancel_ratio:
+            steps.append(('cancel', rng.randrange(placed)))
+            continue
+        steps.append(('place', {
+            'user_id': rng.randint(1, USERS),
+            'type': 'underlying',
+            'market': f"SYM{rng.randrange(markets)}",
+            'side': rng.choice(('buy', 'sell')),
+            'price': 100.0 + rng.randint(-20, 20) * 0.25,
+            'quantity': rng.randint(1, 10),
+        }))
+        placed += 1
+    return steps
+
+
+def run_books(steps):
+    """Replay the flow against bare OrderBooks; return (seconds, fills)."""
+    books = {}
+    fills = 0
+    order_ids = []
+    start = time.perf_counter()
+    for kind, step in steps:
+        if kind == 'cancel':
+            market, order_id = order_ids[step]
+            books[market].cancel(order_id)
+            continue
+        book = books.get(step['market'])
+        if book is None:
+            book = books[step['market']] = OrderBook()
+        matched, _, remaining = book.match(step['side'], step['price'], step['quantity'],
+                                           step['user_id'])
+        fills += len(matched)
+        order_id = len(order_ids) + 1
+        order_ids.append((step['market'], order_id))
+        if remaining > 0:
+            book.add(RestingOrder(order_id, step['user_id'], step['side'], step['price'],
+                                  remaining))
+    return time.perf_counter() - start, fills
+
+
+def run_engine(steps, batch):
+    """
+    Replay the flow through the engine on a fresh database file.
+
+    The steps are taken batch at a time: the batch's orders go to one
+    place_orders call and then its cancels to one cancel_orders call.
+    Returns (seconds, fills).
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}"})
+        with app.app_context():
+            db.create_all()
+            for i in range(USERS):
+                create_user(f"user{i}")
+
+            fills = 0
+            order_ids = []
+            start = time.perf_counter()
+            for first in range(0, len(steps), batch):
+                window = steps[first:first + batch]
+                for result in place_orders([step for kind, step in window if kind == 'place']):
+                    order_ids.append(result['order']['id'])
+                    fills += len(result['fills'])
+                cancel_orders([order_ids[step] for kind, step in window if kind == 'cancel'])
+            elapsed = time.perf_counter() - start
+            db.engine.dispose()
+    return elapsed, fills
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ops', type=int, default=200_000, help='operations for the bare books')
+    parser.add_argument('--engine-ops', type=int, default=20_000,
+                        help='operations for each engine run')
+    parser.add_argument('--markets', type=int, default=20)
+    parser.add_argument('--cancel-ratio', type=float, default=0.3)
+    parser.add_argument('--batches', type=int, nargs='+', default=[1, 100, 1000])
+    args = parser.parse_args()
+
+    runs = [('books', args.ops, None)] + [('engine', args.engine_ops, b) for b in args.batches]
+    for name, ops, batch in runs:
+        steps = order_flow(ops, args.markets, args.cancel_ratio)
+        if batch is None:
+            seconds, fills = run_books(steps)
+        else:
+            seconds, fills = run_engine(steps, batch)
+        print(json.dumps({
+            'benchmark': f"orderbook_{name}",
+            'batch': batch,
+            'ops': ops,
+            'fills': fills,
+            'seconds': round(seconds, 4),
+            'ops_per_second': round(ops / seconds, 1),
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Time a price-shock scenario grid over a large book of open trades.
+
+Usage:
+    python -m benchmarks.bench_risk [--users 1000] [--positions 100000] [--scenarios 101]
+
+Builds a book of open underlying trades (see benchmarks.datagen), marks
+every underlying, then prints one JSON object per run with the time to
+compute the users × scenarios grid in process and, where more than one
+CPU is available, across a process pool.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app import create_app, db
+from app.marks import record_marks
+from app.risk import scenario_grid
+from benchmarks.datagen import UNDERLYINGS, populate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--positions', type=int, default=100_000,
+                        help='open underlying trades in the book')
+    parser.add_argument('--scenarios', type=int, default=101)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    shocks = np.linspace(-0.5, 0.5, args.scenarios).tolist()
+    modes = [('in_process', 1)]
+    if (os.cpu_count() or 1) > 1:
+        modes.append(('process_pool', os.cpu_count()))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}"})
+        with app.app_context():
+            db.create_all()
+            # Half of datagen's trades are underlying; keep them all open
+            populate(args.users, 2 * args.positions, settled_fraction=0.0)
+            record_marks({symbol: 100.0 for symbol in UNDERLYINGS})
+            scenario_grid(shocks)  # load the book outside the timings
+
+            for mode, workers in modes:
+                app.config.update(RISK_WORKERS=workers, RISK_POOL_MIN_CELLS=0)
+                best = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    scenario_grid(shocks)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                print(json.dumps({
+                    'benchmark': 'risk_scenario_grid',
+                    'mode': mode,
+                    'workers': workers,
+                    'positions': args.positions,
+                    'scenarios': args.scenarios,
+                    'best_s': round(best, 4),
+                }))
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
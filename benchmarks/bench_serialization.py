@@ -0,0 +1,149 @@
+"""Compare the per-row cost of serializing GET /users and GET /trades.
+
+Usage:
+    python -m benchmarks.bench_serialization [--users 10000] [--trades 100000] [--repeat 5]
+
+On one populated database, times each endpoint's body three ways:
+
+    orm      ORM objects (and their party relationships) turned into dicts
+             and encoded by Flask's default provider, which sorts keys
+    stdlib   column tuples shaped into dicts, StdlibJSONProvider
+    orjson   column tuples shaped into dicts, OrjsonProvider (if installed)
+
+and, for the two providers, the whole request through the test client
+(GET /users with the leaderboard cache off, GET /trades one 1000-row
+page). Prints one JSON object per measurement with the best microseconds
+per row over --repeat runs, split into building the rows and encoding
+them where that applies.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+from app import create_app, db, jsonprovider
+from app.models import BinaryTrade, Trade, User
+from app.operations import MAX_PAGE_SIZE, _trade_dict, _trades_query
+from benchmarks.datagen import populate
+
+
+def best(fn, repeat):
+    """Run fn repeat times; return (fastest seconds, its last result)."""
+    fastest = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        fastest = min(fastest, time.perf_counter() - start)
+    return fastest, result
+
+
+def orm_users():
+    return [{'id': u.id, 'name': u.name, 'balance': u.balance}
+            for u in User.query.order_by(User.balance.desc(), User.id)]
+
+
+def orm_trades():
+    """Every trade as a dict, built from ORM objects and their relationships."""
+    trades = []
+    for trade in db.session.execute(select(Trade).order_by(Trade.id)).scalars():
+        if isinstance(trade, BinaryTrade):
+            trades.append({
+                'id': trade.id, 'type': trade.type, 'party_a': trade.party_a.name,
+                'party_b': trade.party_b.name, 'stake_a': trade.stake_a,
+                'stake_b': trade.stake_b, 'description': trade.description,
+                'outcome': trade.outcome, 'status': trade.status,
+            })
+        else:
+            trades.append({
+                'id': trade.id, 'type': trade.type, 'long_party': trade.long_party.name,
+                'short_party': trade.short_party.name, 'lot_size': trade.lot_size,
+                'trade_price': trade.trade_price, 'settlement_price': trade.settlement_price,
+                'underlying': trade.underlying, 'description': trade.description,
+                'status': trade.status,
+            })
+        trades[-1]['created_at'] = trade.created_at.isoformat()
+        trades[-1]['settled_at'] = trade.settled_at.isoformat() if trade.settled_at else None
+    db.session.expunge_all()
+    return trades
+
+
+def uncached_users(app, client):
+    """GET /users with the leaderboard forced to rebuild its payload."""
+    app.extensions['leaderboard']._version = None
+    return client.get('/users')
+
+
+def column_users():
+    rows = db.session.execute(
+        select(User.id, User.name, User.balance).order_by(User.balance.desc(), User.id))
+    return [row._asdict() for row in rows]
+
+
+def column_trades():
+    return [_trade_dict(row) for row in db.session.execute(_trades_query())]
+
+
+def record(endpoint, method, rows, build_s=None, encode_s=None, request_s=None):
+    result = {'benchmark': 'serialization', 'endpoint': endpoint, 'method': method, 'rows': rows}
+    for key, seconds in (('build', build_s), ('encode', encode_s), ('request', request_s)):
+        if seconds is not None:
+            result[f"{key}_us_per_row"] = round(seconds / rows * 1e6, 3)
+    if build_s is not None and encode_s is not None:
+        result['total_us_per_row'] = round((build_s + encode_s) / rows * 1e6, 3)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--trades', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    methods = ['stdlib'] + (['orjson'] if jsonprovider.orjson is not None else [])
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'JSON_PROVIDER': 'stdlib'})
+        with app.app_context():
+            db.create_all()
+            populate(args.users, args.trades)
+
+            flask_default = DefaultJSONProvider(app)
+            for endpoint, orm_build, column_build in (
+                    ('users', orm_users, column_users), ('trades', orm_trades, column_trades)):
+                build_s, rows = best(orm_build, args.repeat)
+                encode_s, _ = best(lambda: flask_default.dumps(rows), args.repeat)
+                record(endpoint, 'orm', len(rows), build_s, encode_s)
+
+                build_s, rows = best(column_build, args.repeat)
+                for method in methods:
+                    provider = jsonprovider.PROVIDERS[method](app)
+                    encode_s, _ = best(lambda: provider.dumps(rows), args.repeat)
+                    record(endpoint, method, len(rows), build_s, encode_s)
+            db.engine.dispose()
+
+        for method in methods:
+            app = create_app({
+                'SQLALCHEMY_DATABASE_URI': uri,
+                'JSON_PROVIDER': method,
+                'LEADERBOARD_CHECK_INTERVAL': 0,
+            })
+            with app.app_context():
+                client = app.test_client()
+                request_s, _ = best(lambda: uncached_users(app, client), args.repeat)
+                record('users', method, args.users, request_s=request_s)
+
+                path = f"/trades?limit={MAX_PAGE_SIZE}"
+                request_s, _ = best(lambda: client.get(path), args.repeat)
+                record('trades', method, MAX_PAGE_SIZE, request_s=request_s)
+                db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Compare mixed read/write throughput with and without the storage profile.
+
+Usage:
+    python -m benchmarks.bench_storage [--threads 4] [--ops 500] [--write-ratio 0.2]
+
+Each profile gets a fresh database file. Worker threads then run a mix of
+balance reads and trade create+settle writes, and the script prints one
+JSON object per profile with throughput and the number of operations that
+failed with "database is locked".
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from app import create_app, db
+from app.operations import (
+    create_user,
+    create_binary_trade,
+    get_user_balance,
+    settle_binary_trade,
+)
+
+USERS = 20
+
+
+def run_profile(profile, threads, ops, write_ratio):
+    """Run the mixed workload against a fresh database with one profile."""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'SQLITE_STORAGE_PROFILE': profile,
+        })
+        with app.app_context():
+            db.create_all()
+            users = [create_user(f"User {i}").id for i in range(USERS)]
+
+        locked = []
+
+        def work(seed):
+            rng = random.Random(seed)
+            failures = 0
+            with app.app_context():
+                for _ in range(ops):
+                    try:
+                        if rng.random() < write_ratio:
+                            a, b = rng.sample(users, 2)
+                            trade = create_binary_trade(a, b, 10, 5, "bench")
+                            settle_binary_trade(trade.id, rng.random() < 0.5)
+                        else:
+                            get_user_balance(rng.choice(users))
+                    except OperationalError:
+                        db.session.rollback()
+                        failures += 1
+            locked.append(failures)
+
+        workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        with app.app_context():
+            db.engine.dispose()
+
+    total = threads * ops
+    return {
+        'benchmark': 'storage_mixed',
+        'profile': profile,
+        'threads': threads,
+        'ops': total,
+        'write_ratio': write_ratio,
+        'seconds': round(elapsed, 4),
+        'ops_per_second': round(total / elapsed, 1),
+        'locked_errors': sum(locked),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=500, help='operations per thread')
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    args = parser.parse_args()
+
+    for profile in ('default', 'production'):
+        result = run_profile(profile, args.threads, args.ops, args.write_ratio)
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Compare two benchmark result files and flag regressions.
+
+Usage:
+    python -m benchmarks.compare baseline.json current.json [--threshold 0.2]
+
+A benchmark regresses when its mean time in current is more than
+threshold (a fraction, 0.2 = 20%) slower than in baseline. The script
+prints a table of every benchmark present in both files and exits with
+status 1 if anything regressed.
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(path):
+    """Load a results file into {(name, scale): mean_s}."""
+    with open(path) as f:
+        report = json.load(f)
+    return {(r['name'], r['scale']): r['mean_s'] for r in report['results']}
+
+
+def compare(baseline, current, threshold):
+    """
+    Compare two {(name, scale): mean_s} maps.
+
+    Returns:
+        List of (name, scale, baseline_s, current_s, change, regressed)
+        tuples for every benchmark present in both, where change is the
+        relative difference (positive means slower)
+    """
+    rows = []
+    for key in sorted(baseline.keys() & current.keys(), key=lambda k: (k[0], k[1])):
+        before, after = baseline[key], current[key]
+        change = (after - before) / before if before else 0.0
+        rows.append((key[0], key[1], before, after, change, change > threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    rows = compare(load(args.baseline), load(args.current), args.threshold)
+    for name, scale, before, after, change, regressed in rows:
+        flag = 'REGRESSION' if regressed else ''
+        print(f"{name:<30} {scale:>8} {before * 1e3:>10.3f}ms {after * 1e3:>10.3f}ms "
+              f"{change:>+8.1%} {flag}")
+
+    regressions = [row for row in rows if row[5]]
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
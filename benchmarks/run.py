@@ -0,0 +1,157 @@
+"""Microbenchmarks for operations, logic and routes at several data scales.
+
+Usage:
+    python -m benchmarks.run [--scales 1000 10000 100000] [--output results.json]
+
+For each scale a fresh database is filled with `scale` trades and
+`scale // 10` users by benchmarks.datagen, then every benchmark is timed.
+Results are written as JSON (to stdout, or --output) so runs can be
+compared with benchmarks.compare.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from app import create_app, db
+from app.logic import calculate_binary_payouts, calculate_underlying_payouts
+from app.models import BinaryTrade, UnderlyingTrade
+from app.operations import (
+    create_user,
+    create_binary_trade,
+    create_underlying_trade,
+    settle_binary_trade,
+    settle_underlying_trade,
+    list_all_trades,
+    list_all_users,
+)
+from benchmarks.datagen import populate
+
+DEFAULT_SCALES = [1_000, 10_000, 100_000]
+
+# Writes are timed per call over this many calls
+WRITE_CALLS = 50
+
+
+def time_calls(fn, calls):
+    """Run fn calls times; return per-call timings in seconds."""
+    timings = []
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(i)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(name, scale, timings):
+    """Reduce raw timings to one result record."""
+    return {
+        'name': name,
+        'scale': scale,
+        'calls': len(timings),
+        'mean_s': sum(timings) / len(timings),
+        'min_s': min(timings),
+        'max_s': max(timings),
+    }
+
+
+def run_scale(scale, repeat):
+    """Build a book of `scale` trades and time every benchmark against it."""
+    results = []
+    n_users = max(10, scale // 10)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        })
+        client = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+            user_ids = populate(n_users, scale)
+            a, b = user_ids[0], user_ids[1]
+
+            open_binary = [
+                trade.id for trade in
+                BinaryTrade.query.filter_by(status='open').limit(WRITE_CALLS)
+            ]
+            open_underlying = [
+                trade.id for trade in
+                UnderlyingTrade.query.filter_by(status='open').limit(WRITE_CALLS)
+            ]
+
+            def record(name, fn, calls):
+                db.session.expire_all()
+                results.append(summarize(name, scale, time_calls(fn, calls)))
+
+            record('create_user', lambda i: create_user(f"bench {i}"), WRITE_CALLS)
+            record('create_binary_trade',
+                   lambda i: create_binary_trade(a, b, 10, 5, "bench"), WRITE_CALLS)
+            record('create_underlying_trade',
+                   lambda i: create_underlying_trade(a, b, 1.0, 100.0, "bench"), WRITE_CALLS)
+            record('settle_binary_trade',
+                   lambda i: settle_binary_trade(open_binary[i], i % 2 == 0),
+                   len(open_binary))
+            record('settle_underlying_trade',
+                   lambda i: settle_underlying_trade(open_underlying[i], 100.0 + i),
+                   len(open_underlying))
+            record('list_all_trades', lambda i: list_all_trades(), repeat)
+            record('list_all_users', lambda i: list_all_users(), repeat)
+
+        results.append(summarize('GET /users', scale, time_calls(
+            lambda i: client.get('/users').get_data(), repeat)))
+        results.append(summarize('GET /trades', scale, time_calls(
+            lambda i: client.get('/trades').get_data(), repeat)))
+
+        rng = np.random.default_rng(0)
+        stakes = rng.integers(1, 100, size=scale)
+        outcomes = rng.random(scale) < 0.5
+        prices = rng.uniform(50, 150, size=scale)
+        results.append(summarize('calculate_binary_payouts', scale, time_calls(
+            lambda i: calculate_binary_payouts(stakes, stakes, outcomes), repeat)))
+        results.append(summarize('calculate_underlying_payouts', scale, time_calls(
+            lambda i: calculate_underlying_payouts(stakes, prices, prices[::-1]), repeat)))
+
+        with app.app_context():
+            db.engine.dispose()
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='calls per read benchmark')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    results = []
+    for scale in args.scales:
+        print(f"scale {scale}...", file=sys.stderr)
+        results.extend(run_scale(scale, args.repeat))
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+"""Fixtures shared by the test modules."""
+
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """
+    Return a factory for test apps on one database file per test.
+
+    Each call creates a separate app, as a separate worker process
+    would, on the same file; keyword arguments are extra config.
+    """
+    def make_app(**config):
+        return create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'minimarbles.db'}",
+            'TESTING': True,
+            **config,
+        })
+
+    return make_app
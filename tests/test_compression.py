@@ -0,0 +1,205 @@
+"""Tests for negotiated response compression."""
+
+import gzip
+import zlib
+
+import pytest
+
+from app import compression, create_app, db
+from app.compression import CompressionCache
+from app.operations import create_binary_trade, create_user
+
+needs_brotli = pytest.mark.skipif(compression.brotli is None, reason='brotli is not installed')
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+@pytest.fixture
+def app():
+    """Create a test Flask application with an in-memory database."""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'TESTING': True,
+        'STREAM_HEARTBEAT': 0.05,
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client for making HTTP requests."""
+    return app.test_client()
+
+
+@pytest.fixture
+def book(app):
+    """Enough users and trades for GET /users and /trades to pass the size threshold."""
+    alice = create_user("Alice").id
+    bob = create_user("Bob").id
+    for i in range(30):
+        create_user(f"User {i}")
+    for i in range(20):
+        create_binary_trade(alice, bob, 10, 5, f"Will it rain on day {i}?")
+
+
+def count_compressions(monkeypatch):
+    """Count calls to compression.compress, still compressing for real."""
+    calls = []
+    real = compression.compress
+
+    def counting(*args):
+        calls.append(args[1])
+        return real(*args)
+
+    monkeypatch.setattr(compression, 'compress', counting)
+    return calls
+
+
+class TestNegotiation:
+    """Tests for choosing whether and how to compress."""
+
+    def test_gzip_when_accepted(self, client, book):
+        """A large JSON body is gzipped and decodes to the identity body."""
+        plain = client.get('/trades')
+        response = client.get('/trades', headers=GZIP)
+
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert gzip.decompress(response.data) == plain.data
+        assert int(response.headers['Content-Length']) == len(response.data) < len(plain.data)
+
+    def test_identity_without_accept_encoding(self, client, book):
+        """Clients that don't ask get the plain body, still marked as varying."""
+        response = client.get('/trades')
+
+        assert 'Content-Encoding' not in response.headers
+        assert 'Accept-Encoding' in response.headers['Vary']
+
+    def test_refused_encoding(self, client, book):
+        """q=0 rules an encoding out."""
+        response = client.get('/trades', headers={'Accept-Encoding': 'gzip;q=0'})
+
+        assert 'Content-Encoding' not in response.headers
+
+    def test_small_body_is_left_alone(self, client, app):
+        """Bodies under COMPRESS_MIN_SIZE aren't worth compressing."""
+        create_user("Alice")
+
+        response = client.get('/users', headers=GZIP)
+
+        assert 'Content-Encoding' not in response.headers
+        assert response.get_json()[0]['name'] == 'Alice'
+
+    def test_other_mimetypes_are_left_alone(self, client):
+        """Only the configured mimetypes are compressed."""
+        response = client.get('/', headers=GZIP)
+
+        assert 'Content-Encoding' not in response.headers
+
+    @needs_brotli
+    def test_brotli_preferred(self, client, book):
+        """With brotli installed, a client accepting both gets br."""
+        response = client.get('/trades', headers={'Accept-Encoding': 'gzip, br'})
+
+        assert response.headers['Content-Encoding'] == 'br'
+        assert compression.brotli.decompress(response.data) == client.get('/trades').data
+
+    def test_disabled(self):
+        """COMPRESS_ENABLED=False turns the hook off."""
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+                          'COMPRESS_ENABLED': False})
+
+        with app.app_context():
+            db.create_all()
+            response = app.test_client().get('/trades', headers=GZIP)
+
+        assert 'compression' not in app.extensions
+        assert 'Vary' not in response.headers
+
+
+class TestCachedBodies:
+    """Compressed bodies are reused while the ETag is unchanged."""
+
+    def test_unchanged_payload_is_compressed_once(self, client, app, book, monkeypatch):
+        """Repeat downloads reuse the compressed body until the data changes."""
+        calls = count_compressions(monkeypatch)
+
+        first = client.get('/trades', headers=GZIP)
+        second = client.get('/trades', headers=GZIP)
+        assert calls == ['gzip']
+        assert second.data == first.data
+
+        create_binary_trade(1, 2, 1, 1, "One more")
+        third = client.get('/trades', headers=GZIP)
+        assert calls == ['gzip', 'gzip']
+        assert third.headers['ETag'] != first.headers['ETag']
+
+    @pytest.mark.parametrize('path', ['/users', '/trades'])
+    def test_compressed_etag_is_weak_and_revalidates(self, client, book, path):
+        """The compressed ETag is weak, and sending it back still gets a 304."""
+        first = client.get(path, headers=GZIP)
+        assert first.status_code == 200
+        assert first.headers['Content-Encoding'] == 'gzip'
+        etag = first.headers['ETag']
+        assert etag.startswith('W/')
+
+        response = client.get(path, headers={**GZIP, 'If-None-Match': etag})
+
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+
+    def test_cache_evicts_least_recently_used(self):
+        """The cache keeps its total size under max_bytes."""
+        cache = CompressionCache(max_bytes=10)
+        cache.put('a', b'1234')
+        cache.put('b', b'1234')
+        cache.get('a')
+        cache.put('c', b'1234')
+
+        assert cache.get('b') is None
+        assert cache.get('a') == cache.get('c') == b'1234'
+        assert cache.size == 8
+
+    def test_oversized_body_is_not_cached(self):
+        cache = CompressionCache(max_bytes=3)
+        cache.put('a', b'1234')
+
+        assert len(cache) == 0
+
+
+class TestStreamedResponses:
+    """Streaming responses are compressed chunk by chunk."""
+
+    def test_export_is_compressed_in_chunks(self, client, book):
+        """Each chunk of an NDJSON export decodes as soon as it arrives."""
+        plain = client.get('/trades/export').data
+        response = client.get('/trades/export', headers=GZIP, buffered=False)
+
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Content-Length' not in response.headers
+        decoder = zlib.decompressobj(31)
+        chunks = iter(response.response)
+        first = decoder.decompress(next(chunks))
+        assert first and plain.startswith(first)
+        rest = b''.join(decoder.decompress(chunk) for chunk in chunks)
+        assert first + rest == plain
+        response.close()
+
+    def test_event_stream_flushes_each_event(self, client, app):
+        """SSE events and heartbeats arrive decodable, and closing unsubscribes."""
+        broker = app.extensions['stream']
+        response = client.get('/stream', headers=GZIP, buffered=False)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        decoder = zlib.decompressobj(31)
+        chunks = iter(response.response)
+
+        assert decoder.decompress(next(chunks)) == b': connected\n\n'
+        create_user("Alice")
+        assert decoder.decompress(next(chunks)).startswith(b'event: user-created\n')
+
+        response.close()
+        assert len(broker) == 0
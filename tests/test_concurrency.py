@@ -0,0 +1,123 @@
+"""Stress tests for concurrent settlement."""
+
+import threading
+
+import pytest
+from app import create_app, db
+from app.ledger import verify_ledger
+from app.models import User, BinaryTrade, UnderlyingTrade
+from app.operations import (
+    create_user,
+    create_binary_trade,
+    create_underlying_trade,
+    settle_binary_trade,
+    settle_underlying_trade,
+    SettlementError,
+)
+
+USERS = 4
+TRADES_PER_TYPE = 40
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Create an app on a file database so threads get their own connections."""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'stress.db'}",
+        'TESTING': True,
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def book(app):
+    """Users trading in a ring, with binary and underlying trades between them."""
+    with app.app_context():
+        users = [create_user(f"User {i}").id for i in range(USERS)]
+        for i in range(TRADES_PER_TYPE):
+            a, b = users[i % USERS], users[(i + 1) % USERS]
+            create_binary_trade(a, b, 10 + i, 5 + i, f"bet {i}")
+            create_underlying_trade(a, b, 1.0 + i % 3, 100.0, f"price {i}")
+        return users
+
+
+def outcome_for(trade_id):
+    """Deterministic outcome so every worker settles a trade the same way."""
+    return trade_id % 3 != 0
+
+
+def price_for(trade_id):
+    """Deterministic settlement price."""
+    return 90.0 + trade_id % 7 * 5
+
+
+def run_workers(app, workers):
+    """Have every worker try to settle every trade; return successes per trade."""
+    successes = []
+    lock = threading.Lock()
+    errors = []
+
+    def work(offset):
+        try:
+            with app.app_context():
+                for i in range(2 * TRADES_PER_TYPE):
+                    # Start each worker at a different trade to maximise overlap;
+                    # only the settle call matching the trade's type can succeed
+                    trade_id = (i + offset) % (2 * TRADES_PER_TYPE) + 1
+                    for settle, value in ((settle_binary_trade, outcome_for(trade_id)),
+                                          (settle_underlying_trade, price_for(trade_id))):
+                        try:
+                            settle(trade_id, value)
+                        except SettlementError:
+                            continue
+                        with lock:
+                            successes.append((settle.__name__, trade_id))
+        except Exception as e:  # pragma: no cover - surfaced by the assert below
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(n * 7,)) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    return successes
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_concurrent_settlement_conserves_balances(app, book, workers):
+    """Racing workers settle each trade exactly once and lose no updates."""
+    successes = run_workers(app, workers)
+
+    # Every trade settled once and only once
+    assert len(successes) == 2 * TRADES_PER_TYPE
+    assert len(set(successes)) == len(successes)
+
+    with app.app_context():
+        db.session.expire_all()
+
+        # Expected balances from replaying the trades sequentially
+        expected = {user_id: 1000 for user_id in book}
+        for trade in BinaryTrade.query.all():
+            assert trade.status == 'settled'
+            if outcome_for(trade.id):
+                expected[trade.party_a_id] += trade.stake_b
+                expected[trade.party_b_id] -= trade.stake_b
+            else:
+                expected[trade.party_a_id] -= trade.stake_a
+                expected[trade.party_b_id] += trade.stake_a
+        for trade in UnderlyingTrade.query.all():
+            assert trade.status == 'settled'
+            pnl = trade.lot_size * (price_for(trade.id) - trade.trade_price)
+            expected[trade.long_party_id] += pnl
+            expected[trade.short_party_id] -= pnl
+
+        balances = {u.id: u.balance for u in User.query.all()}
+        assert balances == pytest.approx(expected)
+        assert sum(balances.values()) == pytest.approx(1000 * USERS)
+        assert verify_ledger() == []
@@ -0,0 +1,186 @@
+"""Tests for the optional group-commit write path."""
+
+import threading
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app import create_app, db
+from app.ledger import verify_ledger
+from app.leaderboard import get_leaderboard
+from app.models import User, BinaryTrade
+from app.operations import create_user, create_binary_trade, create_underlying_trade
+
+
+@pytest.fixture
+def app(tmp_path):
+    """An app with group commit on, using a file database."""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'group.db'}",
+        'TESTING': True,
+        'GROUP_COMMIT': True,
+        'GROUP_COMMIT_MAX_DELAY': 0.05,
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        app.extensions['group_commit'].stop()
+        db.drop_all()
+
+
+def trace_transactions(app):
+    """
+    Start tracing the statements SQLite runs, per connection.
+
+    Returns a live list of (connection id, statement) pairs. The trace is
+    taken on the DBAPI connection, so it includes the BEGIN and COMMIT
+    that pysqlite issues on its own.
+    """
+    statements = []
+
+    def trace(dbapi_connection, connection_record, connection_proxy):
+        key = id(dbapi_connection)
+        dbapi_connection.set_trace_callback(lambda sql: statements.append((key, sql)))
+
+    event.listen(db.engine, 'checkout', trace)
+    return statements
+
+
+def count_transactions(statements):
+    """
+    Count the transactions that committed rows in a trace.
+
+    Returns:
+        Tuple of (commits, autocommits): explicit COMMITs, and outermost
+        RELEASE SAVEPOINTs run outside a transaction, each of which
+        commits by itself
+    """
+    in_transaction = {}
+    depth = {}
+    commits = autocommits = 0
+    for key, sql in statements:
+        verb = sql.split(None, 1)[0].upper()
+        if verb == 'BEGIN':
+            in_transaction[key] = True
+        elif verb in ('COMMIT', 'ROLLBACK') and not sql.upper().startswith('ROLLBACK TO'):
+            commits += verb == 'COMMIT'
+            in_transaction[key] = False
+        elif verb == 'SAVEPOINT':
+            depth[key] = depth.get(key, 0) + 1
+        elif verb == 'RELEASE':
+            depth[key] -= 1
+            if depth[key] == 0 and not in_transaction.get(key):
+                autocommits += 1
+    return commits, autocommits
+
+
+def run_threads(app, count, target):
+    """Run target(i) in count threads, each in its own app context."""
+    results = [None] * count
+    errors = [None] * count
+
+    def work(i):
+        with app.app_context():
+            try:
+                results[i] = target(i)
+            except Exception as e:
+                errors[i] = e
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+        assert not thread.is_alive(), "caller still blocked on the writer"
+    return results, errors
+
+
+class TestGroupCommit:
+    """Tests for batching inserts through the writer thread."""
+
+    def test_disabled_by_default(self):
+        """Without GROUP_COMMIT, no committer is attached."""
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+        assert 'group_commit' not in app.extensions
+
+    def test_create_user_returns_committed_user(self, app):
+        """The caller gets a normal User object once it is durable."""
+        user = create_user("Alice")
+
+        assert user.id is not None
+        assert user.name == "Alice"
+        assert user.balance == 1000
+        db.session.remove()
+        assert db.session.get(User, user.id).name == "Alice"
+
+    def test_create_trades(self, app):
+        """Trade creation goes through the same path."""
+        alice = create_user("Alice")
+        bob = create_user("Bob")
+
+        binary = create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?")
+        underlying = create_underlying_trade(alice.id, bob.id, 2.5, 100.0, "AAPL")
+
+        assert binary.status == "open"
+        assert binary.party_a.name == "Alice"
+        assert underlying.lot_size == 2.5
+
+    def test_concurrent_inserts_share_commits(self, app):
+        """Concurrent callers are committed together, not one by one."""
+        statements = trace_transactions(app)
+
+        results, errors = run_threads(app, 30, lambda i: create_user(f"User {i}").id)
+
+        assert errors == [None] * 30
+        assert len(set(results)) == 30
+        assert User.query.count() == 30
+        commits, autocommits = count_transactions(statements)
+        assert autocommits == 0
+        assert 1 <= commits < 30
+        assert verify_ledger() == []
+
+    def test_failed_insert_only_fails_its_caller(self, app):
+        """One bad row raises for its caller; the rest of the batch commits."""
+        alice = create_user("Alice")
+        bob = create_user("Bob")
+
+        def work(i):
+            if i == 3:
+                return create_user(None)
+            return create_binary_trade(alice.id, bob.id, 10, 5, f"bet {i}").id
+
+        results, errors = run_threads(app, 8, work)
+
+        assert isinstance(errors[3], IntegrityError)
+        assert [e for i, e in enumerate(errors) if i != 3] == [None] * 7
+        assert BinaryTrade.query.count() == 7
+        assert User.query.count() == 2
+
+    def test_commit_hooks_still_run(self, app):
+        """Signals fire after the batch commits, so caches stay correct."""
+        create_user("Alice")
+        get_leaderboard()
+
+        create_user("Bob")
+
+        _, payload = get_leaderboard()
+        assert 'Bob' in payload
+
+    def test_failed_begin_fails_the_batch_not_the_writer(self, app):
+        """If the batch can't start a transaction its callers get the error
+        and the writer goes on to commit the next batch."""
+        def locked_once(conn, cursor, statement, parameters, context, executemany):
+            if statement == 'BEGIN IMMEDIATE':
+                event.remove(db.engine, 'before_cursor_execute', locked_once)
+                raise OperationalError(statement, None, Exception('database is locked'))
+
+        event.listen(db.engine, 'before_cursor_execute', locked_once)
+        _, errors = run_threads(app, 1, lambda i: create_user("Alice"))
+
+        assert isinstance(errors[0], OperationalError)
+        results, errors = run_threads(app, 1, lambda i: create_user("Bob").name)
+        assert errors == [None]
+        assert results == ['Bob']
+        assert [user.name for user in User.query] == ['Bob']
@@ -0,0 +1,210 @@
+"""Tests for Idempotency-Key handling on POST endpoints."""
+
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select, text
+
+from app import create_app, db, routes
+from app.idempotency import request_fingerprint
+from app.models import IdempotencyKey, User, utcnow
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Create a test Flask application on a database file (shared by threads)."""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'idempotency.db'}",
+        'TESTING': True,
+        'IDEMPOTENCY_WAIT': 2.0,
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client for making HTTP requests."""
+    return app.test_client()
+
+
+def post_user(client, name, key):
+    return client.post('/users', json={'name': name}, headers={'Idempotency-Key': key})
+
+
+def user_count():
+    return db.session.execute(select(func.count()).select_from(User)).scalar()
+
+
+def stored_keys():
+    return db.session.execute(select(func.count()).select_from(IdempotencyKey)).scalar()
+
+
+class TestReplay:
+    """A retried request gets the first response back."""
+
+    def test_retry_replays_without_writing(self, client, app):
+        """The retry returns the stored response and creates nobody."""
+        first = post_user(client, 'Alice', 'key-1')
+        retry = post_user(client, 'Alice', 'key-1')
+
+        assert first.status_code == retry.status_code == 201
+        assert retry.get_json() == first.get_json()
+        assert retry.headers['Idempotent-Replayed'] == 'true'
+        assert 'Idempotent-Replayed' not in first.headers
+        assert user_count() == 1
+
+    def test_without_key_every_request_runs(self, client, app):
+        client.post('/users', json={'name': 'Alice'})
+        client.post('/users', json={'name': 'Alice'})
+
+        assert user_count() == 2
+        assert stored_keys() == 0
+
+    def test_distinct_keys_run_separately(self, client, app):
+        post_user(client, 'Alice', 'key-1')
+        post_user(client, 'Alice', 'key-2')
+
+        assert user_count() == 2
+
+    def test_key_reused_for_another_request(self, client, app):
+        """A key can't be replayed against a different body or endpoint."""
+        post_user(client, 'Alice', 'key-1')
+
+        other_body = post_user(client, 'Bob', 'key-1')
+        other_path = client.post('/marks', json={'marks': {'AAPL': 1.0}},
+                                 headers={'Idempotency-Key': 'key-1'})
+
+        assert other_body.status_code == other_path.status_code == 422
+        assert user_count() == 1
+
+    @pytest.mark.parametrize('key', ['', 'k' * 256])
+    def test_invalid_key(self, client, app, key):
+        assert post_user(client, 'Alice', key).status_code == 400
+        assert user_count() == 0
+
+    def test_client_errors_are_replayed(self, client, app):
+        """A refused request is refused the same way on retry."""
+        first = client.post('/users', json={}, headers={'Idempotency-Key': 'key-1'})
+        retry = client.post('/users', json={}, headers={'Idempotency-Key': 'key-1'})
+
+        assert first.status_code == retry.status_code == 400
+        assert retry.headers['Idempotent-Replayed'] == 'true'
+
+    def test_failure_releases_the_key(self, client, app, monkeypatch):
+        """A request that raises stores nothing, so its retry runs again."""
+        def broken(name):
+            raise RuntimeError('database went away')
+
+        monkeypatch.setattr(routes, 'create_user', broken)
+        with pytest.raises(RuntimeError):
+            post_user(client, 'Alice', 'key-1')
+        assert stored_keys() == 0
+
+        monkeypatch.undo()
+        assert post_user(client, 'Alice', 'key-1').status_code == 201
+        assert user_count() == 1
+
+    def test_order_retry_places_once(self, client, app):
+        """POST /orders honours the key too."""
+        post_user(client, 'Alice', 'user')
+        order = {'user_id': 1, 'type': 'underlying', 'market': 'AAPL', 'side': 'buy',
+                 'price': 100.0, 'quantity': 1}
+
+        first = client.post('/orders', json=order, headers={'Idempotency-Key': 'order'})
+        retry = client.post('/orders', json=order, headers={'Idempotency-Key': 'order'})
+
+        assert retry.get_json() == first.get_json()
+        bids = client.get('/orders/book?type=underlying&market=AAPL').get_json()['bids']
+        assert bids == [{'price': 100.0, 'quantity': 1.0, 'orders': 1}]
+
+
+class TestConcurrentDuplicates:
+    """Duplicates that arrive while the first is running share its result."""
+
+    def test_coalesced_onto_one_execution(self, app, monkeypatch):
+        """Five simultaneous retries create one user and all get its response."""
+        calls = []
+        real = routes.create_user
+
+        def slow_create_user(name):
+            calls.append(name)
+            time.sleep(0.2)
+            return real(name)
+
+        monkeypatch.setattr(routes, 'create_user', slow_create_user)
+        responses = []
+
+        def send():
+            with app.app_context():
+                responses.append(post_user(app.test_client(), 'Alice', 'key-1'))
+
+        threads = [threading.Thread(target=send) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+        assert calls == ['Alice']
+        assert [r.status_code for r in responses] == [201] * 5
+        assert len({r.get_data() for r in responses}) == 1
+        assert user_count() == 1
+
+    def test_key_busy_in_another_process(self, client, app):
+        """A fresh claim by another worker makes a duplicate wait, then 409."""
+        app.extensions['idempotency'].wait = 0.1
+        with app.test_request_context('/users', method='POST', json={'name': 'Alice'}):
+            fingerprint = request_fingerprint()
+        db.session.add(IdempotencyKey(key='key-1', fingerprint=fingerprint))
+        db.session.commit()
+
+        response = post_user(client, 'Alice', 'key-1')
+
+        assert response.status_code == 409
+        assert response.headers['Retry-After'] == '1'
+        assert user_count() == 0
+
+    def test_abandoned_claim_is_taken_over(self, client, app):
+        """A claim left behind by a dead worker doesn't block the key for ever."""
+        first = post_user(client, 'Alice', 'key-1')
+        fingerprint = db.session.get(IdempotencyKey, 'key-1').fingerprint
+        db.session.execute(text("DELETE FROM idempotency_key"))
+        db.session.expunge_all()
+        db.session.add(IdempotencyKey(key='key-1', fingerprint=fingerprint,
+                                      created_at=utcnow() - timedelta(minutes=5)))
+        db.session.commit()
+
+        retry = post_user(client, 'Alice', 'key-1')
+
+        assert first.status_code == retry.status_code == 201
+        assert 'Idempotent-Replayed' not in retry.headers
+
+
+class TestExpiry:
+    """Keys are bounded in age and number."""
+
+    def test_expired_key_runs_again(self, client, app):
+        app.extensions['idempotency'].ttl = timedelta(0)
+
+        post_user(client, 'Alice', 'key-1')
+        post_user(client, 'Alice', 'key-1')
+
+        assert user_count() == 2
+
+    def test_oldest_keys_are_trimmed(self, client, app):
+        store = app.extensions['idempotency']
+        store.max_keys = 2
+        store.purge_interval = 0
+
+        for i in range(4):
+            post_user(client, f"user{i}", f"key-{i}")
+            time.sleep(0.01)  # distinct created_at
+
+        keys = db.session.execute(select(IdempotencyKey.key)).scalars().all()
+        assert sorted(keys) == ['key-2', 'key-3']
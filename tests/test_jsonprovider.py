@@ -0,0 +1,91 @@
+"""Tests for the JSON providers behind app.json."""
+
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from app import db, jsonprovider
+from app.jsonprovider import OrjsonProvider, StdlibJSONProvider
+from app.operations import create_binary_trade, create_underlying_trade, create_user
+
+needs_orjson = pytest.mark.skipif(jsonprovider.orjson is None, reason='orjson is not installed')
+
+
+@pytest.fixture(params=['stdlib', pytest.param('orjson', marks=needs_orjson)])
+def app(request, make_app):
+    """An app using each provider in turn."""
+    app = make_app(JSON_PROVIDER=request.param)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+class TestChoosingProvider:
+    """Tests for JSON_PROVIDER."""
+
+    @needs_orjson
+    def test_auto_prefers_orjson(self, make_app):
+        """With orjson installed, the default picks it."""
+        assert isinstance(make_app(JSON_PROVIDER='auto').json, OrjsonProvider)
+
+    def test_auto_falls_back_to_stdlib(self, make_app, monkeypatch):
+        """Without orjson, the default uses the stdlib."""
+        monkeypatch.setattr(jsonprovider, 'orjson', None)
+
+        assert isinstance(make_app(JSON_PROVIDER='auto').json, StdlibJSONProvider)
+
+    def test_orjson_required_but_missing(self, make_app, monkeypatch):
+        """Asking for orjson explicitly fails at startup if it is missing."""
+        monkeypatch.setattr(jsonprovider, 'orjson', None)
+
+        with pytest.raises(RuntimeError):
+            make_app(JSON_PROVIDER='orjson')
+
+    def test_unknown_provider(self, make_app):
+        with pytest.raises(ValueError):
+            make_app(JSON_PROVIDER='simdjson')
+
+
+class TestEncoding:
+    """Both providers produce the same JSON values."""
+
+    def test_keys_keep_their_order(self, app):
+        """Objects are written in insertion order rather than sorted."""
+        assert app.json.dumps({'id': 1, 'b': 2, 'a': 3}).replace(' ', '') == \
+            '{"id":1,"b":2,"a":3}'
+
+    def test_fallback_types_match_flask(self, app):
+        """Dates, Decimals and int keys encode as Flask's default does."""
+        value = {1: datetime(2024, 1, 2, 3, 4, 5), 'price': Decimal('1.50')}
+
+        assert json.loads(app.json.dumps(value)) == {
+            '1': 'Tue, 02 Jan 2024 03:04:05 GMT', 'price': '1.50'}
+
+    def test_loads_round_trips(self, app):
+        assert app.json.loads(app.json.dumps({'name': 'Zoë'})) == {'name': 'Zoë'}
+
+    def test_responses_match_across_providers(self, app):
+        """GET /trades and GET /users return the same data with either provider."""
+        alice = create_user("Zoë").id
+        bob = create_user("Bob").id
+        create_binary_trade(alice, bob, 10, 5, "Rain?")
+        create_underlying_trade(alice, bob, 1.5, 100.25, "AAPL")
+        client = app.test_client()
+
+        trades = client.get('/trades')
+        users = client.get('/users')
+
+        assert trades.mimetype == users.mimetype == 'application/json'
+        assert [t['type'] for t in json.loads(trades.data)] == ['binary', 'underlying']
+        assert json.loads(trades.data)[1]['trade_price'] == 100.25
+        assert [u['name'] for u in json.loads(users.data)] == ['Zoë', 'Bob']
+
+    def test_malformed_request_body_is_400(self, app):
+        """Request bodies are parsed by the provider too."""
+        response = app.test_client().post(
+            '/users', data='{"name": ', content_type='application/json')
+
+        assert response.status_code == 400
@@ -0,0 +1,177 @@
+"""Tests for the cached leaderboard behind GET /users."""
+
+import json
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.leaderboard import get_leaderboard
+from app.operations import (
+    create_user,
+    create_binary_trade,
+    settle_binary_trade,
+    settle_trades_bulk,
+)
+from app.versions import USERS_VERSION, bump_version, get_version
+
+
+@pytest.fixture
+def app(make_app):
+    """An app whose leaderboard only re-checks the database every minute."""
+    app = make_app(LEADERBOARD_CHECK_INTERVAL=60)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+def count_queries(fn):
+    """Return (result, number of SQL statements run by fn)."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        result = fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return result, len(statements)
+
+
+def names(payload):
+    """Decode a leaderboard payload into names in order."""
+    return [user['name'] for user in json.loads(payload)]
+
+
+class TestDataVersion:
+    """Tests for the shared version counters."""
+
+    def test_version_starts_at_zero_and_increments(self, app):
+        """Counters start at 0 and go up by one per committed bump."""
+        assert get_version('example') == 0
+        bump_version('example')
+        bump_version('example')
+        db.session.commit()
+        assert get_version('example') == 2
+
+    def test_rolled_back_bump_is_discarded(self, app):
+        """A bump rolls back together with the write it belongs to."""
+        bump_version('example')
+        db.session.rollback()
+        assert get_version('example') == 0
+
+    def test_writes_bump_users_version(self, app):
+        """Creating users and settling trades bump the 'users' counter."""
+        alice = create_user("Alice")
+        bob = create_user("Bob")
+        trade = create_binary_trade(alice.id, bob.id, 20, 10, "bet")
+        before = get_version(USERS_VERSION)
+
+        settle_binary_trade(trade.id, True)
+
+        assert get_version(USERS_VERSION) == before + 1
+
+
+class TestLeaderboardCache:
+    """Tests for caching and invalidation."""
+
+    def test_sorted_by_balance(self, app):
+        """Users are listed highest balance first."""
+        alice = create_user("Alice")
+        bob = create_user("Bob")
+        trade = create_binary_trade(alice.id, bob.id, 20, 10, "bet")
+        settle_binary_trade(trade.id, False)
+
+        _, payload = get_leaderboard()
+
+        assert json.loads(payload) == [
+            {'id': bob.id, 'name': 'Bob', 'balance': 1020},
+            {'id': alice.id, 'name': 'Alice', 'balance': 980},
+        ]
+
+    def test_repeated_reads_do_not_query(self, app):
+        """Once built, reads are served from memory."""
+        create_user("Alice")
+        get_leaderboard()
+
+        _, queries = count_queries(get_leaderboard)
+
+        assert queries == 0
+
+    def test_create_user_invalidates(self, app):
+        """A new user shows up immediately in this process."""
+        create_user("Alice")
+        get_leaderboard()
+
+        create_user("Bob")
+
+        assert names(get_leaderboard()[1]) == ['Alice', 'Bob']
+
+    def test_settlement_invalidates(self, app):
+        """Single and bulk settlements refresh balances immediately."""
+        alice = create_user("Alice")
+        bob = create_user("Bob")
+        first = create_binary_trade(alice.id, bob.id, 20, 10, "one")
+        second = create_binary_trade(alice.id, bob.id, 20, 10, "two")
+        get_leaderboard()
+
+        settle_binary_trade(first.id, False)
+        assert names(get_leaderboard()[1]) == ['Bob', 'Alice']
+
+        settle_trades_bulk([(second.id, True)])
+        version, payload = get_leaderboard()
+        assert json.loads(payload)[0]['balance'] == 1010
+        assert version == get_version(USERS_VERSION)
+
+    def test_unchanged_version_skips_rebuild(self, app):
+        """After the interval, an unchanged version costs one lookup."""
+        create_user("Alice")
+        get_leaderboard()
+        app.extensions['leaderboard'].invalidate()
+
+        _, queries = count_queries(get_leaderboard)
+
+        assert queries == 1
+
+
+class TestMultipleWorkers:
+    """Tests for noticing writes made by another worker process."""
+
+    def test_other_worker_write_seen_after_interval(self, make_app):
+        """A write through another app is picked up via the version counter."""
+        worker_a = make_app(LEADERBOARD_CHECK_INTERVAL=0)
+        worker_b = make_app()
+
+        with worker_a.app_context():
+            db.create_all()
+            create_user("Alice")
+            assert names(get_leaderboard()[1]) == ['Alice']
+
+        with worker_b.app_context():
+            create_user("Bob")
+
+        with worker_a.app_context():
+            assert names(get_leaderboard()[1]) == ['Alice', 'Bob']
+            db.drop_all()
+
+    def test_other_worker_write_not_seen_within_interval(self, make_app):
+        """Within the check interval, reads stay in memory (and may be stale)."""
+        worker_a = make_app(LEADERBOARD_CHECK_INTERVAL=60)
+        worker_b = make_app()
+
+        with worker_a.app_context():
+            db.create_all()
+            create_user("Alice")
+            get_leaderboard()
+
+        with worker_b.app_context():
+            create_user("Bob")
+
+        with worker_a.app_context():
+            assert names(get_leaderboard()[1]) == ['Alice']
+            worker_a.extensions['leaderboard'].invalidate()
+            assert names(get_leaderboard()[1]) == ['Alice', 'Bob']
+            db.drop_all()
@@ -0,0 +1,164 @@
+"""Tests for the append-only balance ledger."""
+
+import pytest
+from app import create_app, db, ledger
+from app.ledger import balance_as_of, checkpoint_balances, verify_ledger
+from app.models import User, LedgerEntry, BalanceSnapshot
+from app.operations import (
+    create_user,
+    create_binary_trade,
+    create_underlying_trade,
+    settle_binary_trade,
+    settle_underlying_trade,
+    settle_trades_bulk,
+)
+
+
+@pytest.fixture
+def app():
+    """Create a test Flask application with an in-memory database."""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'TESTING': True,
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+def last_seq():
+    """Return the most recent ledger sequence number."""
+    return db.session.query(db.func.max(LedgerEntry.seq)).scalar()
+
+
+class TestLedgerEntries:
+    """Tests for the entries written by operations."""
+
+    def test_create_user_records_opening_balance(self, app):
+        """A new user's starting balance is their first ledger entry."""
+        with app.app_context():
+            alice = create_user("Alice")
+
+            entries = LedgerEntry.query.filter_by(user_id=alice.id).all()
+            assert len(entries) == 1
+            assert entries[0].delta == 1000
+            assert entries[0].trade_id is None
+
+    def test_settlement_records_both_legs(self, app):
+        """Settling a trade appends one zero-sum entry per party."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            trade = create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?")
+
+            settle_binary_trade(trade.id, outcome=True)
+
+            entries = LedgerEntry.query.filter_by(trade_type='binary', trade_id=trade.id).all()
+            assert {(e.user_id, e.delta) for e in entries} == {(alice.id, 10), (bob.id, -10)}
+
+    def test_bulk_settlement_records_every_leg(self, app):
+        """Bulk settlement nets balances but keeps one entry per trade leg."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            first = create_binary_trade(alice.id, bob.id, 20, 10, "one")
+            second = create_binary_trade(alice.id, bob.id, 20, 10, "two")
+            third = create_underlying_trade(alice.id, bob.id, 2, 100.0, "three")
+
+            settle_trades_bulk([(first.id, True), (second.id, True), (third.id, 95.0)])
+
+            assert LedgerEntry.query.filter(LedgerEntry.trade_id.isnot(None)).count() == 6
+            assert verify_ledger() == []
+
+
+class TestBalanceAsOf:
+    """Tests for rebuilding balances from snapshots and tails."""
+
+    def test_current_balance(self, app):
+        """With no seq, the ledger balance should equal User.balance."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            trade = create_underlying_trade(alice.id, bob.id, 5.5, 50.0, "Gold")
+            settle_underlying_trade(trade.id, 75.0)
+
+            assert balance_as_of(alice.id) == db.session.get(User, alice.id).balance
+            assert balance_as_of(bob.id) == db.session.get(User, bob.id).balance
+
+    def test_historical_balance(self, app):
+        """Balances can be read as of any earlier sequence number."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            history = [last_seq()]
+            for outcome in (True, True, False):
+                trade = create_binary_trade(alice.id, bob.id, 20, 10, "bet")
+                settle_binary_trade(trade.id, outcome)
+                history.append(last_seq())
+
+            assert [balance_as_of(alice.id, seq) for seq in history] == [1000, 1010, 1020, 1000]
+
+    def test_snapshots_bound_the_tail(self, app, monkeypatch):
+        """Once the tail reaches the interval a snapshot is written."""
+        monkeypatch.setattr(ledger, 'SNAPSHOT_INTERVAL', 3)
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            seqs = []
+            for _ in range(7):
+                trade = create_binary_trade(alice.id, bob.id, 20, 10, "bet")
+                settle_binary_trade(trade.id, True)
+                seqs.append(last_seq())
+
+            snapshots = BalanceSnapshot.query.filter_by(user_id=alice.id).all()
+            assert len(snapshots) == 2
+            assert balance_as_of(alice.id) == 1070
+            # Reads before, between and after snapshots all agree with history
+            assert [balance_as_of(alice.id, seq) for seq in seqs] == [
+                1010, 1020, 1030, 1040, 1050, 1060, 1070,
+            ]
+
+    def test_unknown_user(self, app):
+        """A user with no ledger has a zero ledger balance."""
+        with app.app_context():
+            assert balance_as_of(999) == 0
+
+
+class TestVerifyLedger:
+    """Tests for the balance/ledger consistency check."""
+
+    def test_consistent_ledger(self, app, monkeypatch):
+        """Balances written through operations always verify."""
+        monkeypatch.setattr(ledger, 'SNAPSHOT_INTERVAL', 2)
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            for i in range(5):
+                trade = create_underlying_trade(alice.id, bob.id, 1.5, 100.0, "AAPL")
+                settle_underlying_trade(trade.id, 100.0 + i)
+
+            assert verify_ledger() == []
+
+    def test_detects_drift(self, app):
+        """A balance changed outside the ledger is reported."""
+        with app.app_context():
+            alice = create_user("Alice")
+            create_user("Bob")
+            db.session.get(User, alice.id).balance = 5000
+            db.session.commit()
+
+            assert verify_ledger() == [
+                {'user_id': alice.id, 'balance': 5000, 'ledger_balance': 1000},
+            ]
+
+    def test_checkpoint_all_users(self, app):
+        """checkpoint_balances can snapshot every user on demand."""
+        with app.app_context():
+            create_user("Alice")
+            create_user("Bob")
+
+            assert checkpoint_balances(interval=1) == 2
+            assert checkpoint_balances(interval=1) == 0
+            assert verify_ledger() == []
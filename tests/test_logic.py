@@ -1,6 +1,13 @@
 """Tests for pure business logic functions."""
 
-from app.logic import calculate_binary_payout
+import numpy as np
+
+from app.logic import (
+    calculate_binary_payout,
+    calculate_binary_payouts,
+    calculate_underlying_payout,
+    calculate_underlying_payouts,
+)
 
 
 class TestBinaryPayout:
@@ -47,3 +54,122 @@ class TestBinaryPayout:
         alice_pnl, bob_pnl = calculate_binary_payout(100, 100, True)
         assert alice_pnl == 100
         assert bob_pnl == -100
+
+
+class TestUnderlyingPayout:
+    """Tests for underlying trade payout calculation."""
+
+    def test_price_goes_up_long_wins(self):
+        """When price rises, the long party gains lot_size × move."""
+        long_pnl, short_pnl = calculate_underlying_payout(10, 100.0, 110.0)
+
+        assert long_pnl == 100.0
+        assert short_pnl == -100.0
+
+    def test_price_goes_down_short_wins(self):
+        """When price falls, the short party gains lot_size × move."""
+        long_pnl, short_pnl = calculate_underlying_payout(10, 100.0, 80.0)
+
+        assert long_pnl == -200.0
+        assert short_pnl == 200.0
+
+    def test_fractional_lot_size(self):
+        """Lot sizes can be fractional."""
+        long_pnl, short_pnl = calculate_underlying_payout(2.5, 50.0, 54.0)
+
+        assert long_pnl == 10.0
+        assert short_pnl == -10.0
+
+    def test_payout_is_zero_sum(self):
+        """Total P&L should be zero (minimarbles are conserved)."""
+        long_pnl, short_pnl = calculate_underlying_payout(5.5, 50.0, 75.0)
+        assert long_pnl + short_pnl == 0
+
+    def test_returns_plain_python_numbers(self):
+        """Scalar wrapper should not leak NumPy types into the database layer."""
+        long_pnl, short_pnl = calculate_underlying_payout(1, 1.0, 2.0)
+        assert type(long_pnl) is float
+        assert type(short_pnl) is float
+
+
+class TestBinaryPayouts:
+    """Tests for the vectorized binary payout kernel."""
+
+    def test_matches_scalar_function(self):
+        """Each element should match the per-trade calculation."""
+        alice_stakes = np.array([20, 50, 100])
+        bob_stakes = np.array([10, 25, 100])
+        outcomes = np.array([True, False, True])
+
+        alice_pnls, bob_pnls = calculate_binary_payouts(alice_stakes, bob_stakes, outcomes)
+
+        for i in range(3):
+            expected = calculate_binary_payout(alice_stakes[i], bob_stakes[i], outcomes[i])
+            assert (alice_pnls[i], bob_pnls[i]) == expected
+
+    def test_zero_sum_for_every_trade(self):
+        """Every trade in the batch should be zero-sum."""
+        rng = np.random.default_rng(0)
+        alice_stakes = rng.integers(1, 500, size=10_000)
+        bob_stakes = rng.integers(1, 500, size=10_000)
+        outcomes = rng.random(10_000) < 0.5
+
+        alice_pnls, bob_pnls = calculate_binary_payouts(alice_stakes, bob_stakes, outcomes)
+
+        assert np.all(alice_pnls + bob_pnls == 0)
+
+    def test_integer_stakes_stay_integer(self):
+        """Integer stakes should produce integer P&L (balances are integers)."""
+        alice_pnls, _ = calculate_binary_payouts([20], [10], [True])
+        assert alice_pnls.dtype.kind == 'i'
+
+    def test_single_outcome_broadcasts(self):
+        """One outcome can be applied to a whole array of trades."""
+        alice_pnls, bob_pnls = calculate_binary_payouts([20, 30], [10, 15], False)
+
+        assert alice_pnls.tolist() == [-20, -30]
+        assert bob_pnls.tolist() == [20, 30]
+
+
+class TestUnderlyingPayouts:
+    """Tests for the vectorized underlying payout kernel."""
+
+    def test_matches_scalar_function(self):
+        """Each element should match the per-trade calculation."""
+        lot_sizes = np.array([10, 2.5, 5.5])
+        trade_prices = np.array([100.0, 50.0, 50.0])
+        settlement_prices = np.array([110.0, 54.0, 75.0])
+
+        long_pnls, short_pnls = calculate_underlying_payouts(
+            lot_sizes, trade_prices, settlement_prices
+        )
+
+        for i in range(3):
+            expected = calculate_underlying_payout(
+                lot_sizes[i], trade_prices[i], settlement_prices[i]
+            )
+            assert (long_pnls[i], short_pnls[i]) == expected
+
+    def test_zero_sum_for_every_trade(self):
+        """Every trade in the batch should be exactly zero-sum."""
+        rng = np.random.default_rng(1)
+        lot_sizes = rng.random(10_000) * 10
+        trade_prices = rng.random(10_000) * 200
+        settlement_prices = rng.random(10_000) * 200
+
+        long_pnls, short_pnls = calculate_underlying_payouts(
+            lot_sizes, trade_prices, settlement_prices
+        )
+
+        assert np.all(long_pnls + short_pnls == 0)
+
+    def test_broadcasts_positions_against_scenarios(self):
+        """A column of positions can be revalued against a row of prices."""
+        lot_sizes = np.array([[1.0], [2.0]])
+        trade_prices = np.array([[100.0], [100.0]])
+        scenario_prices = np.array([90.0, 100.0, 110.0])
+
+        long_pnls, _ = calculate_underlying_payouts(lot_sizes, trade_prices, scenario_prices)
+
+        assert long_pnls.shape == (2, 3)
+        assert long_pnls.tolist() == [[-10.0, 0.0, 10.0], [-20.0, 0.0, 20.0]]
@@ -0,0 +1,192 @@
+"""Tests for mark-to-market valuation of open underlying trades."""
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.marks import MarkBook, get_unrealized, record_marks
+from app.operations import (
+    create_user,
+    create_binary_trade,
+    create_underlying_trade,
+    settle_underlying_trade,
+)
+
+
+def record_statements(fn):
+    """Call fn and return the SQL statements it executed."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+@pytest.fixture
+def app(make_app):
+    """Create a test Flask application on a fresh database file."""
+    app = make_app()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client for making HTTP requests."""
+    return app.test_client()
+
+
+@pytest.fixture
+def book(app):
+    """Alice long AAPL against Bob, Bob long MSFT against Carol."""
+    alice = create_user("Alice").id
+    bob = create_user("Bob").id
+    carol = create_user("Carol").id
+    aapl = create_underlying_trade(alice, bob, 10, 100.0, "Apple", underlying="AAPL").id
+    msft = create_underlying_trade(bob, carol, 2, 400.0, "Microsoft", underlying="MSFT").id
+    create_binary_trade(alice, carol, 10, 5, "Will it rain?")
+    return {'alice': alice, 'bob': bob, 'carol': carol, 'aapl': aapl, 'msft': msft}
+
+
+class TestMarkBook:
+    """Tests for MarkBook valuations."""
+
+    def test_unmarked_trades_are_worth_nothing(self, app, book):
+        """Before any mark, positions are listed with no P&L."""
+        result = get_unrealized(book['alice'])
+
+        assert result['unrealized'] == 0.0
+        assert result['positions'] == [{
+            'id': book['aapl'], 'underlying': 'AAPL', 'side': 'long',
+            'lot_size': 10.0, 'trade_price': 100.0, 'mark': None, 'unrealized': 0.0,
+        }]
+
+    def test_marks_value_both_sides(self, app, book):
+        """Long gains what short loses; users net across their trades."""
+        record_marks({'AAPL': 110.0, 'MSFT': 390.0})
+
+        assert get_unrealized(book['alice'])['unrealized'] == 100.0
+        # Bob is short AAPL (-100) and long MSFT (-20)
+        bob = get_unrealized(book['bob'])
+        assert bob['unrealized'] == -120.0
+        assert {p['id']: p['side'] for p in bob['positions']} == {
+            book['aapl']: 'short', book['msft']: 'long',
+        }
+        assert get_unrealized(book['carol'])['unrealized'] == 20.0
+
+    def test_only_remarked_underlyings_are_revalued(self, app, book):
+        """A new mark touches just the trades on that underlying."""
+        assert record_marks({'AAPL': 110.0, 'MSFT': 390.0}) == 2  # first load: every trade
+
+        assert record_marks({'MSFT': 380.0}) == 1
+        assert record_marks({'MSFT': 380.0}) == 0  # unchanged price
+        assert get_unrealized(book['bob'])['unrealized'] == -140.0
+
+    def test_user_without_trades(self, app, book):
+        """A user with no open underlying trades has nothing unrealized."""
+        dave = create_user("Dave").id
+
+        assert get_unrealized(dave) == {'user_id': dave, 'unrealized': 0.0, 'positions': []}
+
+    def test_new_and_settled_trades_are_picked_up(self, app, book):
+        """The book reloads its trades when the trades version moves."""
+        record_marks({'AAPL': 110.0})
+        create_underlying_trade(book['carol'], book['alice'], 1, 105.0, "Apple",
+                                underlying="AAPL")
+
+        assert get_unrealized(book['alice'])['unrealized'] == 100.0 - 5.0
+
+        settle_underlying_trade(book['aapl'], 110.0)
+
+        assert get_unrealized(book['alice'])['unrealized'] == -5.0
+
+    def test_new_trades_are_applied_as_a_delta(self, app, book):
+        """Only the trades written since the last refresh are read back."""
+        record_marks({'AAPL': 110.0, 'MSFT': 390.0})
+        mark_book = app.extensions['marks']
+        create_underlying_trade(book['carol'], book['alice'], 1, 105.0, "Apple",
+                                underlying="AAPL")
+        create_underlying_trade(book['bob'], create_user("Dave").id, 3, 50.0, "Nvidia",
+                                underlying="NVDA")
+
+        # Both AAPL trades are revalued; NVDA is new and has no mark yet
+        assert mark_book.refresh() == 3
+        assert len(mark_book) == 4
+        assert get_unrealized(book['bob'])['unrealized'] == -120.0
+        assert record_marks({'NVDA': 60.0}) == 1
+        assert get_unrealized(book['bob'])['unrealized'] == -90.0
+
+    def test_binary_trades_do_not_touch_the_book(self, app, book):
+        """A trades-version bump with no underlying trade revalues nothing."""
+        record_marks({'AAPL': 110.0})
+        mark_book = app.extensions['marks']
+        create_binary_trade(book['alice'], book['bob'], 10, 5, "Will it snow?")
+
+        statements = record_statements(mark_book.refresh)
+
+        assert len(statements) == 2  # the versions and the (empty) delta
+        assert 'change_seq >' in statements[1]
+        assert len(mark_book) == 2
+
+    def test_reads_reuse_the_book(self, app, book):
+        """Within the check interval a read runs no SQL at all."""
+        record_marks({'AAPL': 110.0})
+
+        assert record_statements(lambda: get_unrealized(book['alice'])) == []
+
+        app.extensions['marks'].invalidate()
+        assert len(record_statements(lambda: get_unrealized(book['alice']))) == 1
+
+    def test_marks_from_another_worker(self, app, book, make_app):
+        """A second process's book sees marks posted through the first."""
+        other = make_app(MARKS_CHECK_INTERVAL=0)
+        with other.app_context():
+            assert get_unrealized(book['alice'])['unrealized'] == 0.0
+
+        record_marks({'AAPL': 120.0})
+
+        with other.app_context():
+            assert get_unrealized(book['alice'])['unrealized'] == 200.0
+            db.engine.dispose()
+
+    def test_empty_book(self, app):
+        """A book with no trades can still be refreshed and read."""
+        book = MarkBook()
+
+        assert book.refresh() == 0
+        assert book.unrealized(1)['positions'] == []
+
+
+class TestMarkRoutes:
+    """Tests for POST /marks and GET /users/<id>/unrealized."""
+
+    def test_post_marks_and_read_unrealized(self, client, book):
+        """Posted marks show up in a user's unrealized P&L."""
+        response = client.post('/marks', json={'marks': {'AAPL': 95.0}})
+
+        assert response.status_code == 200
+        assert response.get_json() == {'marked': ['AAPL'], 'revalued': 2}
+
+        data = client.get(f"/users/{book['bob']}/unrealized").get_json()
+        assert data['unrealized'] == 50.0
+
+    def test_invalid_marks_return_400(self, client, book):
+        """Marks must be an object of numeric prices."""
+        assert client.post('/marks', json={}).status_code == 400
+        assert client.post('/marks', json={'marks': []}).status_code == 400
+
+        response = client.post('/marks', json={'marks': {'AAPL': 'high', 'MSFT': True}})
+        assert response.status_code == 400
+        assert len(response.get_json()['errors']) == 2
+
+    def test_unknown_user_returns_404(self, client, book):
+        """Unrealized P&L is only served for existing users."""
+        assert client.get('/users/999/unrealized').status_code == 404
@@ -0,0 +1,144 @@
+"""Tests for request/SQL instrumentation and GET /metrics."""
+
+import re
+
+import pytest
+from app import create_app, db
+from app.metrics import LATENCY_BUCKETS, MetricsRegistry
+from app.operations import create_user, create_binary_trade
+
+
+@pytest.fixture
+def app():
+    """Create a test Flask application with an in-memory database."""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'TESTING': True})
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client for making HTTP requests."""
+    return app.test_client()
+
+
+def sample(text, name, **labels):
+    """Return the value of one sample from Prometheus text, or None."""
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        match = re.match(r'(\w+)\{(.*)\} (\S+)$', line)
+        if not match or match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2)))
+        if all(found.get(k) == str(v) for k, v in labels.items()):
+            return float(match.group(3))
+    return None
+
+
+class TestMetricsEndpoint:
+    """Tests for GET /metrics."""
+
+    def test_metrics_is_prometheus_text(self, client):
+        """The endpoint should serve the Prometheus text format."""
+        response = client.get('/metrics')
+
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        assert '# TYPE minimarbles_request_duration_seconds histogram' in response.get_data(True)
+
+    def test_requests_are_counted_per_endpoint(self, client):
+        """Each request increments its endpoint/method/status counter."""
+        client.get('/users')
+        client.get('/users')
+        client.post('/users', json={})
+
+        text = client.get('/metrics').get_data(True)
+
+        assert sample(text, 'minimarbles_requests_total',
+                      endpoint='main.get_users', method='GET', status=200) == 2
+        assert sample(text, 'minimarbles_requests_total',
+                      endpoint='main.post_user', method='POST', status=400) == 1
+        assert sample(text, 'minimarbles_request_duration_seconds_count',
+                      endpoint='main.get_users') == 2
+        assert sample(text, 'minimarbles_request_duration_seconds_bucket',
+                      endpoint='main.get_users', le='+Inf') == 2
+
+    def test_sql_statements_are_attributed(self, client, app):
+        """SQL run while handling a request is counted for its endpoint."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            create_binary_trade(alice.id, bob.id, 20, 10, "bet")
+
+        client.get('/trades')
+        client.post('/users', json={'name': 'Carol'})
+        text = client.get('/metrics').get_data(True)
+
+        # Version lookup plus one query for every trade type
+        assert sample(text, 'minimarbles_sql_statements_total', endpoint='main.get_trades') == 2
+        assert sample(text, 'minimarbles_sql_seconds_total', endpoint='main.get_trades') > 0
+        # The user insert, ledger entry and version bump each write a row
+        assert sample(text, 'minimarbles_sql_rows_affected_total',
+                      endpoint='main.post_user') >= 3
+        assert sample(text, 'minimarbles_sql_rows_affected_total',
+                      endpoint='main.get_trades') == 0
+        # The version row and the one trade
+        assert sample(text, 'minimarbles_sql_rows_returned_total',
+                      endpoint='main.get_trades') == 2
+
+    def test_sql_while_streaming_is_attributed(self, client, app):
+        """An export's queries run as its body is sent and still count."""
+        with app.app_context():
+            create_user("Alice")
+
+        response = client.get('/users/export')
+        assert response.get_data(True).count('\n') == 1
+        response.close()
+        text = client.get('/metrics').get_data(True)
+
+        assert sample(text, 'minimarbles_requests_total', endpoint='main.export_users') == 1
+        assert sample(text, 'minimarbles_sql_statements_total', endpoint='main.export_users') >= 1
+        assert sample(text, 'minimarbles_sql_rows_returned_total', endpoint='main.export_users') == 1
+
+    def test_unmatched_routes(self, client):
+        """404s are grouped under a single label."""
+        client.get('/no-such-page')
+        text = client.get('/metrics').get_data(True)
+
+        assert sample(text, 'minimarbles_requests_total',
+                      endpoint='unmatched', status=404) == 1
+
+    def test_can_be_disabled(self):
+        """With METRICS_ENABLED off there are no hooks and no endpoint."""
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'METRICS_ENABLED': False,
+        })
+        assert app.test_client().get('/metrics').status_code == 404
+
+
+class TestMetricsRegistry:
+    """Tests for histogram aggregation."""
+
+    def test_buckets_are_cumulative(self):
+        """Histogram buckets count every observation at or below le."""
+        registry = MetricsRegistry()
+        for seconds in (0.0005, 0.003, 0.003, 100.0):
+            registry.observe([0.0, 0, 0.0, 0, 0, registry.endpoint('e'), 'GET'], 200, seconds)
+
+        text = registry.render()
+
+        assert sample(text, 'minimarbles_request_duration_seconds_bucket',
+                      endpoint='e', le=LATENCY_BUCKETS[0]) == 1
+        assert sample(text, 'minimarbles_request_duration_seconds_bucket',
+                      endpoint='e', le=0.005) == 3
+        assert sample(text, 'minimarbles_request_duration_seconds_bucket',
+                      endpoint='e', le=LATENCY_BUCKETS[-1]) == 3
+        assert sample(text, 'minimarbles_request_duration_seconds_bucket',
+                      endpoint='e', le='+Inf') == 4
+        assert sample(text, 'minimarbles_request_duration_seconds_sum', endpoint='e') == \
+            pytest.approx(100.0065)
@@ -0,0 +1,227 @@
+"""Tests for migrating databases from before the single trade table."""
+
+import pytest
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+from app.ledger import balance_as_of, verify_ledger
+from app.models import BinaryTrade, LedgerEntry, UnderlyingTrade
+from app.migrations import (
+    add_change_seq_columns,
+    add_reserved_column,
+    backfill_opening_entries,
+    migrate_legacy_trades,
+    migrate_trades_command,
+)
+from app.reconcile import reconcile_reserved
+from app.operations import create_user, list_all_trades, list_changes, settle_binary_trade
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Create a test app on a fresh database file."""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'legacy.db'}",
+        'TESTING': True,
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def create_legacy_tables():
+    """Recreate the per-type trade tables older versions used."""
+    db.session.execute(text(
+        "CREATE TABLE binary_trade (id INTEGER PRIMARY KEY, party_a_id INTEGER NOT NULL, "
+        "party_b_id INTEGER NOT NULL, stake_a INTEGER NOT NULL, stake_b INTEGER NOT NULL, "
+        "description VARCHAR(500) NOT NULL, outcome BOOLEAN, status VARCHAR(20))"
+    ))
+    db.session.execute(text(
+        "CREATE TABLE underlying_trade (id INTEGER PRIMARY KEY, long_party_id INTEGER NOT NULL, "
+        "short_party_id INTEGER NOT NULL, lot_size FLOAT NOT NULL, trade_price FLOAT NOT NULL, "
+        "settlement_price FLOAT, description VARCHAR(500) NOT NULL, status VARCHAR(20))"
+    ))
+
+
+@pytest.fixture
+def legacy_book(app):
+    """
+    A legacy book: two binary and two underlying trades, one of each settled.
+
+    The per-type tables predate the ledger, so the book has no ledger rows.
+    """
+    alice = create_user("Alice").id
+    bob = create_user("Bob").id
+    db.session.execute(text("DELETE FROM ledger_entry"))
+    create_legacy_tables()
+    db.session.execute(text(
+        "INSERT INTO binary_trade VALUES "
+        "(1, :a, :b, 20, 10, 'rain', 1, 'settled'), (2, :a, :b, 5, 5, 'snow', NULL, 'open')"
+    ), {'a': alice, 'b': bob})
+    db.session.execute(text(
+        "INSERT INTO underlying_trade VALUES "
+        "(1, :b, :a, 2.0, 100.0, 110.0, 'AAPL', 'settled'), "
+        "(2, :a, :b, 1.0, 50.0, NULL, 'MSFT', 'open')"
+    ), {'a': alice, 'b': bob})
+    # Balances as the old settle functions would have left them
+    db.session.execute(text("UPDATE user SET balance = 1000 + 10 - 20 WHERE id = :a"), {'a': alice})
+    db.session.execute(text("UPDATE user SET balance = 1000 - 10 + 20 WHERE id = :b"), {'b': bob})
+    db.session.commit()
+    return {'alice': alice, 'bob': bob}
+
+
+class TestMigrateLegacyTrades:
+    """Tests for migrate_legacy_trades."""
+
+    def test_noop_without_legacy_tables(self, app):
+        """A database already on the single table has nothing to migrate."""
+        assert migrate_legacy_trades() == {}
+
+    def test_copies_trades_in_old_listing_order(self, app, legacy_book):
+        """Trades get new unique ids, interleaved the way listings ordered them."""
+        new_ids = migrate_legacy_trades()
+
+        assert new_ids == {
+            ('binary', 1): 1, ('underlying', 1): 2,
+            ('binary', 2): 3, ('underlying', 2): 4,
+        }
+        trades = list_all_trades()
+        assert [(t['type'], t['description'], t['status']) for t in trades] == [
+            ('binary', 'rain', 'settled'), ('underlying', 'AAPL', 'settled'),
+            ('binary', 'snow', 'open'), ('underlying', 'MSFT', 'open'),
+        ]
+        assert trades[0]['outcome'] is True
+        assert trades[1]['long_party'] == 'Bob'
+        assert trades[1]['settlement_price'] == 110.0
+        assert trades[1]['settled_at'] is not None
+        assert trades[2]['settled_at'] is None
+
+    def test_backfills_ledger_and_drops_old_tables(self, app, legacy_book):
+        """Users get opening entries at their balances and the old tables are gone."""
+        migrate_legacy_trades()
+
+        assert verify_ledger() == []
+        assert balance_as_of(legacy_book['alice']) == 990
+        assert balance_as_of(legacy_book['bob']) == 1010
+
+        tables = inspect(db.engine).get_table_names()
+        assert 'binary_trade' not in tables
+        assert 'underlying_trade' not in tables
+        assert migrate_legacy_trades() == {}
+
+    def test_repoints_existing_ledger_entries(self, app, legacy_book):
+        """A book that already had a ledger keeps it, pointed at the new ids."""
+        alice, bob = legacy_book['alice'], legacy_book['bob']
+        db.session.add_all([
+            LedgerEntry(user_id=alice, delta=1000),
+            LedgerEntry(user_id=bob, delta=1000),
+            LedgerEntry(user_id=alice, delta=10, trade_type='binary', trade_id=1),
+            LedgerEntry(user_id=bob, delta=-10, trade_type='binary', trade_id=1),
+            LedgerEntry(user_id=bob, delta=20, trade_type='underlying', trade_id=1),
+            LedgerEntry(user_id=alice, delta=-20, trade_type='underlying', trade_id=1),
+        ])
+        db.session.commit()
+
+        migrate_legacy_trades()
+
+        refs = db.session.execute(
+            text("SELECT trade_type, trade_id FROM ledger_entry WHERE trade_id IS NOT NULL")
+        ).all()
+        assert sorted(refs) == [('binary', 1), ('binary', 1), ('underlying', 2), ('underlying', 2)]
+        assert db.session.execute(text("SELECT count(*) FROM ledger_entry")).scalar() == 6
+        assert verify_ledger() == []
+
+    def test_migrated_trades_can_settle(self, app, legacy_book):
+        """Open legacy trades keep working after the move."""
+        new_ids = migrate_legacy_trades()
+
+        settle_binary_trade(new_ids[('binary', 2)], outcome=False)
+
+        trade = db.session.get(BinaryTrade, new_ids[('binary', 2)])
+        assert trade.status == 'settled'
+        assert db.session.get(UnderlyingTrade, new_ids[('underlying', 2)]).status == 'open'
+
+    def test_reserves_open_binary_stakes(self, app, legacy_book):
+        """Open legacy binary trades hold their stakes like new ones do."""
+        migrate_legacy_trades()
+
+        assert reconcile_reserved() == []
+        reserved = dict(db.session.execute(text("SELECT id, reserved FROM user")).all())
+        assert reserved == {legacy_book['alice']: 5, legacy_book['bob']: 5}
+
+
+class TestAddReservedColumn:
+    """Tests for add_reserved_column."""
+
+    def test_noop_when_column_exists(self, app):
+        """A current database already has the column."""
+        assert add_reserved_column() is False
+
+    def test_adds_and_fills_column(self, app, legacy_book):
+        """An old user table gets the column, filled from open trades."""
+        new_ids = migrate_legacy_trades()
+        db.session.execute(text("ALTER TABLE user DROP COLUMN reserved"))
+        db.session.commit()
+
+        assert add_reserved_column() is True
+
+        assert reconcile_reserved() == []
+        settle_binary_trade(new_ids[('binary', 2)], outcome=False)
+        assert db.session.execute(text("SELECT sum(reserved) FROM user")).scalar() == 0
+
+
+class TestAddChangeSeqColumns:
+    """Tests for add_change_seq_columns."""
+
+    def test_noop_when_columns_exist(self, app):
+        """A current database already has both columns."""
+        assert add_change_seq_columns() is False
+
+    def test_adds_indexed_columns_and_stamps_rows(self, app, legacy_book):
+        """Old tables get the column and index; existing rows sync from 0."""
+        migrate_legacy_trades()
+        for table in ('user', 'trade'):
+            db.session.execute(text(f"DROP INDEX ix_{table}_change_seq"))
+            db.session.execute(text(f"ALTER TABLE {table} DROP COLUMN change_seq"))
+        db.session.commit()
+
+        assert add_change_seq_columns() is True
+
+        indexes = {index['name'] for table in ('user', 'trade')
+                   for index in inspect(db.engine).get_indexes(table)}
+        assert {'ix_user_change_seq', 'ix_trade_change_seq'} <= indexes
+        changes = list_changes(0)
+        assert len(changes['users']) == 2
+        assert len(changes['trades']) == 4
+        assert list_changes(changes['seq'])['trades'] == []
+
+
+class TestBackfillOpeningEntries:
+    """Tests for backfill_opening_entries."""
+
+    def test_noop_when_every_user_has_entries(self, app):
+        """Users created since the ledger already have their opening entry."""
+        create_user("Alice")
+
+        assert backfill_opening_entries() == 0
+
+    def test_pre_ledger_database(self, app):
+        """Users from before the ledger get one opening entry at their balance."""
+        alice = create_user("Alice").id
+        bob = create_user("Bob").id
+        db.session.execute(text("UPDATE user SET balance = 990 WHERE id = :a"), {'a': alice})
+        for table in ('balance_snapshot', 'ledger_entry'):
+            db.session.execute(text(f"DROP TABLE {table}"))
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(migrate_trades_command)
+
+        assert "opening balances for 2 user(s)" in result.output
+        assert verify_ledger() == []
+        assert balance_as_of(alice) == 990
+        assert balance_as_of(bob) == 1000
+        assert db.session.execute(text("SELECT count(*) FROM ledger_entry")).scalar() == 2
+        assert backfill_opening_entries() == 0
@@ -2,7 +2,7 @@
 
 import pytest
 from app import create_app, db
-from app.models import User, BinaryTrade, UnderlyingTrade
+from app.models import User, Trade, BinaryTrade, UnderlyingTrade
 
 
 @pytest.fixture
@@ -324,3 +324,61 @@ class TestUnderlyingTradeModel:
 
             assert trade.lot_size == 2.5
             assert trade.trade_price == 99.50
+
+
+class TestTradeModel:
+    """Tests for the shared Trade base of every trade type."""
+
+    def test_types_share_one_id_sequence(self, app):
+        """Trades of different types never reuse each other's ids."""
+        with app.app_context():
+            alice = User(name='Alice')
+            bob = User(name='Bob')
+            db.session.add_all([alice, bob])
+            db.session.commit()
+
+            binary = BinaryTrade(party_a_id=alice.id, party_b_id=bob.id,
+                                 stake_a=10, stake_b=5, description='bet')
+            underlying = UnderlyingTrade(long_party_id=alice.id, short_party_id=bob.id,
+                                         lot_size=1.0, trade_price=100.0, description='AAPL')
+            db.session.add_all([binary, underlying])
+            db.session.commit()
+
+            assert binary.id != underlying.id
+            assert [type(t) for t in Trade.query.order_by(Trade.id)] == [
+                BinaryTrade, UnderlyingTrade,
+            ]
+
+    def test_created_at_is_set_and_settled_at_starts_empty(self, app):
+        """New trades are timestamped; settled_at waits for settlement."""
+        with app.app_context():
+            alice = User(name='Alice')
+            bob = User(name='Bob')
+            db.session.add_all([alice, bob])
+            db.session.commit()
+
+            trade = BinaryTrade(party_a_id=alice.id, party_b_id=bob.id,
+                                stake_a=10, stake_b=5, description='bet')
+            db.session.add(trade)
+            db.session.commit()
+
+            assert trade.created_at is not None
+            assert trade.settled_at is None
+
+    def test_party_names_map_to_shared_columns(self, app):
+        """Type-specific party attributes read and filter the shared columns."""
+        with app.app_context():
+            alice = User(name='Alice')
+            bob = User(name='Bob')
+            db.session.add_all([alice, bob])
+            db.session.commit()
+
+            trade = UnderlyingTrade(long_party_id=alice.id, short_party_id=bob.id,
+                                    lot_size=1.0, trade_price=100.0, description='AAPL')
+            db.session.add(trade)
+            db.session.commit()
+
+            assert trade.first_party_id == alice.id
+            assert trade.long_party.name == 'Alice'
+            assert UnderlyingTrade.query.filter_by(short_party_id=bob.id).one() is trade
+            assert BinaryTrade.query.count() == 0
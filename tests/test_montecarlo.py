@@ -0,0 +1,172 @@
+"""Tests for the Monte Carlo of final balances from open binary trades."""
+
+import pytest
+
+from app import create_app, db
+from app.models import User
+from app.montecarlo import SimulationError, simulate_balances
+from app.operations import create_user, create_binary_trade, settle_binary_trade
+
+
+@pytest.fixture
+def app():
+    """Create a test Flask application with an in-memory database."""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'TESTING': True})
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client for making HTTP requests."""
+    return app.test_client()
+
+
+@pytest.fixture
+def book(app):
+    """Alice vs Bob on two bets, Bob vs Carol on one, plus a settled bet."""
+    alice = create_user("Alice").id
+    bob = create_user("Bob").id
+    carol = create_user("Carol").id
+    rain = create_binary_trade(alice, bob, 20, 10, "Will it rain?").id
+    snow = create_binary_trade(alice, bob, 5, 5, "Will it snow?").id
+    sun = create_binary_trade(bob, carol, 30, 30, "Will it be sunny?").id
+    settled = create_binary_trade(alice, carol, 1, 1, "Done")
+    settle_binary_trade(settled.id, True)
+    return {'alice': alice, 'bob': bob, 'carol': carol,
+            'rain': rain, 'snow': snow, 'sun': sun}
+
+
+def by_user(result):
+    return {user['user_id']: user for user in result['users']}
+
+
+class TestSimulateBalances:
+    """Tests for simulate_balances."""
+
+    def test_certain_outcomes_give_exact_balances(self, app, book):
+        """With probabilities of 0 and 1 every draw is the same."""
+        result = simulate_balances(
+            {book['rain']: 1.0, book['snow']: 0.0, book['sun']: 1.0}, draws=1000, seed=1)
+
+        users = by_user(result)
+        # Alice: settled +1, rain +10, snow -5
+        assert users[book['alice']]['quantiles']['0.01'] == 1006
+        assert users[book['alice']]['quantiles']['0.99'] == 1006
+        assert users[book['alice']]['mean'] == 1006
+        # Bob: rain -10, snow +5, sun +30
+        assert users[book['bob']]['mean'] == 1025
+        assert result['trades'] == 3
+
+    def test_distribution_matches_probabilities(self, app, book):
+        """Quantiles and means follow the YES probability."""
+        result = simulate_balances({book['rain']: 0.25}, draws=200_000, seed=3,
+                                   quantiles=[0.1, 0.5, 0.8], default_probability=1.0)
+
+        alice = by_user(result)[book['alice']]
+        # Alice wins 10 with p=0.25 and loses 20 otherwise, plus +5 on snow
+        assert alice['quantiles'] == {'0.1': 986, '0.5': 986, '0.8': 1016}
+        assert alice['mean'] == pytest.approx(1001 + 5 + 0.25 * 10 - 0.75 * 20, abs=0.2)
+
+    def test_balances_are_zero_sum(self, app, book):
+        """Every bet moves minimarbles between users, so means add up."""
+        result = simulate_balances({}, draws=50_000, seed=5, default_probability=0.5)
+
+        users = result['users']
+        assert sum(u['mean'] for u in users) == pytest.approx(sum(u['balance'] for u in users))
+
+    def test_probability_of_ending_negative(self, app, book):
+        """A user who can't cover a loss ends negative that often."""
+        db.session.get(User, book['carol']).balance = 10
+        db.session.commit()
+
+        result = simulate_balances({}, draws=100_000, seed=9, default_probability=0.4)
+
+        # Carol loses 30 when sun settles YES
+        assert by_user(result)[book['carol']]['p_negative'] == pytest.approx(0.4, abs=0.01)
+        assert by_user(result)[book['alice']]['p_negative'] == 0.0
+
+    def test_seeded_runs_are_reproducible(self, app, book):
+        """The same seed gives the same result, another seed doesn't."""
+        def run(seed):
+            return simulate_balances({}, draws=20_000, seed=seed, default_probability=0.5)
+
+        assert run(11) == run(11)
+        assert run(11) != run(12)
+
+    def test_chunked_and_pooled_runs_agree(self, app, book):
+        """Spreading the chunks over processes changes nothing."""
+        app.config['MONTECARLO_CHUNK_CELLS'] = 3000
+        in_process = simulate_balances({}, draws=10_000, seed=4, default_probability=0.3)
+
+        app.config.update(MONTECARLO_WORKERS=2, MONTECARLO_POOL_MIN_CELLS=0)
+        pooled = simulate_balances({}, draws=10_000, seed=4, default_probability=0.3)
+
+        assert pooled == in_process
+
+    def test_rejects_books_with_too_many_outcomes(self, app, book):
+        """The tally needs a bin per possible balance, so it is capped."""
+        app.config['MONTECARLO_MAX_BINS'] = 100
+
+        with pytest.raises(SimulationError, match="possible balances"):
+            simulate_balances({}, draws=10, seed=0, default_probability=0.5)
+
+    def test_no_open_trades(self, app):
+        """Without open binary trades there is nobody to report on."""
+        assert simulate_balances({}, draws=10, seed=0)['users'] == []
+
+    @pytest.mark.parametrize('kwargs', [
+        {'probabilities': {999: 0.5}},
+        {'probabilities': {}},
+        {'probabilities': {}, 'default_probability': 1.5},
+        {'draws': 0},
+        {'draws': 1_000_001},
+        {'seed': -1},
+        {'quantiles': [2]},
+    ])
+    def test_rejects_bad_requests(self, app, book, kwargs):
+        """Unknown trades, missing probabilities and bad numbers are refused."""
+        args = {'probabilities': {book['rain']: 0.5, book['snow']: 0.5, book['sun']: 0.5},
+                'draws': 10, 'seed': 0, **kwargs}
+
+        with pytest.raises(SimulationError):
+            simulate_balances(**args)
+
+
+class TestMonteCarloRoute:
+    """Tests for POST /risk/montecarlo."""
+
+    def test_returns_per_user_distribution(self, client, book):
+        """String trade ids from JSON are accepted."""
+        response = client.post('/risk/montecarlo', json={
+            'probabilities': {str(book['rain']): 0.5},
+            'default_probability': 0.5,
+            'draws': 1000,
+            'seed': 1,
+            'quantiles': [0.5],
+        })
+
+        data = response.get_json()
+        assert response.status_code == 200
+        assert len(data['users']) == 3
+        assert set(data['users'][0]) == {'user_id', 'balance', 'mean', 'quantiles', 'p_negative'}
+
+    def test_too_many_outcomes_returns_400(self, client, app, book):
+        app.config['MONTECARLO_MAX_BINS'] = 100
+
+        response = client.post('/risk/montecarlo', json={
+            'default_probability': 0.5, 'draws': 10, 'seed': 1,
+        })
+
+        assert response.status_code == 400
+        assert 'possible balances' in response.get_json()['error']
+
+    def test_invalid_request_returns_400(self, client, book):
+        """Bad bodies are rejected with an error message."""
+        assert client.post('/risk/montecarlo', json={'draws': 10}).status_code == 400
+        assert client.post('/risk/montecarlo', json={
+            'probabilities': {'rain': 0.5}, 'draws': 10, 'seed': 1,
+        }).status_code == 400
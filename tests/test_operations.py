@@ -1,16 +1,29 @@
 """Tests for database operations."""
 
+from datetime import datetime
+
 import pytest
+from sqlalchemy import event, text
+
 from app import create_app, db
 from app.models import User, BinaryTrade, UnderlyingTrade
 from app.operations import (
     create_user,
     create_binary_trade,
     create_underlying_trade,
+    add_trades,
     settle_binary_trade,
     settle_underlying_trade,
+    settle_trades_bulk,
     get_user_balance,
     list_all_users,
+    list_all_trades,
+    list_trades_page,
+    list_recent_trades,
+    list_changes,
+    iter_trades,
+    iter_users,
+    SettlementError,
 )
 
 
@@ -33,6 +46,26 @@ def client(app):
     return app.test_client()
 
 
+@pytest.fixture
+def count_queries(app):
+    """Return a function that counts SQL statements run by a callable."""
+    def count(fn):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            fn()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return len(statements)
+
+    return count
+
+
 class TestCreateUser:
     """Tests for user creation."""
 
@@ -203,6 +236,33 @@ class TestCreateUnderlyingTrade:
             assert trade.short_party.name == "Bob"
 
 
+class TestAddTrades:
+    """Tests for staging trades in bulk."""
+
+    def test_returns_ids_in_order_given(self, app):
+        """Each returned id is the trade built from the matching dict."""
+        alice = create_user("Alice").id
+        bob = create_user("Bob").id
+        create_binary_trade(alice, bob, 1, 1, "Earlier trade")
+
+        trade_ids = add_trades([
+            {'type': 'binary', 'first_party_id': alice, 'second_party_id': bob,
+             'stake_a': 0, 'stake_b': 0, 'description': 'first'},
+            {'type': 'underlying', 'first_party_id': bob, 'second_party_id': alice,
+             'lot_size': 1.0, 'trade_price': 10.0, 'underlying': 'AAPL', 'description': 'second'},
+            {'type': 'binary', 'first_party_id': bob, 'second_party_id': alice,
+             'stake_a': 0, 'stake_b': 0, 'description': 'third'},
+        ])
+        db.session.commit()
+
+        trades = {t['id']: t for t in list_all_trades()}
+        assert [trades[i]['description'] for i in trade_ids] == ['first', 'second', 'third']
+        assert [trades[i]['status'] for i in trade_ids] == ['open'] * 3
+
+    def test_nothing_to_add(self, app):
+        assert add_trades([]) == []
+
+
 class TestSettleBinaryTrade:
     """Tests for settling binary trades."""
 
@@ -292,6 +352,30 @@ class TestSettleBinaryTrade:
             assert total_before == total_after
 
 
+    def test_settle_binary_trade_twice_raises(self, app):
+        """A settled trade cannot be settled again (no double payout)."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            trade = create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?")
+            settle_binary_trade(trade.id, outcome=True)
+
+            with pytest.raises(SettlementError) as excinfo:
+                settle_binary_trade(trade.id, outcome=False)
+
+            assert excinfo.value.errors == [{'id': trade.id, 'error': 'trade is not open'}]
+            assert get_user_balance(alice.id) == 1010
+            assert db.session.get(BinaryTrade, trade.id).outcome is True
+
+    def test_settle_missing_binary_trade_raises(self, app):
+        """Settling a trade that doesn't exist raises SettlementError."""
+        with app.app_context():
+            with pytest.raises(SettlementError) as excinfo:
+                settle_binary_trade(999, outcome=True)
+
+            assert excinfo.value.errors == [{'id': 999, 'error': 'trade not found'}]
+
+
 class TestSettleUnderlyingTrade:
     """Tests for settling underlying trades."""
 
@@ -383,6 +467,21 @@ class TestSettleUnderlyingTrade:
             assert total_before == total_after
 
 
+    def test_settle_underlying_trade_twice_raises(self, app):
+        """A settled trade cannot be settled again (no double payout)."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            trade = create_underlying_trade(alice.id, bob.id, 10, 100.0, "AAPL")
+            settle_underlying_trade(trade.id, settlement_price=110.0)
+
+            with pytest.raises(SettlementError):
+                settle_underlying_trade(trade.id, settlement_price=90.0)
+
+            assert get_user_balance(alice.id) == 1100
+            assert db.session.get(UnderlyingTrade, trade.id).settlement_price == 110.0
+
+
 class TestGetUserBalance:
     """Tests for getting a user's balance."""
 
@@ -472,3 +571,501 @@ class TestListAllUsers:
 
             assert alice_data.balance == 1050  # Won 50
             assert bob_data.balance == 950     # Lost 50
+
+
+class TestSettleTradesBulk:
+    """Tests for settling many trades in one transaction."""
+
+    def test_settles_binary_and_underlying_trades(self, app):
+        """A mixed batch should settle every trade and update balances."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+
+            binary = create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?")
+            underlying = create_underlying_trade(alice.id, bob.id, 10, 100.0, "AAPL")
+
+            settled = settle_trades_bulk([(binary.id, True), (underlying.id, 110.0)])
+
+            assert {'id': binary.id, 'type': 'binary'} in settled
+            assert {'id': underlying.id, 'type': 'underlying'} in settled
+
+            binary = db.session.get(BinaryTrade, binary.id)
+            underlying = db.session.get(UnderlyingTrade, underlying.id)
+            assert binary.status == "settled"
+            assert binary.outcome is True
+            assert underlying.status == "settled"
+            assert underlying.settlement_price == 110.0
+
+            # Alice wins 10 on the binary and 100 on the underlying
+            assert get_user_balance(alice.id) == 1110
+            assert get_user_balance(bob.id) == 890
+
+    def test_matches_single_trade_settlement(self, app):
+        """Bulk settlement should produce the same balances as one-by-one."""
+        with app.app_context():
+            alice, bob, carol = create_user("Alice"), create_user("Bob"), create_user("Carol")
+            dave, erin, frank = create_user("Dave"), create_user("Erin"), create_user("Frank")
+
+            # The same book twice: once for Alice/Bob/Carol, once for Dave/Erin/Frank
+            bulk_pairs = [(alice, bob), (bob, carol), (carol, alice)]
+            single_pairs = [(dave, erin), (erin, frank), (frank, dave)]
+
+            bulk = []
+            for i, ((a, b), (c, d)) in enumerate(zip(bulk_pairs, single_pairs)):
+                outcome = i % 2 == 0
+                price = 90.0 + 7 * i
+
+                trade = create_binary_trade(a.id, b.id, 10 + i, 5 + i, "bulk")
+                bulk.append((trade.id, outcome))
+                trade = create_underlying_trade(a.id, b.id, 1.5 + i, 100.0, "bulk")
+                bulk.append((trade.id, price))
+
+                trade = create_binary_trade(c.id, d.id, 10 + i, 5 + i, "single")
+                settle_binary_trade(trade.id, outcome)
+                trade = create_underlying_trade(c.id, d.id, 1.5 + i, 100.0, "single")
+                settle_underlying_trade(trade.id, price)
+
+            settle_trades_bulk(bulk)
+
+            assert get_user_balance(alice.id) == get_user_balance(dave.id)
+            assert get_user_balance(bob.id) == get_user_balance(erin.id)
+            assert get_user_balance(carol.id) == get_user_balance(frank.id)
+
+            # Minimarbles are conserved across the whole batch
+            assert sum(u.balance for u in list_all_users()) == 6000
+
+    def test_all_or_nothing_when_trade_missing(self, app):
+        """If any trade is missing, no trade is settled and no balance changes."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            trade = create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?")
+
+            with pytest.raises(SettlementError) as excinfo:
+                settle_trades_bulk([(trade.id, True), (999, False)])
+
+            assert excinfo.value.errors == [{'id': 999, 'error': 'trade not found'}]
+            assert db.session.get(BinaryTrade, trade.id).status == "open"
+            assert get_user_balance(alice.id) == 1000
+            assert get_user_balance(bob.id) == 1000
+
+    def test_rejects_already_settled_trade(self, app):
+        """Settled trades cannot be settled again."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            trade = create_underlying_trade(alice.id, bob.id, 10, 100.0, "AAPL")
+            settle_underlying_trade(trade.id, 110.0)
+
+            with pytest.raises(SettlementError) as excinfo:
+                settle_trades_bulk([(trade.id, 120.0)])
+
+            assert excinfo.value.errors == [{'id': trade.id, 'error': 'trade is not open'}]
+            assert get_user_balance(alice.id) == 1100
+
+    def test_reports_every_error(self, app):
+        """All problems in the batch should be reported, not just the first."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            trade = create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?")
+
+            with pytest.raises(SettlementError) as excinfo:
+                settle_trades_bulk([
+                    (trade.id, True),
+                    (trade.id, False),
+                    (998, 10.0),
+                    (997, "yes"),
+                ])
+
+            errors = excinfo.value.errors
+            assert len(errors) == 3
+            assert {'id': trade.id, 'error': 'trade appears more than once'} in errors
+            assert {'id': 998, 'error': 'trade not found'} in errors
+            assert {'id': 997, 'error': 'invalid outcome or settlement price'} in errors
+
+    def test_empty_batch(self, app):
+        """Settling nothing should be a no-op."""
+        with app.app_context():
+            assert settle_trades_bulk([]) == []
+
+
+class TestListAllTrades:
+    """Tests for listing all trades."""
+
+    def test_list_all_trades_empty(self, app):
+        """Should return an empty list when no trades exist."""
+        with app.app_context():
+            assert list_all_trades() == []
+
+    def test_list_all_trades_includes_party_names(self, app):
+        """Trades should carry the names of both parties."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?")
+            create_underlying_trade(bob.id, alice.id, 2.5, 100.0, "AAPL")
+
+            trades = list_all_trades()
+
+            binary = next(t for t in trades if t['type'] == 'binary')
+            underlying = next(t for t in trades if t['type'] == 'underlying')
+            assert binary['party_a'] == "Alice"
+            assert binary['party_b'] == "Bob"
+            assert binary['outcome'] is None
+            assert underlying['long_party'] == "Bob"
+            assert underlying['short_party'] == "Alice"
+            assert underlying['lot_size'] == 2.5
+
+    def test_trades_with_a_missing_party_are_listed(self, app):
+        """A trade whose party row is gone is kept, with no name for that party."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?")
+            create_underlying_trade(bob.id, alice.id, 2.5, 100.0, "AAPL")
+            seq = list_changes()['seq']
+            db.session.commit()
+            db.session.execute(text("PRAGMA foreign_keys = OFF"))
+            db.session.execute(text("DELETE FROM user WHERE id = :id"), {'id': bob.id})
+            db.session.commit()
+
+            trades = list_all_trades()
+            binary = next(t for t in trades if t['type'] == 'binary')
+            underlying = next(t for t in trades if t['type'] == 'underlying')
+            assert (binary['party_a'], binary['party_b']) == ("Alice", None)
+            assert (underlying['long_party'], underlying['short_party']) == (None, "Alice")
+            assert [t['id'] for t in list_trades_page()[0]] == [t['id'] for t in trades]
+            assert len(list_changes(seq - 2)['trades']) == 2
+
+    def test_query_count_does_not_grow_with_trades(self, app, count_queries):
+        """Listing trades should run a fixed number of queries (no N+1)."""
+        with app.app_context():
+            users = [create_user(f"User {i}") for i in range(6)]
+
+            def add_trades(n):
+                for i in range(n):
+                    a, b = users[i % 6], users[(i + 1) % 6]
+                    create_binary_trade(a.id, b.id, 10, 5, "bet")
+                    create_underlying_trade(a.id, b.id, 1, 100.0, "price")
+
+            add_trades(2)
+            db.session.expire_all()
+            small = count_queries(list_all_trades)
+
+            add_trades(30)
+            db.session.expire_all()
+            large = count_queries(list_all_trades)
+
+            assert small == large == 1
+            assert len(list_all_trades()) == 64
+
+
+class TestListTradesPage:
+    """Tests for keyset-paginated trade listing."""
+
+    @pytest.fixture
+    def book(self, app):
+        """Three users with interleaved binary and underlying trades."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            carol = create_user("Carol")
+            for i in range(5):
+                create_binary_trade(alice.id, bob.id, 10, 5, f"binary {i}")
+                create_underlying_trade(bob.id, carol.id, 1, 100.0, f"underlying {i}")
+            settle_binary_trade(1, True)
+            settle_underlying_trade(2, 110.0)
+            yield {'alice': alice.id, 'bob': bob.id, 'carol': carol.id}
+
+    def walk(self, **filters):
+        """Collect every page, returning (trades, page_count)."""
+        trades, pages, cursor = [], 0, None
+        while True:
+            page, cursor = list_trades_page(after=cursor, **filters)
+            trades.extend(page)
+            pages += 1
+            if cursor is None:
+                return trades, pages
+
+    def test_first_page(self, app, book):
+        """The first page should hold the lowest ids, of either type."""
+        trades, cursor = list_trades_page(limit=3)
+
+        assert [(t['id'], t['type']) for t in trades] == [
+            (1, 'binary'), (2, 'underlying'), (3, 'binary'),
+        ]
+        assert cursor == '3'
+
+    def test_walking_pages_returns_every_trade_once(self, app, book):
+        """Following cursors should visit every trade exactly once, in order."""
+        trades, pages = self.walk(limit=3)
+
+        ids = [t['id'] for t in trades]
+        assert ids == list(range(1, 11))
+        assert pages == 4
+
+    def test_last_page_has_no_cursor(self, app, book):
+        """A page that reaches the end should not return a cursor."""
+        trades, cursor = list_trades_page(limit=10)
+
+        assert len(trades) == 10
+        assert cursor is None
+
+    def test_filter_by_type(self, app, book):
+        """type should restrict the listing to one trade table."""
+        trades, _ = self.walk(limit=2, trade_type='underlying')
+
+        assert len(trades) == 5
+        assert all(t['type'] == 'underlying' for t in trades)
+
+    def test_filter_by_status(self, app, book):
+        """status should only return trades in that state."""
+        trades, _ = self.walk(limit=2, status='settled')
+
+        assert [(t['id'], t['type']) for t in trades] == [(1, 'binary'), (2, 'underlying')]
+
+    def test_filter_by_user(self, app, book):
+        """user_id should match a user on either side of a trade."""
+        alice_trades, _ = self.walk(limit=4, user_id=book['alice'])
+        bob_trades, _ = self.walk(limit=4, user_id=book['bob'])
+
+        assert len(alice_trades) == 5
+        assert all(t['type'] == 'binary' for t in alice_trades)
+        assert len(bob_trades) == 10
+
+    def test_filter_by_id_range(self, app, book):
+        """min_id and max_id should bound the ids inclusively."""
+        trades, _ = self.walk(limit=3, min_id=2, max_id=5)
+
+        assert [(t['id'], t['type']) for t in trades] == [
+            (2, 'underlying'), (3, 'binary'), (4, 'underlying'), (5, 'binary'),
+        ]
+
+    def test_invalid_cursor(self, app, book):
+        """A malformed cursor should raise ValueError."""
+        with pytest.raises(ValueError):
+            list_trades_page(after='nonsense')
+
+    def test_invalid_type(self, app, book):
+        """An unknown trade type should raise ValueError."""
+        with pytest.raises(ValueError):
+            list_trades_page(trade_type='option')
+
+
+class TestStreamingIterators:
+    """Tests for the batched export iterators."""
+
+    def test_iter_trades_matches_list_all_trades(self, app):
+        """Streaming should yield the same rows as the full listing."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            for i in range(5):
+                create_binary_trade(alice.id, bob.id, 10, 5, f"bet {i}")
+                create_underlying_trade(alice.id, bob.id, 1.0, 100.0, f"price {i}")
+
+            assert list(iter_trades(batch_size=2)) == list_all_trades()
+
+    def test_iter_users_yields_plain_dicts(self, app):
+        """Users should stream as id/name/balance dicts in id order."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+
+            assert list(iter_users(batch_size=1)) == [
+                {'id': alice.id, 'name': "Alice", 'balance': 1000},
+                {'id': bob.id, 'name': "Bob", 'balance': 1000},
+            ]
+
+    def test_iterators_are_lazy(self, app, count_queries):
+        """No query should run until the first row is requested."""
+        with app.app_context():
+            create_user("Alice")
+
+            assert count_queries(iter_users) == 0
+            assert count_queries(iter_trades) == 0
+
+
+class TestSingleTradeTable:
+    """Tests for trades of every type sharing one table."""
+
+    def test_settle_with_wrong_type_is_not_found(self, app):
+        """A binary settlement can't touch an underlying trade and vice versa."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            binary = create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?")
+            underlying = create_underlying_trade(alice.id, bob.id, 10, 100.0, "AAPL")
+
+            with pytest.raises(SettlementError) as excinfo:
+                settle_binary_trade(underlying.id, outcome=True)
+            assert excinfo.value.errors == [{'id': underlying.id, 'error': 'trade not found'}]
+
+            with pytest.raises(SettlementError):
+                settle_trades_bulk([(binary.id, 110.0)])
+            assert db.session.get(BinaryTrade, binary.id).status == 'open'
+            assert db.session.get(UnderlyingTrade, underlying.id).status == 'open'
+
+    def test_settlement_stamps_settled_at(self, app):
+        """Single and bulk settlement both record when a trade settled."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            single = create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?")
+            bulk = create_underlying_trade(alice.id, bob.id, 10, 100.0, "AAPL")
+
+            settle_binary_trade(single.id, outcome=True)
+            settle_trades_bulk([(bulk.id, 110.0)])
+
+            for model, trade_id in ((BinaryTrade, single.id), (UnderlyingTrade, bulk.id)):
+                trade = db.session.get(model, trade_id)
+                assert trade.settled_at is not None
+                assert trade.settled_at >= trade.created_at
+
+    def test_listings_carry_timestamps(self, app):
+        """Trade dicts include ISO created_at and settled_at."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            trade = create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?")
+            settle_binary_trade(trade.id, outcome=False)
+
+            listed, = list_all_trades()
+
+            assert listed['created_at'] == trade.created_at.isoformat()
+            assert listed['settled_at'] == trade.settled_at.isoformat()
+
+
+class TestListRecentTrades:
+    """Tests for the newest-first listing across trade types."""
+
+    @pytest.fixture
+    def book(self, app):
+        """Alternating binary and underlying trades."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            for i in range(4):
+                create_binary_trade(alice.id, bob.id, 10, 5, f"binary {i}")
+                create_underlying_trade(alice.id, bob.id, 1, 100.0, f"underlying {i}")
+
+    def test_newest_first_across_types(self, app, book):
+        """The latest trades of both types come back in one list."""
+        trades = list_recent_trades(limit=3)
+
+        assert [(t['id'], t['type']) for t in trades] == [
+            (8, 'underlying'), (7, 'binary'), (6, 'underlying'),
+        ]
+
+    def test_single_query_on_created_at_index(self, app, book, count_queries):
+        """The listing is one query that walks the created_at index."""
+        plans = []
+
+        def explain(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('SELECT'):
+                plans.append(conn.exec_driver_sql(
+                    'EXPLAIN QUERY PLAN ' + statement, parameters).all())
+
+        assert count_queries(lambda: list_recent_trades(limit=3)) == 1
+
+        event.listen(db.engine, 'before_cursor_execute', explain)
+        try:
+            list_recent_trades(limit=3)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', explain)
+
+        details = [row[-1] for row in plans[0]]
+        assert any('ix_trade_created_at' in detail for detail in details)
+        assert not any('TEMP B-TREE' in detail for detail in details)
+
+    def test_time_window(self, app, book):
+        """since and until bound created_at."""
+        trades = list_all_trades()
+        third = datetime.fromisoformat(trades[2]['created_at'])
+        sixth = datetime.fromisoformat(trades[5]['created_at'])
+
+        window = list_recent_trades(since=third, until=sixth)
+
+        assert [t['id'] for t in window] == [5, 4, 3]
+
+
+class TestListChanges:
+    """Tests for list_changes and the change sequence it reads."""
+
+    @pytest.fixture
+    def book(self, app):
+        """Three users and one trade of each type."""
+        alice = create_user("Alice").id
+        bob = create_user("Bob").id
+        create_user("Carol")
+        create_binary_trade(alice, bob, 10, 5, "Rain?")
+        create_underlying_trade(alice, bob, 1.0, 100.0, "AAPL")
+        return {'alice': alice, 'bob': bob, 'seq': list_changes()['seq']}
+
+    def test_from_zero_lists_everything(self, app, book):
+        """since=0 returns every user and trade."""
+        changes = list_changes(0)
+
+        assert changes['seq'] == 5
+        assert [user['name'] for user in changes['users']] == ['Alice', 'Bob', 'Carol']
+        assert [trade['id'] for trade in changes['trades']] == [1, 2]
+
+    def test_settlement_stamps_trade_and_both_parties(self, app, book):
+        """Only the settled trade and the users whose balance moved come back."""
+        settle_binary_trade(1, outcome=True)
+
+        changes = list_changes(book['seq'])
+
+        assert changes['seq'] == book['seq'] + 1
+        assert [(t['id'], t['status']) for t in changes['trades']] == [(1, 'settled')]
+        assert {user['name']: user['balance'] for user in changes['users']} == {
+            'Alice': 1005, 'Bob': 995}
+
+    def test_bulk_settlement_takes_one_number(self, app, book):
+        """Every row written by one bulk settlement shares its sequence number."""
+        settle_trades_bulk([(1, False), (2, 110.0)])
+
+        changes = list_changes(book['seq'])
+
+        assert changes['seq'] == book['seq'] + 1
+        assert [trade['id'] for trade in changes['trades']] == [1, 2]
+        assert len(changes['users']) == 2
+
+    def test_rows_are_ordered_by_when_they_changed(self, app, book):
+        """A row changed later comes after one changed earlier, whatever its id."""
+        settle_underlying_trade(2, 90.0)
+        settle_binary_trade(1, outcome=True)
+
+        assert [t['id'] for t in list_changes(book['seq'])['trades']] == [2, 1]
+
+    def test_failed_write_takes_no_number(self, app, book):
+        """A settlement that is rejected leaves the sequence where it was."""
+        settle_binary_trade(1, outcome=True)
+        seq = list_changes()['seq']
+
+        with pytest.raises(SettlementError):
+            settle_binary_trade(1, outcome=True)
+
+        assert list_changes(seq) == {'seq': seq, 'users': [], 'trades': []}
+
+    def test_range_scans_on_change_seq_indexes(self, app, book):
+        """Both queries walk their change_seq index without sorting."""
+        plans = []
+
+        def explain(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('SELECT') and 'change_seq' in statement:
+                plans.append(conn.exec_driver_sql(
+                    'EXPLAIN QUERY PLAN ' + statement, parameters).all())
+
+        event.listen(db.engine, 'before_cursor_execute', explain)
+        try:
+            list_changes(book['seq'] - 1)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', explain)
+
+        users, trades = ([row[-1] for row in plan] for plan in plans)
+        assert any('ix_user_change_seq' in detail for detail in users)
+        assert any('ix_trade_change_seq' in detail for detail in trades)
+        assert not any('TEMP B-TREE' in detail for detail in users + trades)
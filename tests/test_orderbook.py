@@ -0,0 +1,389 @@
+"""Tests for resting orders and the matching engine."""
+
+import pytest
+from sqlalchemy import text
+
+from app import db
+from app.models import BinaryTrade, Order, UnderlyingTrade
+from app.operations import (
+    InsufficientBalanceError,
+    create_user,
+    list_changes,
+    settle_binary_trade,
+)
+from app.orderbook import (
+    OrderBook,
+    OrderError,
+    RestingOrder,
+    cancel_order,
+    get_order_book,
+    place_order,
+    place_orders,
+)
+from app.reconcile import reconcile_reserved
+
+
+@pytest.fixture
+def app(make_app):
+    """Create a test Flask application on a fresh database file."""
+    app = make_app()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client for making HTTP requests."""
+    return app.test_client()
+
+
+@pytest.fixture
+def users(app):
+    """Alice, Bob and Carol, each with the default balance of 1000."""
+    return {name: create_user(name.title()).id for name in ('alice', 'bob', 'carol')}
+
+
+def reserved(user_id):
+    """Read a user's reserved amount straight from the database."""
+    return db.session.execute(
+        text("SELECT reserved FROM user WHERE id = :id"), {'id': user_id}
+    ).scalar()
+
+
+def resting(order_id, side, price, quantity, user_id=1):
+    return RestingOrder(order_id, user_id, side, price, quantity)
+
+
+class TestOrderBook:
+    """Tests for the in-memory price-time book."""
+
+    def test_fills_best_price_first(self):
+        """A buy lifts the cheapest offer first, at the offer's price."""
+        book = OrderBook([resting(1, 'sell', 102.0, 1), resting(2, 'sell', 101.0, 1)])
+
+        fills, cancelled, remaining = book.match('buy', 105.0, 1.5, user_id=9)
+
+        assert [(order.id, order.price, filled) for order, filled in fills] == [
+            (2, 101.0, 1), (1, 102.0, 0.5)]
+        assert cancelled == []
+        assert remaining == 0
+        assert book.depth() == ([], [{'price': 102.0, 'quantity': 0.5, 'orders': 1}])
+
+    def test_oldest_first_within_a_price(self):
+        """Orders at the same price fill in the order they arrived."""
+        book = OrderBook()
+        for order_id in (3, 1, 2):
+            book.add(resting(order_id, 'buy', 50, 1))
+
+        fills, _, _ = book.match('sell', 50, 2, user_id=9)
+
+        assert [order.id for order, _ in fills] == [1, 2]
+        assert 3 in book and 1 not in book
+
+    def test_stops_at_the_limit(self):
+        """Orders that don't cross the limit are left alone."""
+        book = OrderBook([resting(1, 'buy', 99.0, 1), resting(2, 'buy', 97.0, 1)])
+
+        fills, _, remaining = book.match('sell', 98.0, 5, user_id=9)
+
+        assert [order.id for order, _ in fills] == [1]
+        assert remaining == 4
+        assert len(book) == 1
+
+    def test_own_orders_are_cancelled_not_filled(self):
+        """An order never trades with its user's own resting order."""
+        book = OrderBook([resting(1, 'sell', 10, 1, user_id=7), resting(2, 'sell', 11, 1)])
+
+        fills, cancelled, remaining = book.match('buy', 11, 1, user_id=7)
+
+        assert [order.id for order in cancelled] == [1]
+        assert [order.id for order, _ in fills] == [2]
+        assert remaining == 0
+        assert len(book) == 0
+
+    def test_cancelled_orders_are_skipped(self):
+        """A cancelled order is gone even while still in its heap."""
+        book = OrderBook([resting(1, 'sell', 10, 1), resting(2, 'sell', 11, 1)])
+
+        assert book.cancel(1).id == 1
+        assert book.cancel(1) is None
+        fills, _, _ = book.match('buy', 20, 1, user_id=9)
+
+        assert [order.id for order, _ in fills] == [2]
+
+    def test_fractional_fills_leave_nothing(self):
+        """Fractional lots that add up to an order fill it exactly."""
+        book = OrderBook([resting(1, 'sell', 10.0, 0.3)])
+
+        for _ in range(3):
+            book.match('buy', 10.0, 0.1, user_id=9)
+
+        assert len(book) == 0
+
+    def test_depth_sums_levels(self):
+        """Depth sums quantity and counts orders per price, best first."""
+        book = OrderBook([
+            resting(1, 'buy', 40, 2), resting(2, 'buy', 45, 1), resting(3, 'buy', 40, 3),
+            resting(4, 'sell', 60, 1),
+        ])
+
+        bids, asks = book.depth()
+
+        assert bids == [{'price': 45, 'quantity': 1, 'orders': 1},
+                        {'price': 40, 'quantity': 5, 'orders': 2}]
+        assert asks == [{'price': 60, 'quantity': 1, 'orders': 1}]
+
+
+class TestPlaceOrder:
+    """Tests for placing orders through the matching engine."""
+
+    def test_resting_order_is_stored(self, app, users):
+        """An order that doesn't cross rests in the book and the table."""
+        result = place_order(users['alice'], 'underlying', 'AAPL', 'buy', 100.0, 2)
+
+        assert result['fills'] == []
+        assert result['order']['status'] == 'open'
+        assert db.session.get(Order, result['order']['id']).remaining == 2
+        assert get_order_book('underlying', 'AAPL')['bids'] == [
+            {'price': 100.0, 'quantity': 2.0, 'orders': 1}]
+
+    def test_underlying_fill_creates_trade(self, app, users):
+        """A crossing order creates an underlying trade at the resting price."""
+        offer = place_order(users['alice'], 'underlying', 'AAPL', 'sell', 100.0, 3)['order']
+
+        result = place_order(users['bob'], 'underlying', 'AAPL', 'buy', 101.0, 2)
+
+        assert result['order']['status'] == 'filled'
+        fill, = result['fills']
+        assert fill['order_id'] == offer['id']
+        trade = db.session.get(UnderlyingTrade, fill['trade_id'])
+        assert (trade.long_party_id, trade.short_party_id) == (users['bob'], users['alice'])
+        assert (trade.lot_size, trade.trade_price, trade.underlying) == (2, 100.0, 'AAPL')
+        assert db.session.get(Order, offer['id']).remaining == 1
+
+    def test_fills_are_in_the_change_feed(self, app, users):
+        """Trades from fills are stamped for GET /changes like any other."""
+        seq = list_changes()['seq']
+        place_order(users['alice'], 'underlying', 'AAPL', 'sell', 100.0, 1)
+        place_order(users['alice'], 'underlying', 'AAPL', 'sell', 101.0, 1)
+
+        place_order(users['bob'], 'underlying', 'AAPL', 'buy', 101.0, 2)
+
+        changes = list_changes(seq)
+        assert [t['trade_price'] for t in changes['trades']] == [100.0, 101.0]
+
+    def test_binary_fill_creates_trade(self, app, users):
+        """Binary fills stake price and 100 - price per contract."""
+        place_order(users['alice'], 'binary', 'Rain?', 'buy', 60, 5)
+
+        result = place_order(users['bob'], 'binary', 'Rain?', 'sell', 55, 3)
+
+        trade = db.session.get(BinaryTrade, result['fills'][0]['trade_id'])
+        assert (trade.party_a_id, trade.party_b_id) == (users['alice'], users['bob'])
+        assert (trade.stake_a, trade.stake_b, trade.description) == (180, 120, 'Rain?')
+        assert result['order']['status'] == 'filled'
+
+    def test_binary_orders_reserve_their_stake(self, app, users):
+        """A resting binary order holds its stake; a fill hands it to the trade."""
+        place_order(users['alice'], 'binary', 'Rain?', 'buy', 60, 5)
+        assert reserved(users['alice']) == 300
+
+        place_order(users['bob'], 'binary', 'Rain?', 'sell', 40, 2)
+
+        assert reserved(users['alice']) == 300
+        assert reserved(users['bob']) == 80
+        assert reconcile_reserved() == []
+
+    def test_binary_order_beyond_balance_is_rejected(self, app, users):
+        """An order whose stake can't be covered is not placed at all."""
+        with pytest.raises(InsufficientBalanceError):
+            place_order(users['alice'], 'binary', 'Rain?', 'buy', 50, 21)
+
+        assert db.session.query(Order).count() == 0
+        assert reserved(users['alice']) == 0
+
+    def test_cancel_releases_stake(self, app, users):
+        """Cancelling a binary order gives back its remaining stake."""
+        order = place_order(users['alice'], 'binary', 'Rain?', 'buy', 60, 5)['order']
+        place_order(users['bob'], 'binary', 'Rain?', 'sell', 60, 2)
+
+        cancelled = cancel_order(order['id'])
+
+        assert cancelled['status'] == 'cancelled'
+        assert cancelled['remaining'] == 3
+        assert reserved(users['alice']) == 120
+        assert cancel_order(order['id']) is None
+        assert get_order_book('binary', 'Rain?')['bids'] == []
+        assert reconcile_reserved() == []
+
+    def test_settling_filled_trade_releases_stakes(self, app, users):
+        """Trades from fills settle like any other."""
+        place_order(users['alice'], 'binary', 'Rain?', 'buy', 60, 5)
+        fill, = place_order(users['bob'], 'binary', 'Rain?', 'sell', 60, 5)['fills']
+
+        settle_binary_trade(fill['trade_id'], outcome=True)
+
+        assert reserved(users['alice']) == reserved(users['bob']) == 0
+
+    def test_self_trade_cancels_resting_order(self, app, users):
+        """Crossing your own order cancels it and releases its stake."""
+        own = place_order(users['alice'], 'binary', 'Rain?', 'sell', 50, 2)['order']
+
+        result = place_order(users['alice'], 'binary', 'Rain?', 'buy', 55, 2)
+
+        assert result['fills'] == []
+        assert db.session.get(Order, own['id']).status == 'cancelled'
+        assert reconcile_reserved() == []
+
+    def test_batch_is_all_or_nothing(self, app, users):
+        """One bad order in a batch places none of them."""
+        with pytest.raises(OrderError, match='order 1'):
+            place_orders([
+                {'user_id': users['alice'], 'type': 'underlying', 'market': 'AAPL',
+                 'side': 'buy', 'price': 100.0, 'quantity': 1},
+                {'user_id': users['bob'], 'type': 'underlying', 'market': 'AAPL',
+                 'side': 'hold', 'price': 100.0, 'quantity': 1},
+            ])
+        with pytest.raises(OrderError, match='unknown users'):
+            place_orders([
+                {'user_id': users['alice'], 'type': 'underlying', 'market': 'AAPL',
+                 'side': 'buy', 'price': 100.0, 'quantity': 1},
+                {'user_id': 999, 'type': 'underlying', 'market': 'AAPL',
+                 'side': 'sell', 'price': 100.0, 'quantity': 1},
+            ])
+
+        assert db.session.query(Order).count() == 0
+        assert get_order_book('underlying', 'AAPL')['bids'] == []
+
+    def test_failed_fill_leaves_book_consistent(self, app, users):
+        """A rolled-back placement doesn't leave fills in the memory book."""
+        place_order(users['alice'], 'binary', 'Rain?', 'buy', 60, 5)
+        # Bob's balance drops behind the engine's back
+        db.session.execute(text("UPDATE user SET balance = 10 WHERE id = :id"),
+                           {'id': users['bob']})
+        db.session.commit()
+
+        with pytest.raises(InsufficientBalanceError):
+            place_order(users['bob'], 'binary', 'Rain?', 'sell', 60, 5)
+
+        assert get_order_book('binary', 'Rain?')['bids'] == [
+            {'price': 60, 'quantity': 5, 'orders': 1}]
+
+    @pytest.mark.parametrize('order, message', [
+        ({'user_id': 'x'}, 'user_id'),
+        ({'type': 'stock'}, 'type'),
+        ({'market': ''}, 'market'),
+        ({'side': 'long'}, 'side'),
+        ({'price': 0}, 'price'),
+        ({'quantity': -1}, 'quantity'),
+        ({'type': 'binary', 'price': 100}, 'binary price'),
+        ({'type': 'binary', 'price': 50, 'quantity': 1.5}, 'binary quantity'),
+    ])
+    def test_invalid_orders(self, app, users, order, message):
+        """Malformed orders are rejected before touching the book."""
+        spec = {'user_id': users['alice'], 'type': 'underlying', 'market': 'AAPL',
+                'side': 'buy', 'price': 10.0, 'quantity': 1, **order}
+        with pytest.raises(OrderError, match=message):
+            place_orders([spec])
+
+
+class TestRebuild:
+    """Tests for rebuilding the books from the order table."""
+
+    def test_new_process_rebuilds_book(self, app, users, make_app):
+        """A fresh engine (e.g. after a restart) sees the resting orders."""
+        place_order(users['alice'], 'underlying', 'AAPL', 'sell', 101.0, 1)
+        place_order(users['carol'], 'underlying', 'AAPL', 'sell', 100.0, 1)
+        place_order(users['carol'], 'underlying', 'AAPL', 'buy', 90.0, 1)
+
+        restarted = make_app()
+        with restarted.app_context():
+            book = get_order_book('underlying', 'AAPL')
+            assert [level['price'] for level in book['asks']] == [100.0, 101.0]
+            result = place_order(users['bob'], 'underlying', 'AAPL', 'buy', 101.0, 2)
+
+        assert [fill['price'] for fill in result['fills']] == [100.0, 101.0]
+
+    def test_orders_from_another_worker(self, app, users, make_app):
+        """Orders placed by another process are matched against here."""
+        other = make_app()
+        get_order_book('underlying', 'AAPL')  # load this engine's books first
+        with other.app_context():
+            place_order(users['alice'], 'underlying', 'AAPL', 'sell', 100.0, 1)
+
+        result = place_order(users['bob'], 'underlying', 'AAPL', 'buy', 100.0, 1)
+
+        assert len(result['fills']) == 1
+        with other.app_context():
+            assert get_order_book('underlying', 'AAPL')['asks'] == []
+
+
+class TestOrderRoutes:
+    """Tests for the order endpoints."""
+
+    def test_place_and_cancel(self, client, users):
+        """POST /orders places an order, DELETE cancels it."""
+        response = client.post('/orders', json={
+            'user_id': users['alice'], 'type': 'underlying', 'market': 'AAPL',
+            'side': 'sell', 'price': 100.0, 'quantity': 2,
+        })
+        assert response.status_code == 201
+        order_id = response.get_json()['order']['id']
+
+        book = client.get('/orders/book?type=underlying&market=AAPL').get_json()
+        assert book['asks'] == [{'price': 100.0, 'quantity': 2.0, 'orders': 1}]
+
+        assert client.delete(f"/orders/{order_id}").get_json()['status'] == 'cancelled'
+        assert client.delete(f"/orders/{order_id}").status_code == 404
+
+    def test_fill_shows_up_in_trades(self, client, users):
+        """Fills are ordinary trades."""
+        for user_id, side in ((users['alice'], 'buy'), (users['bob'], 'sell')):
+            client.post('/orders', json={
+                'user_id': user_id, 'type': 'binary', 'market': 'Rain?',
+                'side': side, 'price': 30, 'quantity': 1,
+            })
+
+        trades = client.get('/trades').get_json()
+        assert [(t['type'], t['stake_a'], t['stake_b']) for t in trades] == [('binary', 30, 70)]
+
+    def test_list_body_places_a_batch(self, client, users):
+        """A list of orders is placed in one request, in list order."""
+        response = client.post('/orders', json=[
+            {'user_id': users['alice'], 'type': 'underlying', 'market': 'AAPL',
+             'side': 'sell', 'price': 100.0, 'quantity': 2},
+            {'user_id': users['bob'], 'type': 'underlying', 'market': 'AAPL',
+             'side': 'buy', 'price': 101.0, 'quantity': 1},
+        ])
+
+        assert response.status_code == 201
+        results = response.get_json()
+        assert [r['order']['status'] for r in results] == ['open', 'filled']
+        assert [f['order_id'] for f in results[1]['fills']] == [results[0]['order']['id']]
+
+    def test_bad_batches(self, client, users, monkeypatch):
+        """A batch must be non-empty and small enough, and fails as a whole."""
+        order = {'user_id': users['alice'], 'type': 'underlying', 'market': 'AAPL',
+                 'side': 'sell', 'price': 100.0, 'quantity': 2}
+        monkeypatch.setattr('app.routes.MAX_BATCH_ORDERS', 2)
+
+        assert client.post('/orders', json=[]).status_code == 400
+        assert client.post('/orders', json=[order] * 3).status_code == 400
+
+        response = client.post('/orders', json=[order, {'type': 'binary'}])
+        assert response.status_code == 400
+        assert response.get_json()['error'].startswith('order 1:')
+        assert client.get('/orders/book?type=underlying&market=AAPL').get_json()['asks'] == []
+
+    def test_bad_requests(self, client, users):
+        """Malformed or uncovered orders are 400s."""
+        assert client.post('/orders', data='nope').status_code == 400
+        assert client.post('/orders', json={'type': 'binary'}).status_code == 400
+        response = client.post('/orders', json={
+            'user_id': users['alice'], 'type': 'binary', 'market': 'Rain?',
+            'side': 'buy', 'price': 99, 'quantity': 11,
+        })
+        assert response.status_code == 400
+        assert client.get('/orders/book?type=binary').status_code == 400
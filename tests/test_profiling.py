@@ -0,0 +1,160 @@
+"""Tests for on-demand request profiling and /debug/profiles."""
+
+import json
+import os
+import pstats
+
+import pytest
+from app import create_app, db
+from app.operations import create_user
+
+TOKEN = 'let-me-profile'
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Create a test app that profiles requests carrying TOKEN."""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'TESTING': True,
+        'PROFILE_TOKEN': TOKEN,
+        'PROFILE_DIR': str(tmp_path / 'profiles'),
+        'PROFILE_MAX_ENTRIES': 3,
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client for making HTTP requests."""
+    return app.test_client()
+
+
+def profiled(client, path='/users'):
+    return client.get(path, headers={'X-Profile': TOKEN})
+
+
+class TestProfiling:
+    """Tests for which requests get profiled and what is stored."""
+
+    def test_unprofiled_request_writes_nothing(self, app, client):
+        """Requests without the header are not profiled."""
+        response = client.get('/users')
+
+        assert 'X-Profile-Id' not in response.headers
+        assert not os.path.exists(app.config['PROFILE_DIR'])
+
+    def test_wrong_token_is_ignored(self, client):
+        """A bad token is treated like no header at all."""
+        response = client.get('/users', headers={'X-Profile': 'nope'})
+
+        assert 'X-Profile-Id' not in response.headers
+
+    def test_profiled_request_stores_stats_and_sql(self, app, client):
+        """The handler's cProfile stats and SQL trace are written to disk."""
+        create_user('Alice')
+
+        response = profiled(client)
+
+        profile_id = response.headers['X-Profile-Id']
+        directory = app.config['PROFILE_DIR']
+        stats = pstats.Stats(os.path.join(directory, f"{profile_id}.prof"))
+        assert stats.total_calls > 0
+
+        with open(os.path.join(directory, f"{profile_id}.json")) as f:
+            info = json.load(f)
+        assert info['path'] == '/users'
+        assert info['status'] == 200
+        assert any('FROM user' in s['statement'] for s in info['sql'])
+        assert all(s['seconds'] >= 0 for s in info['sql'])
+
+    def test_streamed_response_is_profiled_until_closed(self, app, client):
+        """An export's profile covers its body and is saved when it closes."""
+        create_user('Alice')
+
+        response = profiled(client, '/users/export')
+        profile_id = response.headers['X-Profile-Id']
+        json_path = os.path.join(app.config['PROFILE_DIR'], f"{profile_id}.json")
+        assert not os.path.exists(json_path)
+
+        assert b'Alice' in response.get_data()
+        response.close()
+
+        with open(json_path) as f:
+            info = json.load(f)
+        assert info['path'] == '/users/export'
+        assert any('FROM user' in s['statement'] for s in info['sql'])
+        stats = pstats.Stats(os.path.join(app.config['PROFILE_DIR'], f"{profile_id}.prof"))
+        assert any(name == 'iter_users' for _, _, name in stats.stats)
+
+    def test_ring_buffer_keeps_newest(self, app, client):
+        """Only PROFILE_MAX_ENTRIES profiles are kept, oldest dropped first."""
+        ids = [profiled(client).headers['X-Profile-Id'] for _ in range(5)]
+
+        stored = sorted(os.listdir(app.config['PROFILE_DIR']))
+        expected = sorted(f"{i}{ext}" for i in ids[-3:] for ext in ('.json', '.prof'))
+        assert stored == expected
+
+    def test_sampling_profiles_without_header(self, app, client):
+        """PROFILE_SAMPLE_RATE=1 profiles every request."""
+        app.config['PROFILE_SAMPLE_RATE'] = 1.0
+
+        response = client.get('/users')
+
+        assert 'X-Profile-Id' in response.headers
+
+    def test_disabled_by_default(self, tmp_path):
+        """Without a token or sample rate nothing is installed."""
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'TESTING': True,
+                          'PROFILE_DIR': str(tmp_path / 'p')})
+        with app.app_context():
+            db.create_all()
+
+        client = app.test_client()
+        assert client.get('/debug/profiles').status_code == 404
+        assert 'X-Profile-Id' not in client.get('/users').headers
+
+
+class TestProfileListing:
+    """Tests for GET /debug/profiles and downloads."""
+
+    def test_listing_requires_token(self, client):
+        """The debug routes hide behind the same token."""
+        assert client.get('/debug/profiles').status_code == 404
+
+    def test_listing_is_newest_first(self, client):
+        """Profiles are listed newest first with their downloadable files."""
+        first = profiled(client).headers['X-Profile-Id']
+        second = profiled(client, '/trades').headers['X-Profile-Id']
+
+        listing = profiled(client, '/debug/profiles').get_json()
+
+        assert [p['id'] for p in listing] == [second, first]
+        assert listing[0]['path'] == '/trades'
+        assert listing[0]['files'] == [f"{second}.prof", f"{second}.json"]
+        assert 'sql' not in listing[0]
+
+    def test_listing_is_not_itself_profiled(self, client):
+        """Browsing profiles does not add new ones."""
+        profiled(client, '/debug/profiles')
+
+        assert profiled(client, '/debug/profiles').get_json() == []
+
+    def test_download_profile(self, client):
+        """A stored .prof file can be downloaded as an attachment."""
+        profile_id = profiled(client).headers['X-Profile-Id']
+
+        response = profiled(client, f'/debug/profiles/{profile_id}.prof')
+
+        assert response.status_code == 200
+        assert 'attachment' in response.headers['Content-Disposition']
+        assert response.data
+
+    def test_download_rejects_other_files(self, client):
+        """Only profile files are served, and paths cannot escape the directory."""
+        assert profiled(client, '/debug/profiles/../secret.prof').status_code == 404
+        assert profiled(client, '/debug/profiles/x.txt').status_code == 404
@@ -0,0 +1,221 @@
+"""Tests for reserving stakes at trade entry and reconciling them."""
+
+import pytest
+from sqlalchemy import event, text
+
+from app import create_app, db
+from app.ledger import verify_ledger
+from app.models import User
+from app.operations import (
+    create_user,
+    create_binary_trade,
+    create_underlying_trade,
+    settle_binary_trade,
+    settle_trades_bulk,
+    list_all_trades,
+    InsufficientBalanceError,
+)
+from app.reconcile import reconcile_reserved
+
+
+@pytest.fixture
+def app():
+    """Create a test Flask application with an in-memory database."""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'TESTING': True,
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def users(app):
+    """Two users with the default balance of 1000."""
+    return create_user("Alice").id, create_user("Bob").id
+
+
+def reserved(user_id):
+    """Read a user's reserved amount straight from the database."""
+    return db.session.execute(
+        text("SELECT reserved FROM user WHERE id = :id"), {'id': user_id}
+    ).scalar()
+
+
+class TestReserveAtEntry:
+    """Tests for the balance check made when a binary trade is entered."""
+
+    def test_new_user_has_nothing_reserved(self, app, users):
+        """A user starts with nothing reserved."""
+        assert reserved(users[0]) == 0
+
+    def test_entry_reserves_both_stakes(self, app, users):
+        """Each party's stake is held back until settlement."""
+        alice, bob = users
+        create_binary_trade(alice, bob, 300, 100, "Rain?")
+        create_binary_trade(alice, bob, 200, 50, "Snow?")
+
+        assert reserved(alice) == 500
+        assert reserved(bob) == 150
+
+    def test_stake_up_to_the_unreserved_balance_is_allowed(self, app, users):
+        """A user can put their whole balance at risk, but no more."""
+        alice, bob = users
+        create_binary_trade(alice, bob, 600, 10, "First")
+        create_binary_trade(alice, bob, 400, 10, "Second")
+
+        with pytest.raises(InsufficientBalanceError) as excinfo:
+            create_binary_trade(alice, bob, 1, 10, "Third")
+        assert excinfo.value.user_id == alice
+        assert excinfo.value.stake == 1
+
+    def test_rejected_trade_leaves_nothing_behind(self, app, users):
+        """If the second party is short, the first party's reservation is undone too."""
+        alice, bob = users
+        with pytest.raises(InsufficientBalanceError) as excinfo:
+            create_binary_trade(alice, bob, 100, 1001, "Too rich for Bob")
+
+        assert excinfo.value.user_id == bob
+        assert reserved(alice) == 0
+        assert reserved(bob) == 0
+        assert list_all_trades() == []
+
+    @pytest.mark.parametrize('stakes', [(-5000, 10), (10, -1), (0, 10)])
+    def test_stakes_must_be_positive(self, app, users, stakes):
+        """A negative stake can't shrink a reservation to make room for more."""
+        alice, bob = users
+        with pytest.raises(ValueError, match="positive"):
+            create_binary_trade(alice, bob, *stakes, "Backwards")
+
+        assert reserved(alice) == reserved(bob) == 0
+        assert list_all_trades() == []
+        with pytest.raises(InsufficientBalanceError):
+            create_binary_trade(alice, bob, 5900, 10, "More than Alice has")
+
+    def test_unknown_user_is_rejected(self, app, users):
+        """A stake from a user who doesn't exist can't be covered."""
+        with pytest.raises(InsufficientBalanceError):
+            create_binary_trade(users[0], 999, 10, 10, "Ghost")
+
+    def test_underlying_trades_reserve_nothing(self, app, users):
+        """Underlying trades have no fixed stake to reserve."""
+        alice, bob = users
+        create_underlying_trade(alice, bob, 1000.0, 100.0, "AAPL")
+
+        assert reserved(alice) == 0
+        assert reserved(bob) == 0
+
+    def test_check_is_one_statement_per_party(self, app, users):
+        """Admission doesn't read the open trades, however many there are."""
+        alice, bob = users
+        for i in range(20):
+            create_binary_trade(alice, bob, 1, 1, f"Trade {i}")
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            create_binary_trade(alice, bob, 1, 1, "One more")
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert not any('FROM trade' in statement for statement in statements)
+
+
+class TestReleaseOnSettle:
+    """Tests for giving reservations back when trades settle."""
+
+    def test_single_settle_releases_stakes(self, app, users):
+        """Settling a trade releases both stakes and pays out the P&L."""
+        alice, bob = users
+        trade = create_binary_trade(alice, bob, 300, 100, "Rain?")
+        settle_binary_trade(trade.id, outcome=True)
+
+        assert reserved(alice) == 0
+        assert reserved(bob) == 0
+        assert db.session.get(User, alice).balance == 1100
+
+    def test_bulk_settle_releases_stakes(self, app, users):
+        """Bulk settlement releases each user's stakes across the batch."""
+        alice, bob = users
+        first = create_binary_trade(alice, bob, 300, 100, "Rain?")
+        second = create_binary_trade(bob, alice, 50, 200, "Snow?")
+        third = create_binary_trade(alice, bob, 10, 10, "Hail?")
+        underlying = create_underlying_trade(alice, bob, 1.0, 100.0, "AAPL")
+
+        settle_trades_bulk([(first.id, False), (second.id, True), (underlying.id, 90.0)])
+
+        assert reserved(alice) == 10
+        assert reserved(bob) == 10
+        assert reconcile_reserved() == []
+        assert verify_ledger() == []
+        settle_trades_bulk([(third.id, True)])
+        assert reserved(alice) == reserved(bob) == 0
+
+    def test_loss_shrinks_what_can_be_staked(self, app, users):
+        """Stakes are checked against the balance left after settlement."""
+        alice, bob = users
+        trade = create_binary_trade(alice, bob, 600, 100, "Rain?")
+        settle_binary_trade(trade.id, outcome=False)
+
+        with pytest.raises(InsufficientBalanceError):
+            create_binary_trade(alice, bob, 401, 1, "Again")
+        create_binary_trade(alice, bob, 400, 1, "Again")
+
+
+class TestReconcileReserved:
+    """Tests for recomputing reserved amounts from open trades."""
+
+    def test_no_drift_after_normal_use(self, app, users):
+        """Entry and settlement keep reserved exactly in step."""
+        alice, bob = users
+        trade = create_binary_trade(alice, bob, 300, 100, "Rain?")
+        create_binary_trade(bob, alice, 20, 40, "Snow?")
+        settle_binary_trade(trade.id, outcome=True)
+
+        assert reconcile_reserved() == []
+
+    def test_reports_drift(self, app, users):
+        """A reserved amount edited behind the app's back is reported."""
+        alice, bob = users
+        create_binary_trade(alice, bob, 300, 100, "Rain?")
+        db.session.execute(text("UPDATE user SET reserved = 7 WHERE id = :id"), {'id': bob})
+        db.session.commit()
+
+        assert reconcile_reserved() == [{'user_id': bob, 'reserved': 7, 'expected': 100}]
+        assert reserved(bob) == 7
+
+    def test_fix_repairs_drift(self, app, users):
+        """With fix, drifted users are set back to their open stakes."""
+        alice, bob = users
+        create_binary_trade(alice, bob, 300, 100, "Rain?")
+        db.session.execute(text("UPDATE user SET reserved = 0"))
+        db.session.commit()
+
+        drift = reconcile_reserved(fix=True)
+
+        assert {row['user_id'] for row in drift} == {alice, bob}
+        assert reserved(alice) == 300
+        assert reserved(bob) == 100
+        assert reconcile_reserved() == []
+
+    def test_command(self, app, users):
+        """flask reconcile-reserved reports drift and --fix repairs it."""
+        alice, _ = users
+        db.session.execute(text("UPDATE user SET reserved = 5 WHERE id = :id"), {'id': alice})
+        db.session.commit()
+        runner = app.test_cli_runner()
+
+        result = runner.invoke(args=['reconcile-reserved'])
+        assert f"user {alice}: reserved 5, expected 0" in result.output
+        assert "Found drift for 1 user(s)." in result.output
+
+        result = runner.invoke(args=['reconcile-reserved', '--fix'])
+        assert "Fixed drift for 1 user(s)." in result.output
+        assert reserved(alice) == 0
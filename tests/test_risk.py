@@ -0,0 +1,172 @@
+"""Tests for price-shock scenario grids."""
+
+import random
+
+import numpy as np
+import pytest
+
+from app import create_app, db
+from app.logic import calculate_underlying_payout
+from app.marks import record_marks
+from app.operations import create_user, create_underlying_trade
+from app.risk import ScenarioError, scenario_grid, shock_matrix
+
+SHOCKS = [-0.5, -0.1, 0.0, 0.25, 0.5]
+MARKS = {'AAPL': 100.0, 'MSFT': 400.0, 'GOOG': 150.0}
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Create a test Flask application on a fresh database file."""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'risk.db'}",
+        'TESTING': True,
+    })
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client for making HTTP requests."""
+    return app.test_client()
+
+
+@pytest.fixture
+def book(app):
+    """Random underlying trades between five users on three marked symbols."""
+    rng = random.Random(7)
+    users = [create_user(f"User {i}").id for i in range(5)]
+    trades = []
+    for _ in range(40):
+        long_id, short_id = rng.sample(users, 2)
+        symbol = rng.choice(list(MARKS))
+        lot_size = rng.choice([0.5, 1.0, 2.5, 4.0])
+        trade_price = MARKS[symbol] * rng.uniform(0.8, 1.2)
+        create_underlying_trade(long_id, short_id, lot_size, trade_price, symbol)
+        trades.append((long_id, short_id, symbol, lot_size, trade_price))
+    record_marks(MARKS)
+    return trades
+
+
+def expected_grid(trades, shocks_for):
+    """Brute force: settle every trade at every shocked price and add up."""
+    totals = {}
+    for long_id, short_id, symbol, lot_size, trade_price in trades:
+        for j, shock in enumerate(shocks_for(symbol)):
+            long_pnl, short_pnl = calculate_underlying_payout(
+                lot_size, trade_price, MARKS[symbol] * (1 + shock))
+            totals.setdefault(long_id, np.zeros(len(SHOCKS)))[j] += long_pnl
+            totals.setdefault(short_id, np.zeros(len(SHOCKS)))[j] += short_pnl
+    return totals
+
+
+class TestScenarioGrid:
+    """Tests for scenario_grid."""
+
+    def test_matches_per_trade_payouts(self, app, book):
+        """Netting positions first gives the same P&L as settling every trade."""
+        grid = scenario_grid(SHOCKS)
+
+        expected = expected_grid(book, lambda symbol: SHOCKS)
+        assert grid['pnl'].shape == (5, len(SHOCKS))
+        for user_id, row in zip(grid['user_ids'], grid['pnl']):
+            np.testing.assert_allclose(row, expected[user_id], atol=1e-9)
+        # Every trade is zero-sum, so each scenario is too
+        np.testing.assert_allclose(grid['pnl'].sum(axis=0), 0, atol=1e-9)
+
+    def test_per_underlying_shocks(self, app, book):
+        """Underlyings left out of a per-underlying grid stay at their mark."""
+        aapl = [-0.2, -0.1, 0.0, 0.1, 0.2]
+        grid = scenario_grid({'AAPL': aapl, 'MSFT': SHOCKS})
+
+        expected = expected_grid(book, lambda symbol: {
+            'AAPL': aapl, 'MSFT': SHOCKS}.get(symbol, [0.0] * len(SHOCKS)))
+        for user_id, row in zip(grid['user_ids'], grid['pnl']):
+            np.testing.assert_allclose(row, expected[user_id], atol=1e-9)
+
+    def test_offsetting_trades_keep_locked_in_pnl(self, app):
+        """Bought at 90 and sold at 110: +20 in every scenario."""
+        alice = create_user("Alice").id
+        bob = create_user("Bob").id
+        create_underlying_trade(alice, bob, 1, 90.0, "AAPL")
+        create_underlying_trade(bob, alice, 1, 110.0, "AAPL")
+        record_marks({'AAPL': 100.0})
+
+        grid = scenario_grid([-0.5, 0.5])
+
+        np.testing.assert_allclose(grid['pnl'], [[20.0, 20.0], [-20.0, -20.0]])
+
+    def test_unmarked_underlyings_are_left_out(self, app):
+        """Trades without a mark have no base price to shock."""
+        alice = create_user("Alice").id
+        bob = create_user("Bob").id
+        create_underlying_trade(alice, bob, 1, 100.0, "AAPL")
+        create_underlying_trade(alice, bob, 1, 100.0, "TSLA")
+        record_marks({'AAPL': 100.0})
+
+        grid = scenario_grid([0.1])
+
+        assert grid['unmarked'] == ['TSLA']
+        assert grid['marks'] == {'AAPL': 100.0}
+        np.testing.assert_allclose(grid['pnl'], [[10.0], [-10.0]])
+
+    def test_chunked_and_pooled_grids_agree(self, app, book):
+        """Splitting a grid across chunks and processes changes nothing."""
+        whole = scenario_grid(SHOCKS)['pnl']
+
+        app.config.update(RISK_CHUNK_CELLS=20, RISK_WORKERS=2, RISK_POOL_MIN_CELLS=0)
+        pooled = scenario_grid(SHOCKS)['pnl']
+
+        np.testing.assert_allclose(pooled, whole, atol=1e-9)
+
+    def test_empty_book(self, app):
+        """With no open trades the grid is empty."""
+        grid = scenario_grid(SHOCKS)
+
+        assert grid['user_ids'] == []
+        assert grid['pnl'].shape == (0, len(SHOCKS))
+
+
+class TestShockMatrix:
+    """Tests for validating shock specifications."""
+
+    @pytest.mark.parametrize('shocks', [
+        'big',
+        [],
+        [0.1] * 11,
+        [-1.5],
+        [True],
+        {'AAPL': [0.1], 'MSFT': [0.1, 0.2]},
+        {'AAPL': 0.1},
+    ])
+    def test_rejects_malformed_grids(self, shocks):
+        """Bad shapes, values and counts raise ScenarioError."""
+        with pytest.raises(ScenarioError):
+            shock_matrix(shocks, ['AAPL', 'MSFT'], max_scenarios=10)
+
+    def test_uniform_shocks_apply_to_every_underlying(self):
+        """A plain list becomes one identical row per underlying."""
+        matrix = shock_matrix([-0.1, 0.1], ['AAPL', 'MSFT'], max_scenarios=10)
+
+        assert matrix.tolist() == [[-0.1, 0.1], [-0.1, 0.1]]
+
+
+class TestRiskRoute:
+    """Tests for POST /risk/scenarios."""
+
+    def test_returns_matrix(self, client, book):
+        """The response carries one P&L row per user."""
+        response = client.post('/risk/scenarios', json={'shocks': SHOCKS})
+
+        data = response.get_json()
+        assert response.status_code == 200
+        assert len(data['pnl']) == len(data['user_ids']) == 5
+        assert all(len(row) == len(SHOCKS) for row in data['pnl'])
+
+    def test_invalid_grid_returns_400(self, client, book):
+        """Malformed shocks are rejected."""
+        assert client.post('/risk/scenarios', json={}).status_code == 400
+        assert client.post('/risk/scenarios', json={'shocks': [-2]}).status_code == 400
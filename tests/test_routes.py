@@ -1,8 +1,19 @@
 """Tests for Flask API routes."""
 
+import csv
+import io
+import json
+
 import pytest
+from sqlalchemy import event
+
 from app import create_app, db
-from app.operations import create_user, create_binary_trade, create_underlying_trade
+from app.operations import (
+    create_user,
+    create_binary_trade,
+    create_underlying_trade,
+    get_user_balance,
+)
 
 
 @pytest.fixture
@@ -174,3 +185,312 @@ class TestGetTrades:
         types = [t['type'] for t in data]
         assert 'binary' in types
         assert 'underlying' in types
+
+
+class TestGetTradesPagination:
+    """Tests for paging and filtering GET /trades."""
+
+    @pytest.fixture
+    def book(self, app):
+        """Two users with six binary trades."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            for i in range(6):
+                create_binary_trade(alice.id, bob.id, 10, 5, f"bet {i}")
+            create_underlying_trade(alice.id, bob.id, 1.0, 100.0, "AAPL")
+
+    def test_limit_sets_next_cursor_header(self, client, book):
+        """A partial page should advertise the cursor for the next one."""
+        response = client.get('/trades?limit=3')
+
+        assert len(response.get_json()) == 3
+        assert response.headers['X-Next-Cursor'] == '3'
+
+    def test_following_cursor_returns_next_page(self, client, book):
+        """Passing the cursor as 'after' should continue from there."""
+        response = client.get('/trades?limit=2&after=2')
+
+        assert [t['id'] for t in response.get_json()] == [3, 4]
+
+    def test_last_page_has_no_cursor_header(self, client, book):
+        """The final page should not set X-Next-Cursor."""
+        response = client.get('/trades?limit=50')
+
+        assert len(response.get_json()) == 7
+        assert 'X-Next-Cursor' not in response.headers
+
+    def test_filters(self, client, book):
+        """type and status filters should be applied server-side."""
+        response = client.get('/trades?type=underlying&status=open')
+
+        data = response.get_json()
+        assert len(data) == 1
+        assert data[0]['type'] == 'underlying'
+
+    def test_invalid_limit_returns_400(self, client, book):
+        """limit must be a positive integer within the page size cap."""
+        assert client.get('/trades?limit=abc').status_code == 400
+        assert client.get('/trades?limit=0').status_code == 400
+        assert client.get('/trades?limit=100000').status_code == 400
+
+    def test_invalid_cursor_returns_400(self, client, book):
+        """A malformed cursor should be rejected."""
+        assert client.get('/trades?after=garbage').status_code == 400
+
+
+class TestGetRecentTrades:
+    """Tests for GET /trades/recent."""
+
+    def test_newest_first_across_types(self, client, app):
+        """The latest trades of both types come back newest first."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            for i in range(3):
+                create_binary_trade(alice.id, bob.id, 10, 5, f"bet {i}")
+                create_underlying_trade(alice.id, bob.id, 1.0, 100.0, f"price {i}")
+
+        data = client.get('/trades/recent?limit=4').get_json()
+
+        assert [t['id'] for t in data] == [6, 5, 4, 3]
+        assert [t['type'] for t in data] == ['underlying', 'binary', 'underlying', 'binary']
+
+    def test_invalid_limit_returns_400(self, client):
+        """limit is validated like GET /trades."""
+        assert client.get('/trades/recent?limit=0').status_code == 400
+        assert client.get('/trades/recent?limit=x').status_code == 400
+
+
+class TestExports:
+    """Tests for the streaming /users/export and /trades/export endpoints."""
+
+    @pytest.fixture
+    def book(self, app):
+        """Two users with one trade of each type."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?")
+            create_underlying_trade(alice.id, bob.id, 5.0, 100.0, "AAPL, close")
+
+    def test_export_trades_ndjson(self, client, book):
+        """The default format should be one JSON object per line."""
+        response = client.get('/trades/export')
+
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == 'application/x-ndjson'
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert [r['type'] for r in rows] == ['binary', 'underlying']
+        assert rows[0]['party_a'] == 'Alice'
+        assert rows[1]['lot_size'] == 5.0
+
+    def test_export_trades_csv(self, client, book):
+        """CSV export should have a shared header for both trade types."""
+        response = client.get('/trades/export?format=csv')
+
+        assert response.mimetype == 'text/csv'
+        assert 'attachment' in response.headers['Content-Disposition']
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        assert len(rows) == 2
+        assert rows[0]['stake_a'] == '20'
+        assert rows[0]['lot_size'] == ''
+        assert rows[1]['description'] == 'AAPL, close'
+
+    def test_export_users(self, client, book):
+        """User export should stream id, name and balance."""
+        ndjson = client.get('/users/export').get_data(as_text=True).splitlines()
+        text = client.get('/users/export?format=csv').get_data(as_text=True)
+
+        assert json.loads(ndjson[0]) == {'id': 1, 'name': 'Alice', 'balance': 1000}
+        assert text.splitlines()[0] == 'id,name,balance'
+        assert len(text.splitlines()) == 3
+
+    def test_export_unknown_format_returns_400(self, client, book):
+        """Only ndjson and csv are supported."""
+        assert client.get('/trades/export?format=xml').status_code == 400
+
+
+class TestConditionalGet:
+    """Tests for ETag / If-None-Match on GET /users and GET /trades."""
+
+    @pytest.fixture
+    def book(self, app):
+        """Two users with one binary trade."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?")
+            return {'alice': alice.id, 'bob': bob.id}
+
+    @pytest.mark.parametrize('path', ['/users', '/trades', '/changes'])
+    def test_response_has_etag(self, client, book, path):
+        """Both list endpoints should send a strong ETag."""
+        response = client.get(path)
+
+        etag, weak = response.get_etag()
+        assert etag
+        assert not weak
+        assert response.headers['Cache-Control'] == 'no-cache'
+
+    @pytest.mark.parametrize('path', ['/users', '/trades', '/changes'])
+    def test_matching_etag_returns_304(self, client, book, path):
+        """An unchanged poll gets an empty 304."""
+        etag = client.get(path).headers['ETag']
+
+        response = client.get(path, headers={'If-None-Match': etag})
+
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag
+
+    @pytest.mark.parametrize('path', ['/users', '/trades', '/changes'])
+    def test_write_changes_etag(self, client, app, book, path):
+        """After a write, the old ETag no longer matches."""
+        etag = client.get(path).headers['ETag']
+        client.post('/trades/settle/batch', json={'settlements': [{'id': 1, 'outcome': True}]})
+
+        response = client.get(path, headers={'If-None-Match': etag})
+
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    def test_new_trade_changes_trades_etag(self, client, app, book):
+        """Creating a trade invalidates cached /trades pages."""
+        etag = client.get('/trades').headers['ETag']
+        with app.app_context():
+            create_binary_trade(book['alice'], book['bob'], 5, 5, "Another")
+
+        response = client.get('/trades', headers={'If-None-Match': etag})
+
+        assert response.status_code == 200
+        assert len(response.get_json()) == 2
+
+    def test_trades_etag_depends_on_query(self, client, book):
+        """Different pages or filters must not share an ETag."""
+        first = client.get('/trades').headers['ETag']
+        filtered = client.get('/trades?type=underlying').headers['ETag']
+
+        assert first != filtered
+        response = client.get('/trades?type=underlying', headers={'If-None-Match': first})
+        assert response.status_code == 200
+
+    def test_not_modified_trades_costs_one_query(self, client, app, book):
+        """A 304 on /trades only reads the version counter."""
+        etag = client.get('/trades').headers['ETag']
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.get('/trades', headers={'If-None-Match': etag})
+        finally:
+            with app.app_context():
+                event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert response.status_code == 304
+        assert len(statements) == 1
+
+
+class TestSettleBatch:
+    """Tests for POST /trades/settle/batch endpoint."""
+
+    def test_settle_batch_returns_settled_trades(self, client, app):
+        """A valid batch should settle every trade and return them."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            binary_id = create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?").id
+            underlying_id = create_underlying_trade(alice.id, bob.id, 5.0, 100.0, "AAPL").id
+            alice_id = alice.id
+
+        response = client.post('/trades/settle/batch', json={'settlements': [
+            {'id': binary_id, 'outcome': False},
+            {'id': underlying_id, 'settlement_price': 104},
+        ]})
+
+        assert response.status_code == 200
+        settled = response.get_json()['settled']
+        assert {'id': binary_id, 'type': 'binary'} in settled
+        assert {'id': underlying_id, 'type': 'underlying'} in settled
+
+        with app.app_context():
+            # Alice loses 20 on the binary, gains 5 × 4 on the underlying
+            assert get_user_balance(alice_id) == 1000
+
+        trades = client.get('/trades').get_json()
+        assert all(t['status'] == 'settled' for t in trades)
+
+    def test_settle_batch_missing_list_returns_400(self, client, app):
+        """A body without a settlements list should return 400."""
+        response = client.post('/trades/settle/batch', json={})
+        assert response.status_code == 400
+
+    def test_settle_batch_invalid_entry_returns_400(self, client, app):
+        """Entries need exactly one of outcome or settlement_price."""
+        response = client.post('/trades/settle/batch', json={'settlements': [
+            {'id': 1, 'outcome': True, 'settlement_price': 10},
+            {'id': 2},
+        ]})
+
+        assert response.status_code == 400
+        assert len(response.get_json()['errors']) == 2
+
+    def test_settle_batch_reports_per_trade_errors(self, client, app):
+        """If any trade fails, nothing settles and each error is reported."""
+        with app.app_context():
+            alice = create_user("Alice")
+            bob = create_user("Bob")
+            trade_id = create_binary_trade(alice.id, bob.id, 20, 10, "Will it rain?").id
+
+        response = client.post('/trades/settle/batch', json={'settlements': [
+            {'id': trade_id, 'outcome': True},
+            {'id': 999, 'outcome': True},
+        ]})
+
+        assert response.status_code == 400
+        assert response.get_json()['errors'] == [{'id': 999, 'error': 'trade not found'}]
+        trades = client.get('/trades').get_json()
+        assert trades[0]['status'] == 'open'
+
+
+class TestGetChanges:
+    """Tests for GET /changes."""
+
+    def test_since_returns_only_later_changes(self, client, app):
+        """A client passing back seq gets just the rows written since."""
+        alice = create_user("Alice").id
+        bob = create_user("Bob").id
+        create_binary_trade(alice, bob, 20, 10, "Will it rain?")
+        first = client.get('/changes').get_json()
+        assert [user['name'] for user in first['users']] == ['Alice', 'Bob']
+        assert len(first['trades']) == 1
+
+        client.post('/trades/settle/batch', json={'settlements': [{'id': 1, 'outcome': True}]})
+        response = client.get(f"/changes?since={first['seq']}")
+
+        changes = response.get_json()
+        assert changes['seq'] > first['seq']
+        assert [t['status'] for t in changes['trades']] == ['settled']
+        assert {user['name']: user['balance'] for user in changes['users']} == {
+            'Alice': 1010, 'Bob': 990}
+
+    def test_caught_up_client_gets_nothing(self, client, app):
+        """Asking with the latest seq returns empty lists."""
+        create_user("Alice")
+        seq = client.get('/changes').get_json()['seq']
+
+        assert client.get(f"/changes?since={seq}").get_json() == {
+            'seq': seq, 'users': [], 'trades': []}
+
+    @pytest.mark.parametrize('since', ['x', '-1'])
+    def test_invalid_since_returns_400(self, client, since):
+        """since must be a non-negative integer."""
+        response = client.get(f"/changes?since={since}")
+
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
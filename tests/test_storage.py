@@ -0,0 +1,73 @@
+"""Tests for SQLite storage profiles."""
+
+import pytest
+from sqlalchemy import text
+
+from app import create_app, db
+
+
+def pragma(name):
+    """Read a PRAGMA value from a pooled connection."""
+    return db.session.execute(text(f"PRAGMA {name}")).scalar()
+
+
+class TestProductionProfile:
+    """Tests for the default 'production' profile."""
+
+    def test_pragmas_applied_to_connections(self, make_app):
+        """Every connection should get WAL, busy timeout and friends."""
+        app = make_app()
+        with app.app_context():
+            assert pragma('journal_mode') == 'wal'
+            assert pragma('busy_timeout') == 5000
+            assert pragma('synchronous') == 1  # NORMAL
+            assert pragma('foreign_keys') == 1
+            assert pragma('cache_size') == -64 * 1024
+            assert pragma('mmap_size') == 256 * 1024 * 1024
+
+    def test_pool_settings_from_config(self, make_app):
+        """Pool settings should be taken from config for file databases."""
+        app = make_app(SQLITE_POOL_SIZE=3, SQLITE_POOL_TIMEOUT=7)
+        with app.app_context():
+            assert db.engine.pool.size() == 3
+            assert db.engine.pool.timeout() == 7
+
+    def test_foreign_keys_enforced(self, make_app):
+        """With foreign_keys=ON, trades must reference real users."""
+        from app.operations import create_binary_trade
+
+        app = make_app()
+        with app.app_context():
+            db.create_all()
+            with pytest.raises(Exception):
+                create_binary_trade(998, 999, 10, 5, "nobody")
+            db.session.rollback()
+            db.drop_all()
+
+
+class TestOtherProfiles:
+    """Tests for choosing and overriding profiles."""
+
+    def test_default_profile_leaves_sqlite_defaults(self, make_app):
+        """The 'default' profile should not change journaling."""
+        app = make_app(SQLITE_STORAGE_PROFILE='default')
+        with app.app_context():
+            assert pragma('journal_mode') == 'delete'
+            assert pragma('foreign_keys') == 0
+
+    def test_pragma_overrides(self, make_app):
+        """SQLITE_PRAGMAS should override individual profile settings."""
+        app = make_app(SQLITE_PRAGMAS={'busy_timeout': 250})
+        with app.app_context():
+            assert pragma('busy_timeout') == 250
+            assert pragma('journal_mode') == 'wal'
+
+    def test_unknown_profile_raises(self, make_app):
+        """A typo in the profile name should fail loudly at startup."""
+        with pytest.raises(ValueError):
+            make_app(SQLITE_STORAGE_PROFILE='fast')
+
+    def test_memory_database_has_no_pool_settings(self):
+        """In-memory databases keep Flask-SQLAlchemy's single shared connection."""
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+        assert 'pool_size' not in app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
@@ -0,0 +1,235 @@
+"""Tests for the Server-Sent Events feed behind GET /stream."""
+
+import json
+import threading
+import time
+
+import pytest
+
+from app import create_app, db
+from app.operations import (
+    create_user,
+    create_binary_trade,
+    create_underlying_trade,
+    settle_binary_trade,
+    settle_trades_bulk,
+)
+from app.orderbook import place_order
+from app.stream import CLOSED, HEARTBEAT, EventBroker, Subscription, stream_events
+
+
+@pytest.fixture
+def app():
+    """Create a test Flask application with an in-memory database."""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'TESTING': True,
+        'STREAM_HEARTBEAT': 0.05,
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def broker(app):
+    """The app's EventBroker."""
+    return app.extensions['stream']
+
+
+@pytest.fixture
+def subscription(broker):
+    """An open subscription, closed again after the test."""
+    subscription = broker.subscribe()
+    yield subscription
+    broker.unsubscribe(subscription)
+
+
+def next_event(subscription):
+    """Return the next event as (name, data), failing if none arrives."""
+    event = subscription.get(timeout=1)
+    assert event not in (None, CLOSED)
+    name, data = event.strip().split('\n')
+    return name.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+
+class TestEventBroker:
+    """Tests for the in-process publish/subscribe."""
+
+    def test_publish_reaches_every_subscriber(self):
+        """Each subscriber gets its own copy of every event."""
+        broker = EventBroker(max_pending=10)
+        first, second = broker.subscribe(), broker.subscribe()
+
+        broker.publish('ping', '{}')
+
+        assert first.get(0) == second.get(0) == 'event: ping\ndata: {}\n\n'
+        assert first.get(0) is None
+
+    def test_unsubscribe(self):
+        """A closed subscription gets nothing more."""
+        broker = EventBroker(max_pending=10)
+        subscription = broker.subscribe()
+        broker.unsubscribe(subscription)
+
+        broker.publish('ping', '{}')
+
+        assert len(broker) == 0
+        assert subscription.get(0) is None
+
+    def test_slow_subscriber_is_dropped(self):
+        """A subscriber that falls max_pending events behind is closed."""
+        broker = EventBroker(max_pending=2)
+        subscription = broker.subscribe()
+
+        for _ in range(3):
+            broker.publish('ping', '{}')
+
+        assert subscription.get(0) is CLOSED
+
+
+class TestEvents:
+    """Tests for events published by the write operations."""
+
+    def test_user_created(self, app, subscription):
+        """A new user is published with just that user's row."""
+        alice = create_user("Alice").id
+
+        assert next_event(subscription) == (
+            'user-created', {'users': [{'id': alice, 'name': 'Alice', 'balance': 1000}]})
+
+    def test_trades_created(self, app, subscription):
+        """New trades are published as they appear in GET /trades."""
+        alice = create_user("Alice").id
+        bob = create_user("Bob").id
+        next_event(subscription), next_event(subscription)
+
+        trade = create_binary_trade(alice, bob, 10, 5, "Rain?")
+        name, data = next_event(subscription)
+
+        assert name == 'trades-created'
+        assert [(t['id'], t['party_a'], t['stake_a']) for t in data['trades']] == [
+            (trade.id, 'Alice', 10)]
+
+    def test_trades_settled(self, app, subscription):
+        """A settlement carries the settled trades and only the users whose balance moved."""
+        alice = create_user("Alice").id
+        bob = create_user("Bob").id
+        create_user("Carol")
+        binary = create_binary_trade(alice, bob, 10, 5, "Rain?").id
+        underlying = create_underlying_trade(alice, bob, 1.0, 100.0, "AAPL").id
+        for _ in range(5):
+            next_event(subscription)
+
+        settle_binary_trade(binary, outcome=True)
+        name, data = next_event(subscription)
+        assert name == 'trades-settled'
+        assert [t['status'] for t in data['trades']] == ['settled']
+        assert {user['name']: user['balance'] for user in data['users']} == {
+            'Alice': 1005, 'Bob': 995}
+
+        settle_trades_bulk([(underlying, 90.0)])
+        name, data = next_event(subscription)
+        assert [t['settlement_price'] for t in data['trades']] == [90.0]
+
+    def test_order_fills(self, app, subscription):
+        """Trades from filled orders are published too."""
+        alice = create_user("Alice").id
+        bob = create_user("Bob").id
+        place_order(alice, 'underlying', 'AAPL', 'sell', 100.0, 1)
+        place_order(alice, 'underlying', 'AAPL', 'sell', 101.0, 1)
+        next_event(subscription), next_event(subscription)
+
+        place_order(bob, 'underlying', 'AAPL', 'buy', 101.0, 2)
+        name, data = next_event(subscription)
+
+        assert name == 'trades-created'
+        assert [t['trade_price'] for t in data['trades']] == [100.0, 101.0]
+
+    def test_nothing_is_built_without_subscribers(self, app, broker):
+        """With no stream open, writes don't query or serialize events."""
+        calls = []
+        broker.publish = lambda *args: calls.append(args)
+
+        create_user("Alice")
+
+        assert calls == []
+
+
+class TestStreamRoute:
+    """Tests for GET /stream."""
+
+    def test_events_and_heartbeat(self, app, broker):
+        """The stream starts at once, relays events and heartbeats when idle."""
+        response = app.test_client().get('/stream', buffered=False)
+        assert response.mimetype == 'text/event-stream'
+        assert response.headers['Cache-Control'] == 'no-cache'
+        chunks = iter(response.response)
+        assert next(chunks) == b': connected\n\n'
+
+        create_user("Alice")
+        assert next(chunks).startswith(b'event: user-created\n')
+        assert next(chunks) == HEARTBEAT.encode()
+
+        response.close()
+        assert len(broker) == 0
+
+    def test_dropped_subscriber_ends_stream(self, app, broker):
+        """A client that fell behind has its stream ended so it reconnects."""
+        subscription = broker.subscribe()
+        events = stream_events(broker, subscription, heartbeat=1)
+        next(events)
+        for _ in range(broker.max_pending + 1):
+            broker.publish('ping', '{}')
+
+        assert list(events) == []
+        assert len(broker) == 0
+
+
+class TestIdleSubscribers:
+    """Idle streams wait on a condition variable rather than polling."""
+
+    def test_thousand_idle_subscribers_do_not_wake(self, monkeypatch):
+        """1,000 streams blocked between heartbeats don't loop until an event."""
+        wakeups = []
+        get = Subscription.get
+
+        def counting_get(self, timeout):
+            wakeups.append(1)
+            return get(self, timeout)
+
+        monkeypatch.setattr(Subscription, 'get', counting_get)
+        broker = EventBroker(max_pending=10)
+        subscribers = 1000
+        started = threading.Barrier(subscribers + 1)
+        received = []
+
+        def listen():
+            events = stream_events(broker, broker.subscribe(), heartbeat=60)
+            next(events)
+            started.wait()
+            received.append(next(events))
+            events.close()
+
+        threads = [threading.Thread(target=listen, daemon=True) for _ in range(subscribers)]
+        for thread in threads:
+            thread.start()
+        started.wait()
+
+        # Each stream has asked for its first event and is waiting on it
+        deadline = time.monotonic() + 10
+        while len(wakeups) < subscribers and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.2)
+        idle_wakeups = len(wakeups)
+
+        broker.publish('ping', '{}')
+        for thread in threads:
+            thread.join(timeout=10)
+
+        assert idle_wakeups == subscribers
+        assert len(received) == subscribers
+        assert all(event.startswith('event: ping\n') for event in received)
+        assert len(broker) == 0